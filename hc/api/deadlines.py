@@ -0,0 +1,234 @@
+""" Deadline-driven wakeups for the sendalerts command.
+
+The Scheduler keeps a min-heap of upcoming Check.alert_after deadlines, and
+lets sendalerts sleep until the next check is due, instead of polling the
+database every two seconds.
+
+The heap is loaded from the database in a window of the WINDOW earliest
+deadlines. Pings usually only move deadlines later. When a heap entry comes
+due, the scheduler re-reads the current alert_after values of the due checks,
+and puts them back in the heap. Deadlines that move earlier, and new flips,
+are announced with notify(), or by Check.ping() directly:
+
+* on PostgreSQL, notify() sends a NOTIFY on the CHANNEL channel, and the
+  scheduler LISTENs on a dedicated database connection. It wakes up as soon
+  as a notification arrives, and reloads the heap every RESYNC_INTERVAL
+  seconds to pick up anything it has missed.
+* on other databases, notify() does nothing, and the scheduler sleeps at
+  most POLL_INTERVAL seconds at a time.
+
+"""
+
+import heapq
+import os
+import select
+import time
+
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from hc.api.models import Check
+from hc.api.shards import filter_shards, shard_of
+from statsd.defaults.env import statsd
+
+CHANNEL = "hc_deadlines"
+# The number of deadlines to load from the database at once
+WINDOW = 1000
+# The max time to sleep when listening for notifications, in seconds
+RESYNC_INTERVAL = 60
+# The max time to sleep when notifications are not available, in seconds
+POLL_INTERVAL = 2
+
+
+def payload(check):
+    """ Return the notification payload for the check. """
+
+    result = str(check.id)
+    if check.alert_after:
+        result += " " + check.alert_after.isoformat()
+
+    return result
+
+
+def notify(check):
+    """ Wake up sendalerts for a new flip or an earlier deadline.
+
+    Check.ping() does not call this, it sends the notification in the same
+    statement that saves the ping.
+
+    """
+
+    if connection.vendor != "postgresql":
+        return
+
+    with connection.cursor() as c:
+        c.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload(check)])
+
+
+def parse(payload):
+    """ Parse a notification payload, return a (timestamp, check_id) tuple.
+
+    Return None if the payload has no deadline.
+
+    """
+
+    check_id, _, deadline = payload.partition(" ")
+    if deadline:
+        return parse_datetime(deadline).timestamp(), int(check_id)
+
+
+class Listener(object):
+    """ Receives notifications on a dedicated PostgreSQL connection. """
+
+    def __init__(self):
+        self.conn = connection.get_new_connection(connection.get_connection_params())
+        self.conn.autocommit = True
+        with self.conn.cursor() as c:
+            c.execute("LISTEN " + CHANNEL)
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def receive(self):
+        """ Return the payloads of the received notifications. """
+
+        self.conn.poll()
+        payloads = [n.payload for n in self.conn.notifies]
+        self.conn.notifies.clear()
+        return payloads
+
+    def close(self):
+        self.conn.close()
+
+
+class Scheduler(object):
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self.heap = []
+        # The latest loaded deadline, or None if all deadlines are loaded
+        self.horizon = None
+        self.loaded = 0
+        self.listener = None
+        # If set, only track the checks in these shards, see hc.api.shards
+        self.shards = None
+        # interrupt() writes to this pipe to end the current wait() early
+        self.wakeup_r, self.wakeup_w = os.pipe()
+        os.set_blocking(self.wakeup_w, False)
+
+    def listen(self):
+        if connection.vendor != "postgresql":
+            return
+
+        try:
+            self.listener = Listener()
+        except connection.Database.Error:
+            self.listener = None
+
+    def reload(self, now):
+        if self.listener is None:
+            self.listen()
+
+        q = Check.objects.filter(alert_after__isnull=False).exclude(status="down")
+        if self.shards is not None:
+            q = filter_shards(q, "id", self.shards)
+        # Uses the api_check_aa_not_down index:
+        q = q.order_by("alert_after").values_list("alert_after", "id")
+        rows = list(q[: self.window])
+
+        # The rows are sorted, so they are already a valid heap
+        self.heap = [(dt.timestamp(), check_id) for dt, check_id in rows]
+        self.horizon = None
+        if len(rows) == self.window:
+            self.horizon = self.heap[-1][0]
+
+        self.loaded = now
+
+    def revalidate(self, now):
+        """ Replace the due heap entries with the checks' current deadlines. """
+
+        due = set()
+        while self.heap and self.heap[0][0] <= now:
+            due.add(heapq.heappop(self.heap)[1])
+
+        if not due:
+            return
+
+        q = Check.objects.filter(id__in=due, alert_after__isnull=False)
+        q = q.exclude(status="down").values_list("alert_after", "id")
+        for dt, check_id in q:
+            # If the check is still due, another sendalerts process
+            # may be handling it. Look at it again a bit later.
+            deadline = max(dt.timestamp(), now + POLL_INTERVAL)
+            heapq.heappush(self.heap, (deadline, check_id))
+
+    def add(self, payload):
+        entry = parse(payload)
+        if entry is None:
+            return
+
+        if self.shards is None or shard_of(entry[1]) in self.shards:
+            heapq.heappush(self.heap, entry)
+
+    def timeout(self, now):
+        """ Return the number of seconds to sleep. """
+
+        timeout = RESYNC_INTERVAL if self.listener else POLL_INTERVAL
+        if self.heap:
+            timeout = min(timeout, self.heap[0][0] - now)
+        if self.horizon is not None:
+            timeout = min(timeout, self.horizon - now)
+
+        return max(timeout, 0)
+
+    def wait(self, max_timeout=None):
+        """ Sleep until the next check is due, or a notification arrives.
+
+        Sleep at most `max_timeout` seconds, if specified.
+
+        """
+
+        now = time.time()
+        if now - self.loaded > RESYNC_INTERVAL:
+            self.reload(now)
+        elif self.horizon is not None and now >= self.horizon:
+            self.reload(now)
+        else:
+            self.revalidate(now)
+
+        timeout = self.timeout(now)
+        if max_timeout is not None:
+            timeout = min(timeout, max_timeout)
+
+        statsd.gauge("hc.sendalerts.nextDeadline", timeout)
+
+        fds = [self.wakeup_r]
+        if self.listener:
+            fds.append(self.listener)
+
+        ready, _, _ = select.select(fds, [], [], timeout)
+        if self.wakeup_r in ready:
+            os.read(self.wakeup_r, 1024)
+
+        if self.listener in ready:
+            try:
+                for payload in self.listener.receive():
+                    self.add(payload)
+            except connection.Database.Error:
+                # Fall back to polling until the next reload
+                self.listener.close()
+                self.listener = None
+
+    def interrupt(self):
+        """ End the current wait() early. Safe to call from signal handlers. """
+
+        try:
+            os.write(self.wakeup_w, b"x")
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        if self.listener:
+            self.listener.close()
+            self.listener = None
+
+        os.close(self.wakeup_r)
+        os.close(self.wakeup_w)
@@ -0,0 +1,148 @@
+import json
+import time
+from unittest.mock import Mock, patch
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.timezone import now
+from hc.accounts.models import Project
+from hc.api import transports
+from hc.api.models import Channel, Check
+
+# Channel kind -> a sample Channel.value. The kinds are benchmarked with
+# their transport's real notify() method, only the HTTP request is skipped.
+VALUES = {
+    "webhook": json.dumps(
+        {
+            "method_down": "POST",
+            "url_down": "https://example.org/down/$CODE",
+            "body_down": "$NAME is $STATUS",
+            "headers_down": {"X-Tags": "$TAGS"},
+            "method_up": "GET",
+            "url_up": "",
+            "body_up": "",
+            "headers_up": {},
+        }
+    ),
+    "slack": "https://hooks.slack.com/services/T0/B0/x",
+    "mattermost": "https://mattermost.example.org/hooks/x",
+    "discord": json.dumps(
+        {"webhook": {"id": "1", "url": "https://discord.com/api/webhooks/1/x"}}
+    ),
+    "msteams": "https://example.webhook.office.com/webhookb2/x",
+    "opsgenie": "opsgenie-key",
+    "pd": "pd-service-key",
+    "pagertree": "https://api.pagertree.com/integration/x",
+    "pushbullet": "pushbullet-token",
+    "po": "user-key|0",
+    "victorops": "https://alert.victorops.com/integrations/x",
+    "matrix": "!room:example.org",
+    "telegram": json.dumps({"id": 1, "type": "private", "name": "Alice"}),
+    "sms": json.dumps({"value": "+15555555555"}),
+    "call": json.dumps({"value": "+15555555555"}),
+    "whatsapp": json.dumps({"value": "+15555555555", "up": True, "down": True}),
+    "trello": json.dumps(
+        {
+            "token": "trello-token",
+            "list_id": "list-id",
+            "board_name": "Board",
+            "list_name": "List",
+        }
+    ),
+    "zulip": json.dumps(
+        {
+            "bot_email": "bot@example.org",
+            "api_key": "zulip-key",
+            "mtype": "stream",
+            "to": "general",
+        }
+    ),
+    "spike": "https://api.spike.sh/api/v1/integrations/x",
+    "linenotify": "line-token",
+}
+
+
+class UsesDatabase(Exception):
+    pass
+
+
+def block_queries(execute, sql, params, many, context):
+    raise UsesDatabase()
+
+
+class Command(BaseCommand):
+    help = """Measure the message building cost per notification.
+
+    For each channel kind in VALUES, calls the transport's notify() method
+    for a "down" event, with hc.lib.httppool.request() replaced by a stub
+    that returns HTTP 200, and reports the average time per notification.
+    Nothing is sent, and nothing is written to the database: the kinds
+    whose notify() queries the database (rate limits, SMS quotas) are
+    reported as skipped, and so are the kinds whose notify() returns an
+    error or raises an exception, for example because the integration is
+    not enabled or not configured.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num",
+            help="number of notifications per kind, default 1000",
+            type=int,
+            default=1000,
+        )
+        parser.add_argument(
+            "--uncached",
+            help="do not reuse compiled templates between notifications",
+            action="store_true",
+        )
+
+    def bench(self, channel, check, num, uncached):
+        """ Return the average time per notification, or an error message. """
+
+        notify = channel.transport.notify
+        try:
+            error = notify(check)
+        except UsesDatabase:
+            return "skipped, uses the database"
+        except Exception as e:
+            # For example, the integration is not configured
+            return "skipped, %r" % e
+
+        if error:
+            return "skipped, %s" % error
+
+        start = time.perf_counter()
+        for i in range(num):
+            if uncached:
+                transports._templates.clear()
+
+            notify(check)
+
+        elapsed = time.perf_counter() - start
+        return "%8.1f µs/notification" % (elapsed / num * 1e6)
+
+    def handle(self, num, uncached=False, *args, **options):
+        # The objects are not saved. The queries that look them up fail
+        # with UsesDatabase
+        owner = User(id=0, username="benchmark")
+        project = Project(name="Benchmark", owner=owner)
+        check = Check(project=project, name="backup", tags="prod db", status="down")
+        check.desc = "Nightly database backup"
+        check.last_ping = now()
+        check.n_pings = 1234
+        # Notification.send() sets these before calling notify()
+        check.is_test = False
+        check.status_url = "https://example.org/status"
+
+        response = Mock(status_code=200, headers={})
+        lines = []
+        with patch("hc.lib.httppool.request", return_value=response):
+            with connection.execute_wrapper(block_queries):
+                for kind in sorted(VALUES):
+                    channel = Channel(project=project, kind=kind, value=VALUES[kind])
+                    result = self.bench(channel, check, num, uncached)
+                    lines.append("%-12s %s" % (kind, result))
+
+        return "\n".join(lines)
@@ -0,0 +1,47 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from hc.accounts.models import Project
+from hc.api import pingbuffer, pingcache
+from hc.api.models import Check
+
+
+class Command(BaseCommand):
+    help = """Measure ping ingestion throughput.
+
+    Creates a temporary user, project and check, sends the requested
+    number of pings to the check the same way the ping view does
+    (look up the check by code, then call Check.ping), and reports
+    pings per second. The temporary objects are deleted afterwards.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--num", help="number of pings to send, default 1000", type=int, default=1000
+        )
+
+    def handle(self, num, *args, **options):
+        username = f"bench-{uuid.uuid4().hex[:8]}"
+        user = User.objects.create(username=username, email=f"{username}@example.org")
+        try:
+            project = Project.objects.create(owner=user, badge_key=username)
+            code = Check.objects.create(project=project).code
+
+            start = time.time()
+            for i in range(num):
+                check = pingcache.get_check(code)
+                check.ping("127.0.0.1", "http", "GET", "bench", "", "success")
+                pingcache.store(check)
+
+            if settings.PING_BUFFER_ENABLED:
+                pingbuffer.get_buffer().close()
+
+            elapsed = time.time() - start
+        finally:
+            user.delete()
+
+        return "Sent %d pings in %.2fs, %.1f pings/s" % (num, elapsed, num / elapsed)
@@ -0,0 +1,320 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import re
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+from hc.api.views import process_ping
+from hc.lib.string import decode_limited
+
+RE_PATH = re.compile(
+    r"^/ping/([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})"
+    r"(?:/|/(start|fail|[0-9]+))?$"
+)
+
+MAX_LINE = 8192
+MAX_HEADERS = 100
+MAX_CHUNK = 65536
+# Max time to wait for the next request on a keep-alive connection, in seconds
+IDLE_TIMEOUT = 60
+# Max time to read the request line and headers, and the body, in seconds
+HEADER_TIMEOUT = 10
+BODY_TIMEOUT = 30
+
+REASONS = {
+    100: "Continue",
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    429: "Too Many Requests",
+    503: "Service Unavailable",
+}
+
+
+class BadRequest(Exception):
+    pass
+
+
+class Request(object):
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    def keep_alive(self):
+        value = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return value == "keep-alive"
+
+        return value != "close"
+
+
+async def read_line(reader):
+    try:
+        line = await reader.readuntil(b"\n")
+    except asyncio.LimitOverrunError:
+        raise BadRequest()
+
+    return line.rstrip(b"\r\n").decode("latin-1")
+
+
+async def read_bounded(reader, n, keep):
+    """ Read exactly n bytes, return the first `keep` of them.
+
+    The bytes past `keep` are read and discarded. If `keep` is None,
+    return all n bytes.
+
+    """
+
+    if keep is None or n <= keep:
+        return await reader.readexactly(n)
+
+    data = await reader.readexactly(keep)
+    n -= keep
+    while n:
+        n -= len(await reader.readexactly(min(n, MAX_CHUNK)))
+
+    return data
+
+
+async def read_chunked(reader, max_body):
+    chunks, total = [], 0
+    while True:
+        try:
+            size = int(await read_line(reader) or "-", 16)
+        except ValueError:
+            raise BadRequest()
+
+        if size == 0:
+            break
+
+        keep = None if max_body is None else max(max_body - total, 0)
+        chunks.append(await read_bounded(reader, size, keep))
+        total += len(chunks[-1])
+        await read_line(reader)
+
+    # Skip the trailer
+    while await read_line(reader):
+        pass
+
+    return b"".join(chunks)
+
+
+async def read_headers(reader):
+    headers = {}
+    while line := await read_line(reader):
+        if len(headers) == MAX_HEADERS or ":" not in line:
+            raise BadRequest()
+
+        name, value = line.split(":", 1)
+        headers[name.strip().lower()] = value.strip()
+
+    return headers
+
+
+async def read_body(reader, headers, max_body):
+    if headers.get("transfer-encoding", "identity").lower() != "identity":
+        return await read_chunked(reader, max_body)
+
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise BadRequest()
+
+    if length < 0:
+        raise BadRequest()
+
+    return await read_bounded(reader, length, max_body)
+
+
+async def read_request(reader, writer, max_body=None):
+    """ Read and parse a single HTTP request.
+
+    Keep at most `max_body` bytes of the request body, read and discard the
+    rest. Return None if the client closes the connection before sending
+    a request.
+
+    Raise asyncio.TimeoutError if the client does not start sending
+    a request within IDLE_TIMEOUT seconds, or does not send its headers
+    within HEADER_TIMEOUT or its body within BODY_TIMEOUT seconds.
+
+    """
+
+    try:
+        request_line = await asyncio.wait_for(read_line(reader), IDLE_TIMEOUT)
+    except asyncio.IncompleteReadError:
+        return None
+
+    try:
+        method, path, version = request_line.split()
+    except ValueError:
+        raise BadRequest()
+
+    headers = await asyncio.wait_for(read_headers(reader), HEADER_TIMEOUT)
+    if headers.get("expect", "").lower() == "100-continue":
+        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+
+    body = await asyncio.wait_for(read_body(reader, headers, max_body), BODY_TIMEOUT)
+    return Request(method, path, version, headers, body)
+
+
+def handle(request, peer):
+    """ Process a parsed request, return HTTP status code and response body. """
+
+    # Get a new db connection in case the old one has timed out or has
+    # outlived CONN_MAX_AGE, before and after each request, same as Django:
+    close_old_connections()
+    try:
+        return process(request, peer)
+    finally:
+        close_old_connections()
+
+
+def process(request, peer):
+    m = RE_PATH.match(request.path.split("?")[0])
+    if m is None:
+        return 404, "not found"
+
+    code, action, exitstatus = uuid.UUID(m.group(1)), "success", None
+    if m.group(2) in ("start", "fail"):
+        action = m.group(2)
+    elif m.group(2):
+        exitstatus = int(m.group(2))
+
+    headers = request.headers
+    remote_addr = headers.get("x-forwarded-for", peer).split(",")[0]
+    scheme = headers.get("x-forwarded-proto", "http")
+    ua = headers.get("user-agent", "")
+
+    try:
+        body = decode_limited([request.body], settings.PING_BODY_LIMIT)
+    except UnicodeError:
+        return 400, "bad request"
+
+    try:
+        args = (remote_addr, scheme, request.method, ua, body, action, exitstatus)
+        result = process_ping(code, *args)
+    except DatabaseError:
+        # Get a new db connection for the next request
+        connection.close()
+        return 503, "service unavailable"
+
+    if result == "not found":
+        return 404, result
+
+    if result == "rate limited":
+        return 429, result
+
+    return 200, result
+
+
+def render(status, text, method, keep_alive=True):
+    body = text.encode()
+    lines = [
+        f"HTTP/1.1 {status} {REASONS[status]}",
+        "Content-Type: text/plain; charset=utf-8",
+        f"Content-Length: {len(body)}",
+        "Access-Control-Allow-Origin: *",
+        "Cache-Control: max-age=0, no-cache, no-store, must-revalidate, private",
+    ]
+
+    if not keep_alive:
+        lines.append("Connection: close")
+
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode()
+    return head if method == "HEAD" else head + body
+
+
+class PingServer(object):
+    """ Minimal HTTP server for the ping URLs.
+
+    Connections are handled by an asyncio event loop, so a single process
+    can keep many client connections open. The database work is done
+    in a pool of threads.
+
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info("peername")[0]
+        # A UTF-8 character takes up to 4 bytes
+        limit = settings.PING_BODY_LIMIT
+        max_body = None if limit is None else limit * 4
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, writer, max_body)
+                except (BadRequest, asyncio.IncompleteReadError):
+                    writer.write(render(400, "bad request", "GET", False))
+                    break
+                except asyncio.TimeoutError:
+                    # The client is idle or too slow, don't hold on to it
+                    break
+
+                if request is None:
+                    break
+
+                status, text = await loop.run_in_executor(
+                    self.executor, handle, request, peer
+                )
+
+                keep_alive = request.keep_alive()
+                writer.write(render(status, text, request.method, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host, port):
+        return await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_LINE
+        )
+
+    async def serve(self, host, port):
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+
+class Command(BaseCommand):
+    help = """Serve the ping URLs with a lightweight HTTP server.
+
+    Handles only /ping/<uuid>, /ping/<uuid>/start, /ping/<uuid>/fail and
+    /ping/<uuid>/<exitstatus> requests, without the Django middleware
+    stack. Put it behind a reverse proxy, and route the /ping/ paths to it.
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--host", help="ip address to listen on, default 0.0.0.0", default="0.0.0.0"
+        )
+        parser.add_argument(
+            "--port", help="port to listen on, default 8001", type=int, default=8001
+        )
+        parser.add_argument(
+            "--threads",
+            help="number of database threads, default 10",
+            type=int,
+            default=10,
+        )
+
+    def handle(self, host, port, threads, *args, **options):
+        executor = ThreadPoolExecutor(max_workers=threads)
+        self.stdout.write("Starting ping server on %s:%d ...\n" % (host, port))
+        try:
+            asyncio.run(PingServer(executor).serve(host, port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            executor.shutdown()
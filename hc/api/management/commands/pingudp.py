@@ -0,0 +1,211 @@
+import queue
+import re
+import socket
+from threading import Thread
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from hc.api.views import process_ping
+from statsd.defaults.env import statsd
+
+RE_LINE = re.compile(r"^([0-9a-fA-F-]{32,36})(?:\s+(start|fail|[0-9]{1,3}))?$")
+
+MAX_DATAGRAM = 65535
+
+
+def parse(line):
+    """ Parse a "<uuid> [start|fail|<exitstatus>]" line.
+
+    Return a (code, action, exitstatus) tuple, raise ValueError
+    if the line is not valid.
+
+    """
+
+    m = RE_LINE.match(line.strip())
+    if m is None:
+        raise ValueError("Invalid line: %r" % line)
+
+    code, action, exitstatus = uuid.UUID(m.group(1)), "success", None
+    if m.group(2) in ("start", "fail"):
+        action = m.group(2)
+    elif m.group(2):
+        exitstatus = int(m.group(2))
+        if exitstatus > 255:
+            raise ValueError("Invalid exit status: %r" % line)
+
+    return code, action, exitstatus
+
+
+class Listener(object):
+    """ Receives ping datagrams, and records them in batches.
+
+    The receiving thread puts datagrams in a bounded queue, and drops them
+    when the queue is full. The processing thread takes up to batch_size
+    datagrams from the queue, and records them in a single transaction.
+
+    """
+
+    def __init__(self, sock, batch_size=100, capacity=10000):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=capacity)
+
+        self.received = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.not_found = 0
+        self.rate_limited = 0
+
+    def drop(self, n=1):
+        self.dropped += n
+        statsd.incr("hc.pingudp.dropped", n)
+
+    def reject(self):
+        self.invalid += 1
+        statsd.incr("hc.pingudp.invalid")
+
+    def receive(self):
+        """ Receive a single datagram and put it in the queue. """
+
+        data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+        self.received += 1
+        try:
+            self.queue.put_nowait((data, addr[0]))
+        except queue.Full:
+            self.drop()
+
+    def receive_forever(self):
+        while True:
+            self.receive()
+
+    def take_batch(self, timeout):
+        """ Take up to batch_size datagrams from the queue.
+
+        Wait up to `timeout` seconds for the first datagram.
+
+        """
+
+        try:
+            batch = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+        return batch
+
+    def parse_batch(self, batch):
+        pings = []
+        for data, remote_addr in batch:
+            try:
+                lines = data.decode().splitlines()
+            except UnicodeError:
+                self.reject()
+                continue
+
+            for line in lines:
+                if not line.strip():
+                    continue
+
+                try:
+                    pings.append((remote_addr, parse(line)))
+                except ValueError:
+                    self.reject()
+
+        return pings
+
+    def process_batch(self, timeout=1.0):
+        """ Record a batch of pings. Return the number of datagrams taken. """
+
+        batch = self.take_batch(timeout)
+        if not batch:
+            return 0
+
+        pings = self.parse_batch(batch)
+        start = time.time()
+        try:
+            with transaction.atomic():
+                for remote_addr, (code, action, exitstatus) in pings:
+                    args = (remote_addr, "udp", "", "", "", action, exitstatus)
+                    result = process_ping(code, *args)
+                    if result == "not found":
+                        self.not_found += 1
+                    elif result == "rate limited":
+                        self.rate_limited += 1
+        except DatabaseError:
+            # The whole batch got rolled back
+            self.drop(len(batch))
+            # Get a new db connection for the next batch
+            connection.close()
+        else:
+            statsd.timing("hc.pingudp.batchTime", time.time() - start)
+
+        return len(batch)
+
+    def stats(self):
+        return "received=%d dropped=%d invalid=%d not_found=%d rate_limited=%d" % (
+            self.received,
+            self.dropped,
+            self.invalid,
+            self.not_found,
+            self.rate_limited,
+        )
+
+
+class Command(BaseCommand):
+    help = """Listen for pings sent as UDP datagrams.
+
+    Each datagram contains one or more lines in the format
+    "<uuid> [start|fail|<exitstatus>]".
+
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--host", help="ip address to listen on, default 0.0.0.0", default="0.0.0.0"
+        )
+        parser.add_argument(
+            "--port", help="port to listen on, default 8002", type=int, default=8002
+        )
+        parser.add_argument(
+            "--batch-size",
+            help="max number of datagrams per transaction, default 100",
+            type=int,
+            default=100,
+        )
+        parser.add_argument(
+            "--capacity",
+            help="max number of queued datagrams, default 10000",
+            type=int,
+            default=10000,
+        )
+
+    def handle(self, host, port, batch_size, capacity, *args, **options):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        listener = Listener(sock, batch_size, capacity)
+
+        t = Thread(target=listener.receive_forever, daemon=True)
+        t.start()
+
+        self.stdout.write("Starting UDP ping listener on %s:%d ...\n" % (host, port))
+        last_report = time.time()
+        try:
+            while True:
+                # Get a new db connection in case the old one has timed out:
+                close_old_connections()
+                listener.process_batch()
+
+                if time.time() - last_report > 60:
+                    self.stdout.write(listener.stats() + "\n")
+                    last_report = time.time()
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(listener.stats() + "\n")
@@ -2,7 +2,7 @@ from django.db.models import F
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from hc.accounts.models import Profile
-from hc.api.models import Ping
+from hc.api.models import Ping, PingBody
 
 
 class Command(BaseCommand):
@@ -18,5 +18,6 @@ class Command(BaseCommand):
         q = q.filter(n__lte=F("owner__n_pings") - F("limit"))
         q = q.filter(n__gt=0)
         n_pruned, _ = q.delete()
+        n_bodies = PingBody.prune()
 
-        return "Done! Pruned %d pings" % n_pruned
+        return "Done! Pruned %d pings and %d ping bodies" % (n_pruned, n_bodies)
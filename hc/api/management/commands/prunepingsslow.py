@@ -2,7 +2,7 @@ from django.db.models import F
 from django.contrib.auth.models import User
 from django.core.management.base import BaseCommand
 from hc.accounts.models import Profile
-from hc.api.models import Check, Ping
+from hc.api.models import Check, Ping, PingBody
 
 
 class Command(BaseCommand):
@@ -33,4 +33,7 @@ class Command(BaseCommand):
                 "Pruned %d pings for check %s (%s)" % (n_pruned, check.id, check.name)
             )
 
+        n_bodies = PingBody.prune()
+        self.stdout.write("Pruned %d ping bodies" % n_bodies)
+
         return "Done!"
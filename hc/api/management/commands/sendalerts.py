@@ -1,19 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+import copy
 from datetime import timedelta as td
+import signal
+import threading
 import time
-from threading import Thread
+import traceback
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Min
 from django.utils import timezone
-from hc.api.models import Check, Flip
+from hc.api.models import RETRY_DELAY, SEND_LEASE, Check, Flip, Notification
+from hc.api.deadlines import Scheduler
+from hc.api.shards import HEARTBEAT_INTERVAL, NUM_SHARDS, Coordinator, filter_shards
 from statsd.defaults.env import statsd
 
 SENDING_TMPL = "Sending alert, status=%s, code=%s\n"
 SEND_TIME_TMPL = "Sending took %.1fs, code=%s\n"
-
-
-def notify(flip_id, stdout):
-    flip = Flip.objects.get(id=flip_id)
-
+RETRY_TMPL = "Retrying alert, attempt=%d, status=%s, code=%s\n"
+DIGEST_TMPL = "Sending digest, checks=%d, kind=%s, code=%s\n"
+# The max number of checks handle_going_down() processes in one transaction
+GOING_DOWN_BATCH_SIZE = 100
+# The default max number of flips process_flips() claims at once
+FLIP_BATCH_SIZE = 100
+# The default number of worker threads sending notifications
+WORKERS = 10
+# Max time to wait for a flip's notifications to be sent, in seconds
+SEND_DEADLINE = 30
+# Print a "-- MARK --" line this often, in seconds
+MARK_INTERVAL = 120
+
+
+def notify(flip, stdout, limits=None):
     check = flip.owner
     # Set the historic status here but *don't save it*.
     # It would be nicer to pass the status explicitly, as a separate parameter.
@@ -27,10 +46,12 @@ def notify(flip_id, stdout):
     if flip.new_status == "down":
         check.project.set_next_nag_date()
 
-    # Send notifications
+    # Send notifications. The channels in flip.digested (not a database
+    # field) get a digest notification instead, see group_flips().
     send_start = timezone.now()
 
-    for ch, error, secs in flip.send_alerts():
+    exclude = getattr(flip, "digested", ())
+    for ch, error, secs in flip.send_alerts(limits, SEND_DEADLINE, exclude):
         label = "OK"
         if error:
             label = "ERROR"
@@ -47,117 +68,565 @@ def notify(flip_id, stdout):
     statsd.timing("hc.sendalerts.sendTime", send_time)
 
 
-def notify_on_thread(flip_id, stdout):
-    t = Thread(target=notify, args=(flip_id, stdout))
-    t.start()
+def retry(n, stdout, limits=None):
+    check, ch = n.owner, n.channel
+    # Send the historic status, same as notify() does
+    check.status = n.check_status
+    setattr(check, "save", None)
+
+    stdout.write(RETRY_TMPL % (n.attempts + 1, n.check_status, check.code))
+
+    # Don't send a stale alert if a newer one has already gone out
+    q = Notification.objects.filter(owner_id=n.owner_id, channel_id=n.channel_id)
+    if q.filter(created__gt=n.created).exists():
+        Notification.objects.filter(id=n.id).update(next_attempt=None)
+        stdout.write(" * SKIP  %-10s %s superseded\n" % (ch.kind, ch.code))
+        return
+
+    with (limits or {}).get(ch.kind, nullcontext()):
+        start = time.time()
+        error = n.send(check)
+
+    secs = time.time() - start
+    label = "ERROR" if error else "OK"
+    s = " * %-5s %4.1fs %-10s %s %s\n" % (label, secs, ch.kind, ch.code, error)
+    stdout.write(s)
+    statsd.incr("hc.sendalerts.retries")
+
+
+def group_flips(flips):
+    """ Group flips by channel, return a list of (channel, flips) digests.
+
+    Only the channels with several flips, and with a transport that supports
+    digests, get a digest. For each flip, set the "digested" attribute (not
+    a database field) to the ids of channels that will get a digest.
+
+    """
+
+    by_channel = {}
+    for flip in flips:
+        flip.digested = set()
+        if flip.is_silent() or flip.new_status not in ("up", "down"):
+            continue
+
+        for channel in flip.owner.channel_set.all():
+            if channel.transport.supports_digest:
+                by_channel.setdefault(channel.id, []).append((channel, flip))
+
+    digests = []
+    for items in by_channel.values():
+        if len(items) < 2:
+            continue
+
+        channel = items[0][0]
+        for _, flip in items:
+            flip.digested.add(channel.id)
+
+        digests.append((channel, [flip for _, flip in items]))
+
+    return digests
+
+
+def send_digest(digest, stdout, limits=None):
+    ch, flips = digest
+
+    checks = []
+    for flip in flips:
+        # notify() modifies flip.owner on another thread, so use a copy
+        check = copy.copy(flip.owner)
+        check.status = flip.new_status
+        setattr(check, "save", None)
+        checks.append(check)
+
+    stdout.write(DIGEST_TMPL % (len(checks), ch.kind, ch.code))
+
+    with (limits or {}).get(ch.kind, nullcontext()):
+        start = time.time()
+        error = ch.notify_digest(checks)
+
+    if error == "no-op":
+        return
+
+    secs = time.time() - start
+    label = "ERROR" if error else "OK"
+    s = " * %-5s %4.1fs %-10s %s %s\n" % (label, secs, ch.kind, ch.code, error)
+    stdout.write(s)
+    statsd.incr("hc.sendalerts.digests")
+
+
+class Pool(object):
+    """ Runs notify(), retry() and send_digest() calls in worker threads.
+
+    At most `workers` notifications are queued on top of the ones being
+    sent, free_slots() blocks while the queue is full. This way
+    sendalerts does not claim flips faster than it can send them out.
+    The workers use at most `workers` database connections, and the
+    checks with several channels notify them on MAX_FANOUT shared threads,
+    with at most MAX_FANOUT more (see hc.api.models.get_fanout_executor).
+
+    """
+
+    def __init__(self, workers, stdout, limits=None):
+        self.workers = workers
+        self.stdout = stdout
+        self.limits = limits
+        # Called when a finished call frees a slot in a full pool
+        self.on_done = None
+        self.executor = ThreadPoolExecutor(workers, "sendalerts")
+        self.cv = threading.Condition()
+        # The number of submitted, not yet finished notifications
+        self.pending = 0
+
+    def queue_depth(self):
+        return max(0, self.pending - self.workers)
+
+    def is_full(self):
+        return self.pending >= self.workers * 2
+
+    def free_slots(self, timeout=None):
+        """ Wait until the queue has room, return the number of free slots. """
+
+        with self.cv:
+            self.cv.wait_for(lambda: not self.is_full(), timeout)
+            return self.workers * 2 - self.pending
+
+    def submit(self, flip):
+        self._submit(notify, flip)
+
+    def submit_retry(self, n):
+        self._submit(retry, n)
+
+    def submit_digest(self, digest):
+        self._submit(send_digest, digest)
+
+    def _submit(self, func, item):
+        with self.cv:
+            self.pending += 1
+            statsd.gauge("hc.sendalerts.queueDepth", self.queue_depth())
+
+        self.executor.submit(self.run, func, item)
+
+    def run(self, func, item):
+        # Get a new db connection in case the old one has timed out:
+        close_old_connections()
+        try:
+            func(item, self.stdout, self.limits)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self.cv:
+                was_full = self.is_full()
+                self.pending -= 1
+                statsd.gauge("hc.sendalerts.queueDepth", self.queue_depth())
+                self.cv.notify_all()
+
+            if was_full and self.on_done:
+                self.on_done()
+
+    def shutdown(self):
+        """ Wait for the queued and in-flight notifications to finish. """
+
+        self.executor.shutdown(wait=True)
+
+
+def parse_limits(values):
+    """ Parse "kind=n" strings into a dict of kind -> semaphore. """
+
+    limits = {}
+    for value in values or []:
+        kind, _, n = value.partition("=")
+        try:
+            limits[kind] = threading.BoundedSemaphore(int(n))
+        except ValueError:
+            raise CommandError("Invalid --max-per-kind value: %r" % value)
+
+    return limits
 
 
 class Command(BaseCommand):
     help = "Sends UP/DOWN email alerts"
 
+    pool = None
+    scheduler = None
+    coordinator = None
+    digest_window = 0
+
     def add_arguments(self, parser):
         parser.add_argument(
             "--no-loop",
             action="store_false",
             dest="loop",
             default=True,
-            help="Do not keep running indefinitely in a 2 second wait loop",
+            help="Process the pending work once and exit, instead of running "
+            "indefinitely and waking up when checks are due",
         )
 
         parser.add_argument(
             "--no-threads",
             action="store_false",
             dest="use_threads",
-            default=False,
+            default=True,
             help="Send alerts synchronously, without using threads",
         )
 
-    def process_one_flip(self, use_threads=True):
-        """ Find unprocessed flip, send notifications.  """
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=FLIP_BATCH_SIZE,
+            help="Max number of flips to claim at once, default %d" % FLIP_BATCH_SIZE,
+        )
+
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=WORKERS,
+            help="Number of threads sending notifications, default %d" % WORKERS,
+        )
+
+        parser.add_argument(
+            "--sharded",
+            action="store_true",
+            help="Split the checks between the running sendalerts processes",
+        )
+
+        parser.add_argument(
+            "--digest-window",
+            type=int,
+            default=0,
+            metavar="SECONDS",
+            help="Wait this long for more flips, and send one digest per integration",
+        )
+
+        parser.add_argument(
+            "--max-per-kind",
+            action="append",
+            metavar="KIND=N",
+            help="Max concurrent notifications for a channel kind, e.g. email=5",
+        )
+
+    def process_flips(self, use_threads=True, batch_size=FLIP_BATCH_SIZE):
+        """ Claim a batch of unprocessed flips, send notifications.
+
+        Return the number of found flips.
+
+        """
+
+        if use_threads:
+            # Don't claim more flips than the worker pool can take
+            free_slots = self.pool.free_slots()
+            if not self.digest_window:
+                batch_size = min(batch_size, free_slots)
+            # In digest mode, claim a full batch so the digests are as
+            # complete as possible. The queue still stays bounded: we only
+            # get here when the pool has at least one free slot.
 
         # Order by processed, otherwise Django will automatically order by id
         # and make the query less efficient
         q = Flip.objects.filter(processed=None).order_by("processed")
-        flip = q.first()
-        if flip is None:
-            return False
+        if self.coordinator:
+            q = filter_shards(q, "owner_id", self.coordinator.shards)
+
+        now = timezone.now()
+        if self.digest_window:
+            # Wait until the oldest flip has waited for digest_window seconds,
+            # so the flips happening close together get sent in one digest
+            cutoff = now - td(seconds=self.digest_window)
+            if not q.filter(created__lte=cutoff).exists():
+                return 0
+
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                # Make other sendalerts processes skip the flips we are claiming
+                q = q.select_for_update(skip_locked=True)
+
+            ids = list(q.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return 0
+
+            q = Flip.objects.filter(id__in=ids, processed=None)
+            q.update(processed=now)
+
+        # Load the flips we have claimed. The flips another worker process
+        # has claimed in the meantime have a different "processed" value.
+        q = Flip.objects.filter(id__in=ids, processed=now)
+        q = q.select_related("owner__project").prefetch_related("owner__channel_set")
+        flips = list(q)
+        digests = group_flips(flips) if self.digest_window else []
+
+        for flip in flips:
+            if use_threads:
+                self.pool.submit(flip)
+            else:
+                notify(flip, self.stdout)
+
+        for digest in digests:
+            if use_threads:
+                self.pool.submit_digest(digest)
+            else:
+                send_digest(digest, self.stdout)
 
-        q = Flip.objects.filter(id=flip.id, processed=None)
-        num_updated = q.update(processed=timezone.now())
-        if num_updated != 1:
-            # Nothing got updated: another worker process got there first.
-            return True
+        return len(ids)
+
+    def process_retries(self, use_threads=True, batch_size=FLIP_BATCH_SIZE):
+        """ Claim a batch of notifications due for a retry, send them.
+
+        Return the number of claimed notifications.
+
+        """
 
         if use_threads:
-            notify_on_thread(flip.id, self.stdout)
-        else:
-            notify(flip.id, self.stdout)
+            batch_size = min(batch_size, self.pool.free_slots())
+
+        now = timezone.now()
+        q = Notification.objects.filter(next_attempt__lte=now)
+        q = q.order_by("next_attempt")
+        if self.coordinator:
+            q = filter_shards(q, "owner_id", self.coordinator.shards)
+
+        # Claim the notifications by moving next_attempt forward. If this
+        # process dies while sending, they will be due again after SEND_LEASE.
+        lease = now + SEND_LEASE
+        with transaction.atomic():
+            if connection.features.has_select_for_update_skip_locked:
+                q = q.select_for_update(skip_locked=True)
+
+            ids = list(q.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return 0
+
+            q = Notification.objects.filter(id__in=ids, next_attempt__lte=now)
+            q.update(next_attempt=lease)
+
+        q = Notification.objects.filter(id__in=ids, next_attempt=lease)
+        for n in q.select_related("owner__project", "channel"):
+            if use_threads:
+                self.pool.submit_retry(n)
+            else:
+                retry(n, self.stdout)
+
+        return len(ids)
+
+    def next_retry(self):
+        """ Return seconds until the next retry is due, or None. """
+
+        q = Notification.objects.filter(next_attempt__isnull=False)
+        if self.coordinator:
+            q = filter_shards(q, "owner_id", self.coordinator.shards)
+
+        t = q.aggregate(Min("next_attempt"))["next_attempt__min"]
+        if t is None:
+            return None
 
-        return True
+        return max((t - timezone.now()).total_seconds(), 0)
+
+    def next_digest(self):
+        """ Return seconds until the oldest unprocessed flip is due, or None. """
+
+        q = Flip.objects.filter(processed=None)
+        if self.coordinator:
+            q = filter_shards(q, "owner_id", self.coordinator.shards)
+
+        t = q.aggregate(Min("created"))["created__min"]
+        if t is None:
+            return None
+
+        t += td(seconds=self.digest_window)
+        return max((t - timezone.now()).total_seconds(), 0)
 
     def handle_going_down(self):
-        """ Process a single check going down.  """
+        """ Process a batch of checks going down.
+
+        Return the number of processed checks.
+
+        """
 
         now = timezone.now()
 
         q = Check.objects.filter(alert_after__lt=now).exclude(status="down")
         # Sort by alert_after, to avoid unnecessary sorting by id:
-        check = q.order_by("alert_after").first()
-        if check is None:
-            return False
-
-        old_status = check.status
-        q = Check.objects.filter(id=check.id, status=old_status)
+        q = q.order_by("alert_after")
+        if self.coordinator:
+            q = filter_shards(q, "id", self.coordinator.shards)
+
+        # On databases that support it, lock the claimed checks, and
+        # make other sendalerts processes skip them:
+        skip_locked = connection.features.has_select_for_update_skip_locked
+
+        flips, postponed, error = [], [], None
+        with transaction.atomic():
+            if skip_locked:
+                q = q.select_for_update(skip_locked=True)
+
+            checks = list(q[:GOING_DOWN_BATCH_SIZE])
+            for check in checks:
+                old_status = check.status
+                try:
+                    status = check.get_status()
+                except Exception as e:
+                    # Make sure we don't trip on this check again for an hour:
+                    # Otherwise sendalerts may end up in a crash loop.
+                    check.alert_after = now + td(hours=1)
+                    postponed.append((check, old_status))
+                    # Re-raise the exception after saving the batch
+                    error = error or e
+                    continue
+
+                if status != "down":
+                    # It is not down yet. Update alert_after
+                    check.alert_after = check.going_down_after()
+                    postponed.append((check, old_status))
+                    continue
+
+                flip = Flip(owner=check)
+                flip.created = check.going_down_after()
+                flip.old_status = old_status
+                flip.new_status = "down"
+                flips.append(flip)
+
+            if skip_locked:
+                # The checks are locked, update them in bulk
+                ids = [flip.owner_id for flip in flips]
+                Check.objects.filter(id__in=ids).update(alert_after=None, status="down")
+                objs = [check for check, old_status in postponed]
+                Check.objects.bulk_update(objs, ["alert_after"])
+            else:
+                # Another sendalerts process may be handling the same checks.
+                # Atomically update each check, if its status has not changed.
+                for check, old_status in postponed:
+                    q = Check.objects.filter(id=check.id, status=old_status)
+                    q.update(alert_after=check.alert_after)
+
+                claimed = []
+                for flip in flips:
+                    q = Check.objects.filter(id=flip.owner_id, status=flip.old_status)
+                    if q.update(alert_after=None, status="down") == 1:
+                        claimed.append(flip)
+
+                # For the rest, another worker process got there first.
+                flips = claimed
+
+            Flip.objects.bulk_create(flips)
 
-        try:
-            status = check.get_status()
-        except Exception as e:
-            # Make sure we don't trip on this check again for an hour:
-            # Otherwise sendalerts may end up in a crash loop.
-            q.update(alert_after=now + td(hours=1))
-            # Then re-raise the exception:
-            raise e
-
-        if status != "down":
-            # It is not down yet. Update alert_after
-            q.update(alert_after=check.going_down_after())
-            return True
-
-        # Atomically update status
-        flip_time = check.going_down_after()
-        num_updated = q.update(alert_after=None, status="down")
-        if num_updated != 1:
-            # Nothing got updated: another worker process got there first.
-            return True
-
-        flip = Flip(owner=check)
-        flip.created = flip_time
-        flip.old_status = old_status
-        flip.new_status = "down"
-        flip.save()
-
-        return True
-
-    def handle(self, use_threads=True, loop=True, *args, **options):
+        if error:
+            raise error
+
+        return len(checks)
+
+    def heartbeat(self):
+        """ Renew the shard leases, and start tracking any new shards. """
+
+        self.last_heartbeat = time.time()
+        if not self.coordinator.heartbeat():
+            return
+
+        shards = self.coordinator.shards
+        self.stdout.write("Handling %d of %d shards\n" % (len(shards), NUM_SHARDS))
+        statsd.gauge("hc.sendalerts.shards", len(shards))
+        if self.scheduler:
+            self.scheduler.shards = shards
+            self.scheduler.reload(time.time())
+
+    def on_sigterm(self, signum, frame):
+        self.stopping = True
+        if self.scheduler:
+            self.scheduler.interrupt()
+
+    def handle(
+        self,
+        use_threads=True,
+        loop=True,
+        batch_size=FLIP_BATCH_SIZE,
+        workers=WORKERS,
+        max_per_kind=None,
+        sharded=False,
+        digest_window=0,
+        *args,
+        **options,
+    ):
         self.stdout.write("sendalerts is now running\n")
 
-        i, sent = 0, 0
-        while True:
-            # Create flips for any checks going down
-            while self.handle_going_down():
-                pass
+        if use_threads:
+            self.pool = Pool(workers, self.stdout, parse_limits(max_per_kind))
+
+        self.digest_window = digest_window
+
+        # On SIGTERM, stop claiming work and let the in-flight alerts finish
+        self.stopping = False
+        prev_handler = signal.signal(signal.SIGTERM, self.on_sigterm)
 
-            # Process the unprocessed flips
-            while self.process_one_flip(use_threads):
-                sent += 1
+        if loop:
+            # Start listening for notifications before looking for work,
+            # so we don't miss any
+            self.scheduler = Scheduler()
+            self.scheduler.reload(time.time())
+            if self.pool:
+                # The pool has room for more work again
+                self.pool.on_done = self.scheduler.interrupt
 
-            if not loop:
-                break
+        if sharded:
+            self.coordinator = Coordinator()
+            self.heartbeat()
 
-            time.sleep(2)
-            i += 1
-            if i % 60 == 0:
-                timestamp = timezone.now().isoformat()
-                self.stdout.write("-- MARK %s --\n" % timestamp)
+        sent, last_mark = 0, time.time()
+        try:
+            while not self.stopping:
+                # Create flips for any checks going down
+                while not self.stopping and self.handle_going_down():
+                    pass
+
+                # Process the unprocessed flips
+                while not self.stopping:
+                    n = self.process_flips(use_threads, batch_size)
+                    if not n:
+                        break
+
+                    sent += n
+
+                # Retry the failed notifications that are due
+                while not self.stopping:
+                    if not self.process_retries(use_threads, batch_size):
+                        break
+
+                if not loop or self.stopping:
+                    break
+
+                # Sleep until the next check or retry is due, or until
+                # something changes
+                timeout = self.next_retry()
+                if self.digest_window:
+                    wait = self.next_digest()
+                    if wait is not None:
+                        timeout = wait if timeout is None else min(timeout, wait)
+
+                if self.pool and self.pool.pending:
+                    # The notifications being sent may schedule retries,
+                    # look for them before the earliest one can be due
+                    wait = RETRY_DELAY.total_seconds() / 2
+                    timeout = wait if timeout is None else min(timeout, wait)
+
+                if self.coordinator:
+                    elapsed = time.time() - self.last_heartbeat
+                    remaining = max(HEARTBEAT_INTERVAL - elapsed, 0)
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+
+                self.scheduler.wait(timeout)
+                if self.coordinator:
+                    if time.time() - self.last_heartbeat >= HEARTBEAT_INTERVAL:
+                        self.heartbeat()
+
+                if time.time() - last_mark > MARK_INTERVAL:
+                    timestamp = timezone.now().isoformat()
+                    self.stdout.write("-- MARK %s --\n" % timestamp)
+                    last_mark = time.time()
+        finally:
+            signal.signal(signal.SIGTERM, prev_handler)
+            if self.scheduler:
+                self.scheduler.close()
+            if self.coordinator:
+                self.coordinator.release()
+            if self.pool:
+                if self.stopping:
+                    self.stdout.write("Received SIGTERM, finishing alerts ...\n")
+                self.pool.shutdown()
 
         return "Sent %d alert(s)" % sent
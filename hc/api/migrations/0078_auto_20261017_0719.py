@@ -0,0 +1,17 @@
+# Generated by Django 3.1.6 on 2026-10-17 07:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0077_auto_20261017_0715'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ping',
+            index=models.Index(fields=['owner', 'n'], name='api_ping_owner_n'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.6 on 2026-10-17 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0078_auto_20261017_0719'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ping',
+            name='suppressed',
+            field=models.IntegerField(null=True),
+        ),
+    ]
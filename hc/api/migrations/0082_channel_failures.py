@@ -0,0 +1,23 @@
+# Generated by Django 3.1.6 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0081_notification_retries'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='next_probe',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
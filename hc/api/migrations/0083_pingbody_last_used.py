@@ -0,0 +1,19 @@
+# Generated by Django 3.1.6 on 2026-10-17 14:12
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0082_channel_failures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pingbody',
+            name='last_used',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
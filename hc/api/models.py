@@ -1,19 +1,32 @@
 # coding: utf-8
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from contextlib import nullcontext
+import copy
 import hashlib
 import json
+import random
+import threading
 import time
 import uuid
+import zlib
 from datetime import datetime, timedelta as td
 
 from croniter import croniter
 from django.conf import settings
 from django.core.signing import TimestampSigner
-from django.db import models
+from django.db import (
+    IntegrityError,
+    close_old_connections,
+    connection,
+    models,
+    transaction,
+)
 from django.urls import reverse
 from django.utils import timezone
-from hc.accounts.models import Project
-from hc.api import transports
+from hc.accounts.models import Profile, Project
+from hc.api import pingcache, sendlimit, transports
 from hc.lib import emails
 from hc.lib.date import month_boundaries
 import pytz
@@ -25,6 +38,48 @@ NEVER = datetime(3000, 1, 1, tzinfo=pytz.UTC)
 CHECK_KINDS = (("simple", "Simple"), ("cron", "Cron"))
 # max time between start and ping where we will consider both events related:
 MAX_DELTA = td(hours=24)
+# max number of threads, per process, Flip.send_alerts() uses for notifying
+# channels. All send_alerts() calls share them, see get_fanout_executor():
+MAX_FANOUT = 10
+# max number of delivery attempts for a notification that fails with
+# a transient error:
+NOTIFICATION_MAX_ATTEMPTS = 8
+# the delay before the first retry. It doubles with every further retry:
+RETRY_DELAY = td(seconds=15)
+MAX_RETRY_DELAY = td(minutes=10)
+# how long a delivery attempt can take before sendalerts assumes it has been
+# interrupted, and retries:
+SEND_LEASE = td(minutes=5)
+# after this many consecutive failures, skip the channel, and only let
+# a single notification through every PROBE_INTERVAL:
+CIRCUIT_THRESHOLD = 5
+PROBE_INTERVAL = td(minutes=5)
+# ping bodies that no ping references are only pruned after they have not
+# been used for this long. A ping may be about to reference them:
+PING_BODY_GRACE = td(hours=1)
+# Check fields that Check.ping() updates, besides n_pings:
+PING_FIELDS = (
+    "last_ping",
+    "last_start",
+    "last_duration",
+    "status",
+    "alert_after",
+    "has_confirmation_link",
+)
+# Check fields that Check.ping() reads. Check.ping() only updates the check
+# if they still have the values it has read:
+PING_GUARD_FIELDS = (
+    "status",
+    "last_ping",
+    "last_start",
+    "kind",
+    "timeout",
+    "grace",
+    "schedule",
+    "tz",
+    "methods",
+    "manual_resume",
+)
 
 CHANNEL_KINDS = (
     ("email", "Email"),
@@ -106,6 +161,14 @@ class Check(models.Model):
     def __str__(self):
         return "%s (%d)" % (self.name or self.code, self.id)
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        pingcache.evict(self.code)
+
+    def delete(self, *args, **kwargs):
+        pingcache.evict(self.code)
+        return super().delete(*args, **kwargs)
+
     def name_then_code(self):
         return self.name or str(self.code)
 
@@ -248,12 +311,74 @@ class Check(models.Model):
 
         return result
 
-    def ping(self, remote_addr, scheme, method, ua, body, action, exitstatus=None):
+    def ping(
+        self,
+        remote_addr,
+        scheme,
+        method,
+        ua,
+        body,
+        action,
+        exitstatus=None,
+        suppressed=None,
+    ):
         now = timezone.now()
 
+        ping = Ping(owner=self)
+        ping.created = now
+        ping.remote_addr = remote_addr
+        ping.scheme = scheme
+        ping.method = method
+        # If User-Agent is longer than 200 characters, truncate it:
+        ping.ua = ua[:200]
+        ping.body = body[: settings.PING_BODY_LIMIT]
+        ping.exitstatus = exitstatus
+        # The number of rate-limited pings since the previous ping:
+        ping.suppressed = suppressed or None
+
+        self.has_confirmation_link = "confirm" in ping.body.lower()
+        if settings.PING_BODY_COMPRESSION and ping.body:
+            ping.body_blob = PingBody.for_text(ping.body)
+            ping.body = None
+
+        while True:
+            expected = {name: getattr(self, name) for name in PING_GUARD_FIELDS}
+            alert_after = self.alert_after
+            flip = self._apply_ping(now, action, ping)
+
+            # Wake up sendalerts if it has a new flip to process, or if
+            # the check can now go down earlier than sendalerts expects.
+            # A "start" ping can move the deadline earlier, and we cannot
+            # reliably tell if it did: the check's alert_after may be stale.
+            earlier = self.alert_after and (
+                alert_after is None or self.alert_after < alert_after
+            )
+            wake = bool(flip or earlier or action == "start")
+            if self.save_ping(ping, expected, flip, wake):
+                break
+
+            # Another process has updated the check in the meantime,
+            # reload its state and try again. Reload last_duration too:
+            # it is not guarded, but it is saved with the other PING_FIELDS
+            self.refresh_from_db(fields=PING_GUARD_FIELDS + ("last_duration",))
+
+        self.n_pings = ping.n
+
+    def _apply_ping(self, now, action, ping):
+        """ Update check's fields and set `ping.kind` for a new ping.
+
+        Return an unsaved Flip if the check's status changes, None otherwise.
+
+        """
+
+        if self.methods == "POST" and ping.method != "POST":
+            if ping.scheme in ("http", "https"):
+                action = "ign"
+
         if self.status == "paused" and self.manual_resume:
             action = "ign"
 
+        flip = None
         if action == "start":
             self.last_start = now
             # Don't update "last_ping" field.
@@ -271,30 +396,212 @@ class Check(models.Model):
                 flip.created = self.last_ping
                 flip.old_status = self.status
                 flip.new_status = new_status
-                flip.save()
 
                 self.status = new_status
 
         self.alert_after = self.going_down_after()
-        self.n_pings = models.F("n_pings") + 1
-        self.has_confirmation_link = "confirm" in str(body).lower()
-        self.save()
-        self.refresh_from_db()
 
-        ping = Ping(owner=self)
-        ping.n = self.n_pings
-        ping.created = now
-        if action in ("start", "fail", "ign"):
-            ping.kind = action
+        ping.kind = action if action in ("start", "fail", "ign") else None
+        return flip
 
-        ping.remote_addr = remote_addr
-        ping.scheme = scheme
-        ping.method = method
-        # If User-Agent is longer than 200 characters, truncate it:
-        ping.ua = ua[:200]
-        ping.body = body[: settings.PING_BODY_LIMIT]
-        ping.exitstatus = exitstatus
-        ping.save()
+    def save_ping(self, ping, expected, flip=None, wake=False):
+        """ Save the PING_FIELDS, increment n_pings and insert `ping` and `flip`.
+
+        `expected` is a dict of the PING_GUARD_FIELDS values the new state
+        was computed from. If the database row no longer has these values,
+        don't save anything and return False. Otherwise, set `ping.n` to the
+        incremented n_pings value and return True.
+
+        `flip` is an optional unsaved Flip. It is saved in the same
+        transaction as the check, so a status change always has its flip.
+
+        If `wake` is set, also wake up sendalerts, see hc.api.deadlines.
+        On PostgreSQL, the NOTIFY is sent by the same statement that updates
+        the check. Other databases have no notifications.
+
+        On PostgreSQL this takes a single statement. On other databases it
+        takes three or four statements, wrapped in a single transaction.
+
+        If settings.PING_BUFFER_ENABLED is set, the check and the flip are
+        still saved synchronously, but `ping` is handed over to the
+        write-behind buffer in hc.api.pingbuffer.
+
+        """
+
+        if settings.PING_BUFFER_ENABLED:
+            from hc.api import pingbuffer
+
+            with transaction.atomic(savepoint=False):
+                ping.n = self._update_ping_fields(expected, wake)
+                if ping.n is None:
+                    return False
+
+                if flip:
+                    flip.save()
+
+            pingbuffer.add(ping)
+        elif connection.vendor == "postgresql":
+            return self._save_ping_returning(ping, expected, flip, wake)
+        else:
+            with transaction.atomic(savepoint=False):
+                ping.n = self._update_ping_fields(expected)
+                if ping.n is None:
+                    return False
+
+                ping.save()
+                if flip:
+                    flip.save()
+                if settings.PING_LOG_RING_BUFFER:
+                    Ping.trim_log(self.id, ping.n)
+
+        return True
+
+    def _ping_fields_update_sql(self, expected):
+        """ Return SQL and params for UPDATE ... RETURNING n_pings. """
+
+        qn = connection.ops.quote_name
+        fields = [Check._meta.get_field(name) for name in PING_FIELDS]
+        assignments = ", ".join(f"{qn(f.column)} = %s" for f in fields)
+        guard_fields = [Check._meta.get_field(name) for name in expected]
+        guards = "".join(
+            f" AND {qn(f.column)} IS NOT DISTINCT FROM %s" for f in guard_fields
+        )
+
+        sql = f"""
+            UPDATE {qn(Check._meta.db_table)}
+            SET {assignments}, n_pings = n_pings + 1
+            WHERE id = %s{guards}
+            RETURNING n_pings
+        """
+
+        params = []
+        for f in fields:
+            params.append(f.get_db_prep_save(getattr(self, f.attname), connection))
+
+        params.append(self.id)
+        for f in guard_fields:
+            params.append(f.get_db_prep_value(expected[f.name], connection))
+
+        return sql, params
+
+    def _notify_sql(self):
+        """ Return SQL and params for waking up sendalerts on PostgreSQL. """
+
+        from hc.api import deadlines
+
+        return "pg_notify(%s, %s)", [deadlines.CHANNEL, deadlines.payload(self)]
+
+    def _update_ping_fields(self, expected, wake=False):
+        """ Save the PING_FIELDS, increment n_pings and return its new value.
+
+        Return None if the row does not match `expected`.
+
+        """
+
+        if connection.vendor == "postgresql":
+            sql, params = self._ping_fields_update_sql(expected)
+            if wake:
+                notify_sql, notify_params = self._notify_sql()
+                sql = f"WITH c AS ({sql}) SELECT n_pings, {notify_sql} FROM c"
+                params.extend(notify_params)
+
+            with connection.cursor() as c:
+                c.execute(sql, params)
+                row = c.fetchone()
+
+            return row[0] if row else None
+
+        q = Check.objects.filter(id=self.id)
+        fields = {name: getattr(self, name) for name in PING_FIELDS}
+        with transaction.atomic(savepoint=False):
+            if q.filter(**expected).update(n_pings=models.F("n_pings") + 1, **fields):
+                return q.values_list("n_pings", flat=True).first()
+
+    def _save_ping_returning(self, ping, expected, flip=None, wake=False):
+        qn = connection.ops.quote_name
+
+        def insert_sql(model, exclude=("id",)):
+            """ Return the fields, column list and placeholders for INSERT. """
+
+            fields = [f for f in model._meta.concrete_fields if f.name not in exclude]
+            columns = ", ".join(qn(f.column) for f in fields)
+            placeholders = ", ".join(["%s"] * len(fields))
+            return fields, columns, placeholders
+
+        ping_fields, columns, placeholders = insert_sql(Ping, exclude=("id", "n"))
+
+        # The UPDATE ... RETURNING in the CTE feeds the incremented n_pings
+        # value directly into the INSERT. If the check does not match
+        # `expected`, the CTE returns no rows and nothing gets inserted.
+        update_sql, params = self._ping_fields_update_sql(expected)
+        trim_sql = ""
+        if settings.PING_LOG_RING_BUFFER:
+            # Also delete the pings that fall out of the ping log
+            trim_sql = f""", t AS (
+                DELETE FROM {qn(Ping._meta.db_table)}
+                WHERE owner_id = %s AND n > 0 AND n <= (
+                    SELECT c.n_pings - p.ping_log_limit
+                    FROM c, {qn(Check._meta.db_table)} ch
+                    JOIN {qn(Project._meta.db_table)} pr ON pr.id = ch.project_id
+                    JOIN {qn(Profile._meta.db_table)} p ON p.user_id = pr.owner_id
+                    WHERE ch.id = %s
+                )
+            )"""
+
+        flip_sql, flip_id_sql = "", "NULL"
+        if flip:
+            # Insert the flip only if the UPDATE went through, too
+            flip_fields, flip_columns, flip_placeholders = insert_sql(Flip)
+            flip_sql = f""", f AS (
+                INSERT INTO {qn(Flip._meta.db_table)} ({flip_columns})
+                SELECT {flip_placeholders} FROM c
+                RETURNING id
+            )"""
+            flip_id_sql = "(SELECT id FROM f)"
+
+        notify_sql = ""
+        if wake:
+            # Send the NOTIFY only if the UPDATE went through
+            notify_sql, notify_params = self._notify_sql()
+            notify_sql = ", " + notify_sql
+
+        sql = f"""
+            WITH c AS ({update_sql}), i AS (
+                INSERT INTO {qn(Ping._meta.db_table)} (n, {columns})
+                SELECT c.n_pings, {placeholders} FROM c
+                RETURNING id, n
+            ){trim_sql}{flip_sql}
+            SELECT id, n, {flip_id_sql}{notify_sql} FROM i
+        """
+
+        for f in ping_fields:
+            params.append(f.get_db_prep_save(f.pre_save(ping, True), connection))
+
+        if trim_sql:
+            params.extend([self.id, self.id])
+
+        if flip:
+            for f in flip_fields:
+                value = f.pre_save(flip, True)
+                params.append(f.get_db_prep_save(value, connection))
+
+        if wake:
+            params.extend(notify_params)
+
+        with connection.cursor() as c:
+            c.execute(sql, params)
+            row = c.fetchone()
+
+        if row is None:
+            return False
+
+        ping.id, ping.n, flip_id = row[:3]
+        ping._state.adding = False
+        if flip:
+            flip.id = flip_id
+            flip._state.adding = False
+
+        return True
 
     def downtimes(self, months=2):
         """ Calculate the number of downtimes and downtime minutes per month.
@@ -341,6 +648,55 @@ class Check(models.Model):
         return sorted(totals.values())
 
 
+class PingBody(models.Model):
+    """ A zlib-compressed ping body, shared by all pings with this body. """
+
+    sha256 = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    # Updated at most every PING_BODY_GRACE / 2, see for_text()
+    last_used = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def for_text(cls, text):
+        """ Return the stored body for `text`, store it if needed. """
+
+        raw = text.encode()
+        digest = hashlib.sha256(raw).hexdigest()
+        now = timezone.now()
+        body = cls.objects.filter(sha256=digest).only("id", "last_used").first()
+        if body and body.last_used < now - PING_BODY_GRACE / 2:
+            # Keep prune() away from the body while the new ping gets saved.
+            # If prune() has deleted it already, store it again.
+            if not cls.objects.filter(id=body.id).update(last_used=now):
+                body = None
+
+        if body is None:
+            try:
+                with transaction.atomic():
+                    body = cls.objects.create(sha256=digest, data=zlib.compress(raw))
+            except IntegrityError:
+                # Another process has stored the same body in the meantime
+                body = cls.objects.only("id").get(sha256=digest)
+
+        return body
+
+    @classmethod
+    def prune(cls):
+        """ Remove bodies not referenced by any ping. Return the number removed.
+
+        Keep bodies used within PING_BODY_GRACE: pings that reference them
+        may not be saved yet.
+
+        """
+
+        cutoff = timezone.now() - PING_BODY_GRACE
+        n_pruned, _ = cls.objects.filter(ping=None, last_used__lt=cutoff).delete()
+        return n_pruned
+
+    def get_text(self):
+        return zlib.decompress(self.data).decode()
+
+
 class Ping(models.Model):
     id = models.BigAutoField(primary_key=True)
     n = models.IntegerField(null=True)
@@ -352,7 +708,36 @@ class Ping(models.Model):
     method = models.CharField(max_length=10, blank=True)
     ua = models.CharField(max_length=200, blank=True)
     body = models.TextField(blank=True, null=True)
+    # Used instead of `body` when settings.PING_BODY_COMPRESSION is enabled
+    body_blob = models.ForeignKey(PingBody, models.PROTECT, null=True, blank=True)
     exitstatus = models.SmallIntegerField(null=True)
+    suppressed = models.IntegerField(null=True)
+
+    class Meta:
+        indexes = [
+            # For looking up pings by their sequence number within a check.
+            # Used when trimming the ping log and in the prunepings command.
+            models.Index(fields=["owner", "n"], name="api_ping_owner_n")
+        ]
+
+    @staticmethod
+    def trim_log(check_id, n):
+        """ Remove the pings that fall out of the check's ping log after ping #n.
+
+        Like the prunepings management command, keep the `ping_log_limit`
+        most recent pings.
+
+        """
+
+        q = Profile.objects.filter(user__project__check=check_id)
+        limit = models.Subquery(q.values("ping_log_limit")[:1])
+        Ping.objects.filter(owner_id=check_id, n__gt=0, n__lte=n - limit).delete()
+
+    def get_body(self):
+        if self.body_blob_id:
+            return self.body_blob.get_text()
+
+        return self.body
 
     def to_dict(self):
         return {
@@ -375,6 +760,9 @@ class Channel(models.Model):
     value = models.TextField(blank=True)
     email_verified = models.BooleanField(default=False)
     last_error = models.CharField(max_length=200, blank=True)
+    # The number of consecutive failed deliveries, for the circuit breaker
+    failures = models.IntegerField(default=0)
+    next_probe = models.DateTimeField(null=True, blank=True)
     checks = models.ManyToManyField(Check)
 
     def __str__(self):
@@ -423,88 +811,167 @@ class Channel(models.Model):
 
     @property
     def transport(self):
-        if self.kind == "email":
-            return transports.Email(self)
-        elif self.kind == "webhook":
-            return transports.Webhook(self)
-        elif self.kind in ("slack", "mattermost"):
-            return transports.Slack(self)
-        elif self.kind == "hipchat":
-            return transports.HipChat(self)
-        elif self.kind == "pd":
-            return transports.PagerDuty(self)
-        elif self.kind == "pagertree":
-            return transports.PagerTree(self)
-        elif self.kind == "pagerteam":
-            return transports.PagerTeam(self)
-        elif self.kind == "victorops":
-            return transports.VictorOps(self)
-        elif self.kind == "pushbullet":
-            return transports.Pushbullet(self)
-        elif self.kind == "po":
-            return transports.Pushover(self)
-        elif self.kind == "opsgenie":
-            return transports.Opsgenie(self)
-        elif self.kind == "discord":
-            return transports.Discord(self)
-        elif self.kind == "telegram":
-            return transports.Telegram(self)
-        elif self.kind == "sms":
-            return transports.Sms(self)
-        elif self.kind == "trello":
-            return transports.Trello(self)
-        elif self.kind == "matrix":
-            return transports.Matrix(self)
-        elif self.kind == "whatsapp":
-            return transports.WhatsApp(self)
-        elif self.kind == "apprise":
-            return transports.Apprise(self)
-        elif self.kind == "msteams":
-            return transports.MsTeams(self)
-        elif self.kind == "shell":
-            return transports.Shell(self)
-        elif self.kind == "zulip":
-            return transports.Zulip(self)
-        elif self.kind == "spike":
-            return transports.Spike(self)
-        elif self.kind == "call":
-            return transports.Call(self)
-        elif self.kind == "linenotify":
-            return transports.LineNotify(self)
-        elif self.kind == "signal":
-            return transports.Signal(self)
-        else:
-            raise NotImplementedError(f"Unknown channel kind: {self.kind}")
+        """ Return the transport for this channel's kind.
+
+        The transport is created once, and cached on the instance.
+
+        """
+
+        cached = self.__dict__.get("_transport")
+        # Create a new transport if the kind has changed, or if this is
+        # a copy of another channel instance
+        if cached is None or cached[0] != self.kind or cached[1].channel is not self:
+            cls = transports.REGISTRY.get(self.kind)
+            if cls is None:
+                raise NotImplementedError(f"Unknown channel kind: {self.kind}")
+
+            cached = self._transport = (self.kind, cls(self))
+
+        return cached[1]
 
     def notify(self, check, is_test=False):
-        if self.transport.is_noop(check):
+        n = self.new_notification(check, is_test)
+        if n is None:
             return "no-op"
 
+        return n.send(check)
+
+    def new_notification(self, check, is_test=False):
+        """ Save a Notification about check's current status, return it.
+
+        Return None if the transport ignores check's current status.
+
+        """
+
+        if self.transport.is_noop(check):
+            return None
+
         n = Notification(channel=self)
         if not is_test:
             n.owner = check
+            # If this process dies while sending, sendalerts will retry
+            n.next_attempt = timezone.now() + SEND_LEASE
 
         n.check_status = check.status
         n.error = "Sending"
         n.save()
 
-        # These are not database fields. It is just a convenient way to pass
-        # status_url and the is_test flag to transport classes.
-        check.is_test = is_test
-        check.status_url = n.status_url()
+        return n
 
-        error = self.transport.notify(check) or ""
-        Notification.objects.filter(id=n.id).update(error=error)
-        Channel.objects.filter(id=self.id).update(last_error=error)
+    def notify_digest(self, checks):
+        """ Send a single notification about several checks.
 
-        return error
+        Each check should have its status set to the status to report.
+        Record a Notification for each check, return the error message.
+
+        """
+
+        checks = [check for check in checks if not self.transport.is_noop(check)]
+        if not checks:
+            return "no-op"
+
+        if len(checks) == 1:
+            return self.notify(checks[0])
+
+        notifications = []
+        for check in checks:
+            n = Notification(channel=self, owner=check, check_status=check.status)
+            n.error = "Sending"
+            n.next_attempt = timezone.now() + SEND_LEASE
+            n.save()
+            notifications.append(n)
+
+            check.is_test = False
+            check.status_url = n.status_url()
+
+        error, sent = self.deliver(self.transport.notify_digest, checks)
+        # If the digest fails, the notifications get retried one by one
+        for n in notifications:
+            final_error = n.record(error)
+
+        if sent:
+            self.record_result(final_error)
+
+        return final_error
+
+    def deliver(self, send, arg, is_test=False):
+        """ Call send(arg) to deliver a notification.
+
+        Return (error, sent) where "sent" is False if the notification was
+        skipped because of the circuit breaker or the concurrency limits.
+
+        """
+
+        try:
+            # Test notifications always go through, they can close the breaker
+            if not is_test and not self.allow_send():
+                msg = "Skipped, the integration has failed %d times in a row"
+                return transports.TransientError(msg % self.failures), False
+
+            # Send one notification at a time for each channel
+            with sendlimit.channel_slot(self.code):
+                return send(arg) or "", True
+        except sendlimit.Throttled:
+            return transports.TransientError("Timed out waiting to send"), False
+
+    @property
+    def is_failing(self):
+        """ Return True if the circuit breaker for this channel is open. """
+
+        return self.failures >= CIRCUIT_THRESHOLD
+
+    @property
+    def probe_interval(self):
+        """ Return how often a failing channel gets a probe notification. """
+
+        return PROBE_INTERVAL
+
+    def allow_send(self):
+        """ Return False if the circuit breaker says to skip this channel.
+
+        When the breaker is open, let through a single probe notification
+        every PROBE_INTERVAL. A successful delivery closes the breaker.
+
+        """
+
+        if not self.is_failing:
+            return True
+
+        now = timezone.now()
+        q = Channel.objects.filter(id=self.id)
+        q = q.filter(models.Q(next_probe=None) | models.Q(next_probe__lte=now))
+        return q.update(next_probe=now + PROBE_INTERVAL) == 1
+
+    def record_result(self, error):
+        """ Update last_error and the circuit breaker after a delivery. """
+
+        q = Channel.objects.filter(id=self.id)
+        if error:
+            q.update(
+                last_error=error,
+                failures=models.F("failures") + 1,
+                next_probe=timezone.now() + PROBE_INTERVAL,
+            )
+        else:
+            q.update(last_error="", failures=0, next_probe=None)
 
     def icon_path(self):
         return f"img/integrations/{self.kind}.png"
 
     @property
     def json(self):
-        return json.loads(self.value)
+        """ Return the parsed value.
+
+        The result is cached on the instance, and parsed again only when
+        the value changes. Callers must not modify it.
+
+        """
+
+        cached = self.__dict__.get("_json")
+        if cached is None or cached[0] is not self.value:
+            cached = self._json = (self.value, json.loads(self.value))
+
+        return cached[1]
 
     @property
     def po_priority(self):
@@ -516,7 +983,7 @@ class Channel(models.Model):
     def webhook_spec(self, status):
         assert self.kind == "webhook"
 
-        doc = json.loads(self.value)
+        doc = self.json
         if status == "down" and "method_down" in doc:
             return {
                 "method": doc["method_down"],
@@ -564,7 +1031,7 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return None
 
-        doc = json.loads(self.value)
+        doc = self.json
         if "team_name" in doc:
             return doc["team_name"]
 
@@ -577,7 +1044,7 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return None
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["incoming_webhook"]["channel"]
 
     @property
@@ -586,13 +1053,13 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return self.value
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["incoming_webhook"]["url"]
 
     @property
     def discord_webhook_url(self):
         assert self.kind == "discord"
-        doc = json.loads(self.value)
+        doc = self.json
         url = doc["webhook"]["url"]
 
         # Discord migrated to discord.com,
@@ -605,25 +1072,25 @@ class Channel(models.Model):
     @property
     def discord_webhook_id(self):
         assert self.kind == "discord"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["webhook"]["id"]
 
     @property
     def telegram_id(self):
         assert self.kind == "telegram"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc.get("id")
 
     @property
     def telegram_type(self):
         assert self.kind == "telegram"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc.get("type")
 
     @property
     def telegram_name(self):
         assert self.kind == "telegram"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc.get("name")
 
     @property
@@ -632,14 +1099,14 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return self.value
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["service_key"]
 
     @property
     def pd_account(self):
         assert self.kind == "pd"
         if self.value.startswith("{"):
-            doc = json.loads(self.value)
+            doc = self.json
             return doc["account"]
 
     def latest_notification(self):
@@ -649,7 +1116,7 @@ class Channel(models.Model):
     def phone_number(self):
         assert self.kind in ("call", "sms", "whatsapp", "signal")
         if self.value.startswith("{"):
-            doc = json.loads(self.value)
+            doc = self.json
             return doc["value"]
         return self.value
 
@@ -657,21 +1124,21 @@ class Channel(models.Model):
     def trello_token(self):
         assert self.kind == "trello"
         if self.value.startswith("{"):
-            doc = json.loads(self.value)
+            doc = self.json
             return doc["token"]
 
     @property
     def trello_board_list(self):
         assert self.kind == "trello"
         if self.value.startswith("{"):
-            doc = json.loads(self.value)
+            doc = self.json
             return doc["board_name"], doc["list_name"]
 
     @property
     def trello_list_id(self):
         assert self.kind == "trello"
         if self.value.startswith("{"):
-            doc = json.loads(self.value)
+            doc = self.json
             return doc["list_id"]
 
     @property
@@ -685,7 +1152,7 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return True
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc.get("up")
 
     @property
@@ -694,31 +1161,31 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return True
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc.get("down")
 
     @property
     def whatsapp_notify_up(self):
         assert self.kind == "whatsapp"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["up"]
 
     @property
     def whatsapp_notify_down(self):
         assert self.kind == "whatsapp"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["down"]
 
     @property
     def signal_notify_up(self):
         assert self.kind == "signal"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["up"]
 
     @property
     def signal_notify_down(self):
         assert self.kind == "signal"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["down"]
 
     @property
@@ -727,7 +1194,7 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return self.value
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["key"]
 
     @property
@@ -736,19 +1203,19 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return "us"
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["region"]
 
     @property
     def zulip_bot_email(self):
         assert self.kind == "zulip"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["bot_email"]
 
     @property
     def zulip_site(self):
         assert self.kind == "zulip"
-        doc = json.loads(self.value)
+        doc = self.json
         if "site" in doc:
             return doc["site"]
 
@@ -760,19 +1227,19 @@ class Channel(models.Model):
     @property
     def zulip_api_key(self):
         assert self.kind == "zulip"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["api_key"]
 
     @property
     def zulip_type(self):
         assert self.kind == "zulip"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["mtype"]
 
     @property
     def zulip_to(self):
         assert self.kind == "zulip"
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["to"]
 
     @property
@@ -781,7 +1248,7 @@ class Channel(models.Model):
         if not self.value.startswith("{"):
             return self.value
 
-        doc = json.loads(self.value)
+        doc = self.json
         return doc["token"]
 
 
@@ -792,14 +1259,101 @@ class Notification(models.Model):
     channel = models.ForeignKey(Channel, models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
     error = models.CharField(max_length=200, blank=True)
+    attempts = models.IntegerField(default=0)
+    next_attempt = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         get_latest_by = "created"
+        indexes = [
+            # For quickly looking up notifications due for a retry.
+            # Used in the sendalerts management command.
+            models.Index(
+                fields=["next_attempt"],
+                name="api_notification_retry",
+                condition=models.Q(next_attempt__isnull=False),
+            )
+        ]
 
     def status_url(self):
         path = reverse("hc-api-notification-status", args=[self.code])
         return settings.SITE_ROOT + path
 
+    def send(self, check):
+        """ Make a delivery attempt, return error message ("" on success). """
+
+        # These are not database fields. It is just a convenient way to pass
+        # status_url and the is_test flag to transport classes.
+        check.is_test = self.owner_id is None
+        check.status_url = self.status_url()
+
+        transport = self.channel.transport
+        error, sent = self.channel.deliver(transport.notify, check, check.is_test)
+        error = self.record(error)
+        if sent:
+            self.channel.record_result(error)
+
+        return error
+
+    def record(self, error):
+        """ Save the result of a delivery attempt, return the final error.
+
+        If the attempt failed with a transient error, schedule a retry with
+        exponential backoff. After NOTIFICATION_MAX_ATTEMPTS attempts, give up
+        and record the final error.
+
+        """
+
+        self.attempts += 1
+        self.next_attempt = None
+        if isinstance(error, transports.TransientError) and self.owner_id:
+            if self.attempts < NOTIFICATION_MAX_ATTEMPTS:
+                delay = RETRY_DELAY * 2 ** (self.attempts - 1)
+                delay = min(delay, MAX_RETRY_DELAY)
+                # Add jitter, so the retries after an outage don't all
+                # arrive at the same time
+                delay *= random.uniform(0.5, 1)
+                self.next_attempt = timezone.now() + delay
+            else:
+                # Make room for the suffix, so the error still fits in
+                # Notification.error and Channel.last_error
+                suffix = f" (gave up after {self.attempts} attempts)"
+                max_length = Notification._meta.get_field("error").max_length
+                error = error[: max_length - len(suffix)] + suffix
+
+        self.error = error
+        Notification.objects.filter(id=self.id).update(
+            error=error, attempts=self.attempts, next_attempt=self.next_attempt
+        )
+
+        return error
+
+
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+# At most MAX_FANOUT notifications wait in the executor's queue on top of
+# the ones being sent. Flip.send_alerts() holds a slot per submitted send:
+_fanout_slots = threading.BoundedSemaphore(MAX_FANOUT * 2)
+
+
+def get_fanout_executor():
+    """ Return the executor Flip.send_alerts() notifies channels on.
+
+    It is shared by all threads in the process, so the number of threads
+    sending notifications, and the database connections they use, stay
+    bounded no matter how many flips are being processed concurrently.
+    Its queue is bounded by _fanout_slots: when it is full, send_alerts()
+    blocks, and the caller does not claim more work.
+
+    """
+
+    global _fanout_executor
+
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(MAX_FANOUT, "fanout")
+
+    return _fanout_executor
+
 
 class Flip(models.Model):
     owner = models.ForeignKey(Check, models.CASCADE)
@@ -825,29 +1379,109 @@ class Flip(models.Model):
             "up": 1 if self.new_status == "up" else 0,
         }
 
-    def send_alerts(self):
+    def is_silent(self):
+        """ Return True if this flip does not send any alerts. """
+
+        # Don't send alerts on new->up and paused->up transitions
+        return self.new_status == "up" and self.old_status in ("new", "paused")
+
+    def send_alerts(self, limits=None, deadline=None, exclude=()):
         """Loop over the enabled channels, call notify() on each.
 
         For each channel, yield a (channel, error, send_time) triple:
          * channel is a Channel instance
          * error is an empty string ("") on success, error message otherwise
          * send_time is the send time in seconds (float)
+
+        `limits` is an optional dict of channel kind -> semaphore, used to
+        limit concurrent notify() calls for the channel kind. `exclude` is
+        a collection of channel ids to skip.
+
+        If there are several channels, their notifications are saved
+        first, and then sent concurrently on the shared executor from
+        get_fanout_executor(). The results are yielded in the order they
+        complete. If `deadline` seconds pass before all channels are done,
+        the notifications that have not started get a "Timed out waiting to
+        send" error and are left for sendalerts to retry. The unfinished
+        ones are yielded with a "Timed out" error. They keep sending in the
+        background and record their final result as usual.
         """
 
-        # Don't send alerts on new->up and paused->up transitions
-        if self.new_status == "up" and self.old_status in ("new", "paused"):
+        if self.is_silent():
             return
 
         if self.new_status not in ("up", "down"):
             raise NotImplementedError(f"Unexpected status: {self.status}")
 
-        for channel in self.owner.channel_set.all():
-            start = time.time()
-            error = channel.notify(self.owner)
-            if error == "no-op":
+        channels = self.owner.channel_set.all()
+        channels = [ch for ch in channels if ch.id not in exclude]
+        if not channels:
+            return
+
+        if len(channels) == 1:
+            # Don't bother with threads
+            channel = channels[0]
+            with (limits or {}).get(channel.kind, nullcontext()):
+                start = time.time()
+                error = channel.notify(self.owner)
+
+            if error != "no-op":
+                yield (channel, error, time.time() - start)
+            return
+
+        start = time.time()
+
+        def remaining():
+            if deadline is not None:
+                return max(deadline - (time.time() - start), 0)
+
+        executor, slots = get_fanout_executor(), _fanout_slots
+        futures, unsent = {}, []
+        for channel in channels:
+            # Notification.send() sets attributes on the check, so give each
+            # thread its own copy
+            check = copy.copy(self.owner)
+            # Save the notification before queueing it: if this process dies
+            # before sending it, sendalerts retries it after SEND_LEASE
+            n = channel.new_notification(check)
+            if n is None:
                 continue
 
-            yield (channel, error, time.time() - start)
+            # Wait for room in the executor's queue
+            if not slots.acquire(timeout=remaining()):
+                unsent.append(n)
+                continue
+
+            future = executor.submit(self._send_alert, n, check, limits)
+            future.add_done_callback(lambda f: slots.release())
+            futures[future] = n
+
+        try:
+            for future in as_completed(futures, timeout=remaining()):
+                error, secs = future.result()
+                yield (futures[future].channel, error, secs)
+        except FuturesTimeoutError:
+            for future, n in futures.items():
+                if future.cancel():
+                    # It has not started yet, don't keep it queued
+                    unsent.append(n)
+                elif not future.done():
+                    yield (n.channel, "Timed out", time.time() - start)
+
+        for n in unsent:
+            error = n.record(transports.TransientError("Timed out waiting to send"))
+            yield (n.channel, error, time.time() - start)
+
+    def _send_alert(self, n, check, limits):
+        """ Send a notification on a fanout thread, return (error, send_time). """
+
+        # Get a new db connection in case the old one has timed out:
+        close_old_connections()
+        with (limits or {}).get(n.channel.kind, nullcontext()):
+            start = time.time()
+            error = n.send(check)
+
+        return error, time.time() - start
 
 
 class TokenBucket(models.Model):
@@ -935,3 +1569,15 @@ class TokenBucket(models.Model):
 
         # 10 sudo attempts per day
         return TokenBucket.authorize(value, 10, 3600 * 24)
+
+
+class Lease(models.Model):
+    """ A time-limited claim on a named resource.
+
+    Used by `sendalerts --sharded`: see hc.api.shards.
+
+    """
+
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=100, blank=True)
+    expires = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,305 @@
+""" Write-behind buffer for Ping rows.
+
+When settings.PING_BUFFER_ENABLED is set, Check.ping() updates the check
+synchronously but hands the Ping row over to a per-process buffer. A
+background thread writes the buffered rows with bulk_create(), either every
+PING_BUFFER_FLUSH_INTERVAL milliseconds or as soon as PING_BUFFER_BATCH_SIZE
+rows have accumulated, whichever comes first.
+
+The buffer holds at most PING_BUFFER_CAPACITY rows. When it is full, the
+request thread flushes it synchronously instead of dropping pings.
+
+Durability: with the default settings, buffered rows are lost if the
+process crashes (they are flushed on a normal shutdown). If
+PING_BUFFER_SPOOL_DIR is set, every buffered row is also appended to a spool
+file in that directory. Spool files left behind by crashed processes are
+replayed when the next process starts its buffer.
+
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import (
+    DatabaseError,
+    IntegrityError,
+    close_old_connections,
+    connection,
+    transaction,
+)
+from django.utils.dateparse import parse_datetime
+from hc.api.models import Check, Ping, PingBody
+from statsd.defaults.env import statsd
+
+SPOOL_FIELDS = (
+    "owner_id",
+    "n",
+    "kind",
+    "scheme",
+    "remote_addr",
+    "method",
+    "ua",
+    "body",
+    "body_blob_id",
+    "exitstatus",
+    "suppressed",
+)
+
+
+def dump(ping):
+    doc = {name: getattr(ping, name) for name in SPOOL_FIELDS}
+    doc["created"] = ping.created.isoformat()
+    return json.dumps(doc)
+
+
+def load(line):
+    doc = json.loads(line)
+    doc["created"] = parse_datetime(doc["created"])
+    return Ping(**doc)
+
+
+def trim_logs(pings):
+    """ Trim the ping logs of the checks the pings belong to. """
+
+    latest = {}
+    for ping in pings:
+        latest[ping.owner_id] = max(ping.n, latest.get(ping.owner_id, 0))
+
+    for check_id, n in latest.items():
+        Ping.trim_log(check_id, n)
+
+
+def drop_orphans(pings):
+    """ Return the pings whose check and body still exist. """
+
+    check_ids = {ping.owner_id for ping in pings}
+    q = Check.objects.filter(id__in=check_ids)
+    check_ids = set(q.values_list("id", flat=True))
+
+    body_ids = {ping.body_blob_id for ping in pings if ping.body_blob_id}
+    q = PingBody.objects.filter(id__in=body_ids)
+    body_ids = set(q.values_list("id", flat=True))
+
+    return [
+        ping
+        for ping in pings
+        if ping.owner_id in check_ids
+        and (ping.body_blob_id is None or ping.body_blob_id in body_ids)
+    ]
+
+
+class Spool(object):
+    """ An append-only file of buffered pings, locked while in use. """
+
+    def __init__(self, spool_dir):
+        name = "%d-%s.spool" % (os.getpid(), uuid.uuid4().hex)
+        self.path = os.path.join(spool_dir, name)
+        self.f = open(self.path, "a")
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+
+    def write(self, pings):
+        self.f.writelines(dump(ping) + "\n" for ping in pings)
+        self.f.flush()
+
+    def discard(self):
+        os.remove(self.path)
+        self.f.close()
+
+    def adopt_orphans(self):
+        """ Move pings from spool files of dead processes into this spool.
+
+        Return the adopted pings.
+
+        """
+
+        spool_dir = os.path.dirname(self.path)
+        pings = []
+        for name in sorted(os.listdir(spool_dir)):
+            path = os.path.join(spool_dir, name)
+            if not name.endswith(".spool") or path == self.path:
+                continue
+
+            try:
+                f = open(path)
+            except FileNotFoundError:
+                continue
+
+            with f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # The owner process is still alive
+                    continue
+
+                if os.fstat(f.fileno()).st_nlink == 0:
+                    # Another process has adopted it already
+                    continue
+
+                orphans = [load(line) for line in f if line.strip()]
+                self.write(orphans)
+                pings.extend(orphans)
+                os.remove(path)
+
+        return pings
+
+
+class PingBuffer(object):
+    def __init__(self, batch_size, flush_interval, capacity, spool_dir=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.capacity = capacity
+        self.spool_dir = spool_dir
+
+        self.pings = []
+        self.spool = None
+        self.closing = False
+        self.thread = None
+        self.cond = threading.Condition()
+        # Serializes flushes, so batches are written in order:
+        self.flush_lock = threading.Lock()
+
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self.spool = Spool(spool_dir)
+            self.pings = self.spool.adopt_orphans()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def depth(self):
+        with self.cond:
+            return len(self.pings)
+
+    def add(self, ping):
+        with self.cond:
+            self.pings.append(ping)
+            if self.spool:
+                self.spool.write([ping])
+
+            depth = len(self.pings)
+            if depth >= self.batch_size:
+                self.cond.notify()
+
+        statsd.gauge("hc.pingbuffer.depth", depth)
+        if depth >= self.capacity:
+            # Backpressure: the flusher is not keeping up,
+            # do the work in the request thread
+            self.flush()
+
+    def flush(self):
+        """ Write all buffered pings to the database.
+
+        Return the number of written pings. If the write fails, put the
+        pings back in the buffer and re-raise the exception.
+
+        Pings whose check or body has been deleted in the meantime can
+        never be written, so they are dropped.
+
+        """
+
+        with self.flush_lock:
+            with self.cond:
+                if not self.pings:
+                    return 0
+
+                batch, self.pings = self.pings, []
+                spool = self.spool
+                if spool:
+                    self.spool = Spool(self.spool_dir)
+
+            start = time.time()
+            try:
+                try:
+                    self.write(batch)
+                except IntegrityError:
+                    batch_size = len(batch)
+                    batch = drop_orphans(batch)
+                    statsd.incr("hc.pingbuffer.dropped", batch_size - len(batch))
+                    self.write(batch)
+            except DatabaseError:
+                with self.cond:
+                    self.pings = batch + self.pings
+                    if self.spool:
+                        self.spool.write(batch)
+                raise
+            finally:
+                if spool:
+                    spool.discard()
+
+            statsd.timing("hc.pingbuffer.flushTime", time.time() - start)
+            statsd.gauge("hc.pingbuffer.depth", self.depth())
+            return len(batch)
+
+    def write(self, batch):
+        with transaction.atomic():
+            Ping.objects.bulk_create(batch, batch_size=self.batch_size)
+            if settings.PING_LOG_RING_BUFFER:
+                trim_logs(batch)
+
+    def run(self):
+        def ready():
+            return self.closing or len(self.pings) >= self.batch_size
+
+        while True:
+            with self.cond:
+                self.cond.wait_for(ready, timeout=self.flush_interval / 1000)
+                closing = self.closing
+
+            # Get a new db connection in case the old one has timed out:
+            close_old_connections()
+            try:
+                self.flush()
+            except DatabaseError:
+                # The pings are back in the buffer, try again on the next round
+                connection.close()
+
+            if closing:
+                return
+
+    def close(self):
+        """ Stop the flusher thread and flush any remaining pings. """
+
+        if self.thread:
+            with self.cond:
+                self.closing = True
+                self.cond.notify()
+            self.thread.join()
+            self.thread = None
+
+        self.flush()
+        if self.spool:
+            self.spool.discard()
+            self.spool = None
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = PingBuffer(
+                batch_size=settings.PING_BUFFER_BATCH_SIZE,
+                flush_interval=settings.PING_BUFFER_FLUSH_INTERVAL,
+                capacity=settings.PING_BUFFER_CAPACITY,
+                spool_dir=settings.PING_BUFFER_SPOOL_DIR,
+            )
+            _buffer.start()
+            # Flush the remaining pings on worker shutdown
+            atexit.register(_buffer.close)
+
+    return _buffer
+
+
+def add(ping):
+    get_buffer().add(ping)
@@ -0,0 +1,121 @@
+""" In-process cache of the check fields the ping endpoint needs.
+
+The ping endpoint looks up checks by their UUIDs. With this cache enabled
+(settings.PING_CACHE_SIZE > 0), it loads only FIELDS from the database, and
+keeps them in a per-process LRU cache for up to PING_CACHE_TTL seconds.
+Unknown UUIDs are cached too, so repeated pings to non-existent checks
+don't hit the database.
+
+Check.save() and Check.delete() evict the check from this process's cache
+only. Other processes keep serving their cached copy until it expires, so
+a cached entry can be up to PING_CACHE_TTL seconds out of date. Check.ping()
+never acts on such stale values: its UPDATE verifies every field it reads
+(PING_GUARD_FIELDS in hc.api.models: the status, the ping timestamps, the
+schedule, the allowed methods and the manual resume flag). If any of them
+has changed, Check.ping() reloads them and tries again, and the view stores
+the fresh values back in the cache.
+
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.db import router
+
+# In the same order as in the model, as Model.from_db() expects
+FIELDS = (
+    "id",
+    "code",
+    "kind",
+    "timeout",
+    "grace",
+    "schedule",
+    "tz",
+    "methods",
+    "manual_resume",
+    "last_ping",
+    "last_start",
+    "last_duration",
+    "alert_after",
+    "status",
+)
+
+# Marks unknown UUIDs in the cache
+NOT_FOUND = object()
+
+
+class LRUCache(object):
+    def __init__(self):
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the cached value, or None if it is missing or expired. """
+
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+
+            expires, value = item
+            if expires < time.time():
+                del self.items[key]
+                return None
+
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.items[key] = (time.time() + settings.PING_CACHE_TTL, value)
+            self.items.move_to_end(key)
+            while len(self.items) > settings.PING_CACHE_SIZE:
+                self.items.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+_cache = LRUCache()
+
+
+def get_check(code):
+    """ Return the check with the given code, with only FIELDS loaded.
+
+    Return None if the check does not exist.
+
+    """
+
+    from hc.api.models import Check
+
+    if not settings.PING_CACHE_SIZE:
+        return Check.objects.only(*FIELDS).filter(code=code).first()
+
+    values = _cache.get(code)
+    if values is None:
+        q = Check.objects.filter(code=code).values_list(*FIELDS)
+        values = q.first() or NOT_FOUND
+        _cache.set(code, values)
+
+    if values is NOT_FOUND:
+        return None
+
+    return Check.from_db(router.db_for_read(Check), FIELDS, values)
+
+
+def store(check):
+    """ Update the cached fields after a ping. """
+
+    if settings.PING_CACHE_SIZE:
+        _cache.set(check.code, tuple(getattr(check, name) for name in FIELDS))
+
+
+def evict(code):
+    _cache.delete(code)
@@ -0,0 +1,120 @@
+""" Per-check rate limiting for incoming pings.
+
+When settings.PING_RATE_LIMIT is set, each process accepts at most that many
+pings per check per minute, using in-memory token buckets. Pings over the
+limit are rejected before they reach the database. The number of rejected
+pings is recorded with the next accepted ping for the same check
+(Ping.suppressed), so the event log shows them.
+
+The limit applies per process: with N worker processes, a check can get up
+to N times PING_RATE_LIMIT pings per minute through. Unlike
+hc.api.models.TokenBucket, the buckets are not stored in the database,
+so checking them does not cost any queries.
+
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+# Drop idle buckets this often, in seconds
+PURGE_INTERVAL = 60
+
+
+class Bucket(object):
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+        self.suppressed = 0
+
+
+class RateLimiter(object):
+    """ Allows up to `capacity` events per `refill_time_secs` for each key. """
+
+    def __init__(self, capacity, refill_time_secs):
+        self.capacity = capacity
+        self.refill_time_secs = refill_time_secs
+        self.buckets = {}
+        self.lock = threading.Lock()
+        self.purged = time.time()
+
+    def authorize(self, key):
+        """ Take a token from the key's bucket, return False if it is empty. """
+
+        now = time.time()
+        with self.lock:
+            if now - self.purged > PURGE_INTERVAL:
+                self.purge(now)
+
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = Bucket(self.capacity, now)
+            else:
+                # Top up the bucket:
+                bucket.tokens = self.refilled(bucket, now)
+                bucket.updated = now
+
+            if bucket.tokens < 1:
+                # Not enough tokens
+                bucket.suppressed += 1
+                return False
+
+            bucket.tokens -= 1
+            return True
+
+    def refilled(self, bucket, now):
+        """ Return the number of tokens the bucket has at `now`. """
+
+        refill = (now - bucket.updated) * self.capacity / self.refill_time_secs
+        return min(self.capacity, bucket.tokens + refill)
+
+    def pop_suppressed(self, key):
+        """ Return and reset the number of rejected events for the key. """
+
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                return 0
+
+            suppressed, bucket.suppressed = bucket.suppressed, 0
+            return suppressed
+
+    def purge(self, now):
+        """ Remove the buckets that would be full by now. """
+
+        for key, bucket in list(self.buckets.items()):
+            if self.refilled(bucket, now) == self.capacity and not bucket.suppressed:
+                del self.buckets[key]
+
+        self.purged = now
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter():
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None or _limiter.capacity != settings.PING_RATE_LIMIT:
+            _limiter = RateLimiter(settings.PING_RATE_LIMIT, 60)
+
+    return _limiter
+
+
+def authorize(code):
+    """ Return False if the check has received too many pings recently. """
+
+    if not settings.PING_RATE_LIMIT:
+        return True
+
+    return get_limiter().authorize(code)
+
+
+def pop_suppressed(code):
+    if not settings.PING_RATE_LIMIT:
+        return 0
+
+    return get_limiter().pop_suppressed(code)
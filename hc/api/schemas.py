@@ -17,3 +17,18 @@ check = {
         },
     },
 }
+
+pings = {
+    "type": "array",
+    "maxItems": 1000,
+    "items": {
+        "type": "object",
+        "properties": {
+            "code": {"type": "string"},
+            "action": {"enum": ["success", "fail", "start"]},
+            "exitstatus": {"type": "number", "minimum": 0, "maximum": 255},
+            "body": {"type": "string"},
+        },
+        "required": ["code"],
+    },
+}
@@ -0,0 +1,159 @@
+""" Concurrency and rate limits for outgoing notifications.
+
+When many checks change state at once, sendalerts can have many
+notifications for the same integration, or for the same service, in flight
+at the same time. To avoid being throttled by the service:
+
+* HttpTransport sends at most settings.HTTP_HOST_CONCURRENCY concurrent
+  requests, and, if settings.HTTP_HOST_RATE is set, at most that many
+  requests per second to each destination host. When a host responds with
+  HTTP 429, further requests to it wait for the duration in the
+  Retry-After header.
+* Channel.notify() sends one notification at a time for each channel.
+
+Requests over the limits wait in line. A request that cannot start within
+settings.HTTP_QUEUE_TIMEOUT seconds fails with an error, so delivery still
+finishes in bounded time.
+
+The limits apply per process.
+
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+# The max number of notifications in flight for a single channel
+CHANNEL_CONCURRENCY = 1
+# The max time to honor a Retry-After header for, in seconds
+MAX_BACKOFF = 60
+
+
+class Throttled(Exception):
+    pass
+
+
+class KeyState(object):
+    def __init__(self):
+        self.active = 0
+        # The earliest time the next request can start
+        self.next = 0.0
+
+
+class Throttle(object):
+    """ Allows up to `concurrency` concurrent, and up to `rate` per second
+    events for each key. Waits for a free slot instead of rejecting. """
+
+    def __init__(self, concurrency, rate=0):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.states = {}
+        self.cv = threading.Condition()
+
+    def acquire(self, key, timeout):
+        """ Wait for a free slot, return False if `timeout` seconds pass. """
+
+        deadline = time.monotonic() + timeout
+        with self.cv:
+            state = self.states.setdefault(key, KeyState())
+            while True:
+                now = time.monotonic()
+                if state.active < self.concurrency and state.next <= now:
+                    state.active += 1
+                    if self.rate:
+                        state.next = max(state.next, now) + 1.0 / self.rate
+                    return True
+
+                if now >= deadline:
+                    if not state.active:
+                        self.states.pop(key, None)
+                    return False
+
+                wait = deadline - now
+                if state.active < self.concurrency:
+                    # Only waiting for the rate limit
+                    wait = min(wait, state.next - now)
+
+                self.cv.wait(wait)
+                # The state may have been dropped in the meantime
+                state = self.states.setdefault(key, state)
+
+    def release(self, key):
+        with self.cv:
+            state = self.states[key]
+            state.active -= 1
+            if not state.active and state.next <= time.monotonic():
+                del self.states[key]
+
+            self.cv.notify_all()
+
+    def backoff(self, key, seconds):
+        """ Don't start new events for `key` for `seconds` seconds. """
+
+        with self.cv:
+            state = self.states.setdefault(key, KeyState())
+            state.next = max(state.next, time.monotonic() + seconds)
+
+    @contextmanager
+    def slot(self, key, timeout):
+        if not self.acquire(key, timeout):
+            raise Throttled()
+
+        try:
+            yield
+        finally:
+            self.release(key)
+
+
+_throttles = {}
+_lock = threading.Lock()
+
+
+def get_throttle(name, concurrency, rate=0):
+    """ Return the named throttle, recreate it if the limits have changed. """
+
+    with _lock:
+        throttle = _throttles.get(name)
+        limits = (concurrency, rate)
+        if throttle is None or (throttle.concurrency, throttle.rate) != limits:
+            throttle = _throttles[name] = Throttle(concurrency, rate)
+
+    return throttle
+
+
+def host_throttle():
+    concurrency = settings.HTTP_HOST_CONCURRENCY
+    return get_throttle("host", concurrency, settings.HTTP_HOST_RATE)
+
+
+def host_of(url):
+    return urlsplit(url).hostname or ""
+
+
+def host_slot(url):
+    """ Wait for a free slot for the URL's host, raise Throttled on timeout. """
+
+    return host_throttle().slot(host_of(url), settings.HTTP_QUEUE_TIMEOUT)
+
+
+def host_backoff(url, retry_after):
+    """ Pause requests to the URL's host, as asked by a Retry-After header. """
+
+    try:
+        seconds = min(float(retry_after), MAX_BACKOFF)
+    except (TypeError, ValueError):
+        # An HTTP date, or garbage. Wait a little.
+        seconds = 1
+
+    if seconds > 0:
+        host_throttle().backoff(host_of(url), seconds)
+
+
+def channel_slot(code):
+    """ Wait for a free slot for the channel, raise Throttled on timeout. """
+
+    throttle = get_throttle("channel", CHANNEL_CONCURRENCY)
+    return throttle.slot(code, settings.HTTP_QUEUE_TIMEOUT)
@@ -0,0 +1,128 @@
+""" Sharding for running several sendalerts processes side by side.
+
+Checks are split into NUM_SHARDS shards by check id. With
+`sendalerts --sharded`, each sendalerts process only looks at the checks
+and flips in the shards it holds a lease for, so the processes don't
+compete for the same rows.
+
+Leases are rows in the Lease table, and expire LEASE_TTL seconds after
+their last renewal. Every HEARTBEAT_INTERVAL seconds, each process:
+
+* renews its "worker:<id>" lease, which announces that it is alive,
+* counts the live workers, and works out its fair share of shards,
+* renews the shard leases it holds, and releases any over its fair share,
+* claims free or expired shards until it has its fair share.
+
+When a process stops or dies, its leases get released or expire, and the
+remaining processes pick up its shards on their next heartbeats. When a
+new process starts, the others release their surplus shards for it.
+
+"""
+
+import math
+import os
+import random
+import socket
+import uuid
+from datetime import timedelta as td
+
+from django.db.models import IntegerField, Q, Value
+from django.db.models.functions import Mod
+from django.utils import timezone
+from hc.api.models import Lease
+
+NUM_SHARDS = 64
+LEASE_TTL = td(seconds=30)
+HEARTBEAT_INTERVAL = 10
+# Delete worker leases that have been expired for this long
+WORKER_CLEANUP_AGE = td(hours=1)
+
+
+def shard_of(check_id):
+    return check_id % NUM_SHARDS
+
+
+def filter_shards(q, field, shards):
+    """ Filter queryset `q` to rows where check id `field` is in `shards`. """
+
+    shard = Mod(field, Value(NUM_SHARDS, output_field=IntegerField()))
+    return q.annotate(shard=shard).filter(shard__in=shards)
+
+
+class Coordinator(object):
+    def __init__(self, owner=None, ttl=LEASE_TTL):
+        if owner is None:
+            suffix = uuid.uuid4().hex[:8]
+            owner = "%s-%d-%s" % (socket.gethostname(), os.getpid(), suffix)
+
+        self.owner = owner[:90]
+        self.ttl = ttl
+        self.shards = set()
+        self.ready = False
+
+    def setup(self):
+        """ Make sure all shard leases exist. """
+
+        names = ["shard:%d" % i for i in range(NUM_SHARDS)]
+        leases = [Lease(name=name) for name in names]
+        Lease.objects.bulk_create(leases, ignore_conflicts=True)
+        self.ready = True
+
+    def heartbeat(self, now=None):
+        """ Renew and rebalance the leases. Return True if the shards changed. """
+
+        if not self.ready:
+            self.setup()
+
+        if now is None:
+            now = timezone.now()
+
+        expires = now + self.ttl
+        worker = "worker:" + self.owner
+        Lease.objects.update_or_create(
+            name=worker, defaults={"owner": self.owner, "expires": expires}
+        )
+
+        workers = Lease.objects.filter(name__startswith="worker:")
+        workers.filter(expires__lt=now - WORKER_CLEANUP_AGE).delete()
+        num_workers = workers.filter(expires__gt=now).count()
+        target = math.ceil(NUM_SHARDS / max(num_workers, 1))
+
+        shards = Lease.objects.filter(name__startswith="shard:")
+        # Renew the shard leases we still hold
+        shards.filter(owner=self.owner, expires__gt=now).update(expires=expires)
+        mine = shards.filter(owner=self.owner, expires=expires).order_by("name")
+        held = list(mine.values_list("name", flat=True))
+
+        if len(held) > target:
+            # Release the surplus, so the other workers can claim it
+            surplus = held[target:]
+            q = shards.filter(name__in=surplus, owner=self.owner)
+            q.update(owner="", expires=None)
+            held = held[:target]
+        elif len(held) < target:
+            free = shards.filter(Q(expires=None) | Q(expires__lte=now))
+            candidates = list(free.values_list("name", "owner", "expires"))
+            # Avoid several workers going after the same leases in lockstep
+            random.shuffle(candidates)
+            for name, owner, old_expires in candidates:
+                if len(held) == target:
+                    break
+
+                # Another worker may be claiming the same lease, only take
+                # it over if it has not changed since we looked:
+                q = shards.filter(name=name, owner=owner, expires=old_expires)
+                if q.update(owner=self.owner, expires=expires) == 1:
+                    held.append(name)
+
+        old, self.shards = self.shards, {int(name[6:]) for name in held}
+        return self.shards != old
+
+    def release(self):
+        """ Give up all leases. """
+
+        Lease.objects.filter(name__startswith="shard:", owner=self.owner).update(
+            owner="", expires=None
+        )
+        Lease.objects.filter(name="worker:" + self.owner).delete()
+        self.shards = set()
@@ -0,0 +1,37 @@
+from django.test.utils import override_settings
+from hc.api.management.commands.benchnotify import VALUES, Command
+from hc.api.models import Check, Notification
+from hc.api.transports import REGISTRY, HttpTransport
+from hc.test import BaseTestCase
+
+
+@override_settings(MATRIX_HOMESERVER="https://matrix.example.org")
+class BenchNotifyTestCase(BaseTestCase):
+    def bench(self):
+        result = Command().handle(num=2)
+        return dict(line.split(None, 1) for line in result.split("\n"))
+
+    def test_it_works(self):
+        results = self.bench()
+        self.assertEqual(set(results), set(VALUES))
+        self.assertTrue(results["slack"].endswith("µs/notification"))
+        self.assertTrue(results["matrix"].endswith("µs/notification"))
+        self.assertEqual(results["sms"], "skipped, uses the database")
+
+        # It should not touch the database
+        self.assertFalse(Check.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(PD_ENABLED=False)
+    def test_it_skips_kinds_that_return_errors(self):
+        results = self.bench()
+        error = "PagerDuty notifications are not enabled."
+        self.assertEqual(results["pd"], "skipped, " + error)
+
+    def test_it_covers_the_http_transports(self):
+        # Apprise does not use hc.lib.httppool, and the retired
+        # integrations don't send anything
+        other = {"apprise", "hipchat", "pagerteam"}
+        for kind, cls in REGISTRY.items():
+            if issubclass(cls, HttpTransport) and kind not in other:
+                self.assertIn(kind, VALUES)
@@ -0,0 +1,13 @@
+from hc.api.management.commands.benchpings import Command
+from hc.api.models import Check, Ping
+from hc.test import BaseTestCase
+
+
+class BenchPingsTestCase(BaseTestCase):
+    def test_it_works(self):
+        result = Command().handle(num=3)
+        self.assertTrue(result.startswith("Sent 3 pings"))
+
+        # It should clean up after itself
+        self.assertFalse(Check.objects.exists())
+        self.assertFalse(Ping.objects.exists())
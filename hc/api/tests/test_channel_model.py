@@ -1,5 +1,8 @@
+import copy
 import json
+from unittest.mock import patch
 
+from hc.api import transports
 from hc.api.models import Channel
 from hc.test import BaseTestCase
 
@@ -50,3 +53,47 @@ class ChannelModelTestCase(BaseTestCase):
         c.value = json.dumps({"key": "abc", "region": "eu"})
         self.assertEqual(c.opsgenie_key, "abc")
         self.assertEqual(c.opsgenie_region, "eu")
+
+    def test_it_parses_value_once(self):
+        c = Channel(kind="email")
+        c.value = json.dumps({"value": "alice@example.org", "up": True, "down": True})
+
+        with patch("hc.api.models.json.loads", wraps=json.loads) as loads:
+            self.assertEqual(c.email_value, "alice@example.org")
+            self.assertTrue(c.email_notify_up)
+            self.assertTrue(c.email_notify_down)
+
+        self.assertEqual(loads.call_count, 1)
+
+    def test_it_parses_value_again_after_change(self):
+        c = Channel(kind="email")
+        c.value = json.dumps({"value": "alice@example.org", "up": True, "down": True})
+        self.assertEqual(c.email_value, "alice@example.org")
+
+        c.value = json.dumps({"value": "bob@example.org", "up": True, "down": True})
+        self.assertEqual(c.email_value, "bob@example.org")
+
+    def test_it_caches_transport(self):
+        c = Channel(kind="email", value="alice@example.org")
+        self.assertIsInstance(c.transport, transports.Email)
+        self.assertIs(c.transport, c.transport)
+
+        c.kind = "webhook"
+        self.assertIsInstance(c.transport, transports.Webhook)
+
+    def test_copies_get_their_own_transport(self):
+        c = Channel(kind="email", value="alice@example.org")
+        copied = copy.copy(c)
+        self.assertIs(copied.transport.channel, copied)
+
+    def test_it_uses_registered_transport(self):
+        class Custom(transports.Transport):
+            pass
+
+        with patch.dict(transports.REGISTRY):
+            transports.register("custom")(Custom)
+            c = Channel(kind="custom")
+            self.assertIsInstance(c.transport, Custom)
+
+        with self.assertRaises(NotImplementedError):
+            Channel(kind="custom").transport
@@ -1,6 +1,8 @@
 from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
+from django.db import DatabaseError, transaction
+from django.test.utils import override_settings
 from django.utils import timezone
 from hc.api.models import Check, Flip
 from hc.test import BaseTestCase
@@ -259,3 +261,51 @@ class CheckModelTestCase(BaseTestCase):
         # Jan. 2020
         self.assertEqual(jan[1], timedelta())
         self.assertEqual(jan[2], 0)
+
+    def test_ping_saves_flip(self):
+        check = Check.objects.create(project=self.project, status="up")
+        check.ping("1.2.3.4", "http", "post", "", "", "fail")
+
+        flip = Flip.objects.get()
+        self.assertIsNotNone(flip.id)
+        self.assertEqual(flip.owner_id, check.id)
+        self.assertEqual(flip.new_status, "down")
+
+        check.refresh_from_db()
+        self.assertEqual(check.status, "down")
+
+    def test_ping_does_not_save_flip_for_stale_check(self):
+        check = Check.objects.create(project=self.project, status="up")
+        Check.objects.filter(id=check.id).update(status="down")
+
+        # The check is already down, so this ping does not flip it
+        check.ping("1.2.3.4", "http", "post", "", "", "fail")
+        self.assertFalse(Flip.objects.exists())
+
+    def test_ping_keeps_last_duration_for_stale_check(self):
+        check = Check.objects.create(project=self.project, status="up")
+        check.last_ping = timezone.now()
+        check.last_duration = timedelta(seconds=1)
+        check.save()
+
+        # Another process saves a newer ping with a different duration
+        q = Check.objects.filter(id=check.id)
+        q.update(last_ping=timezone.now(), last_duration=timedelta(seconds=10))
+
+        check.ping("1.2.3.4", "http", "post", "", "", "start")
+
+        check.refresh_from_db()
+        self.assertEqual(check.last_duration, timedelta(seconds=10))
+
+    @override_settings(PING_BUFFER_ENABLED=True)
+    @patch("hc.api.pingbuffer.add")
+    @patch("hc.api.models.Flip.save", side_effect=DatabaseError)
+    def test_ping_saves_status_and_flip_atomically(self, mock_save, mock_add):
+        check = Check.objects.create(project=self.project, status="up")
+
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            check.ping("1.2.3.4", "http", "post", "", "", "fail")
+
+        check.refresh_from_db()
+        self.assertEqual(check.status, "up")
+        self.assertEqual(check.n_pings, 0)
@@ -0,0 +1,106 @@
+from datetime import timedelta as td
+import json
+from unittest.mock import patch
+
+from django.utils.timezone import now
+from hc.api.models import Channel, Check, Notification
+from hc.test import BaseTestCase
+
+
+class CircuitBreakerTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.check = Check.objects.create(project=self.project, status="down")
+        definition = {
+            "method_down": "GET",
+            "url_down": "http://example.org",
+            "body_down": "",
+            "headers_down": {},
+        }
+
+        self.channel = Channel.objects.create(
+            project=self.project, kind="webhook", value=json.dumps(definition)
+        )
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_counts_consecutive_failures(self, mock_request):
+        mock_request.return_value.status_code = 400
+
+        self.channel.notify(self.check)
+        self.channel.notify(self.check)
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.failures, 2)
+        self.assertEqual(self.channel.last_error, "Received status code 400")
+        self.assertIsNotNone(self.channel.next_probe)
+        self.assertFalse(self.channel.is_failing)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_success_resets_failures(self, mock_request):
+        mock_request.return_value.status_code = 200
+
+        self.channel.failures = 7
+        self.channel.next_probe = now()
+        self.channel.save()
+
+        self.channel.notify(self.check)
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.failures, 0)
+        self.assertIsNone(self.channel.next_probe)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_skips_failing_channel(self, mock_request):
+        self.channel.failures = 5
+        self.channel.last_error = "Received status code 404"
+        self.channel.next_probe = now() + td(minutes=1)
+        self.channel.save()
+
+        error = self.channel.notify(self.check)
+        self.assertEqual(error, "Skipped, the integration has failed 5 times in a row")
+        self.assertFalse(mock_request.called)
+
+        # The skipped notification will be retried later
+        n = Notification.objects.get()
+        self.assertIsNotNone(n.next_attempt)
+
+        # Skipping does not count as a failure
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.failures, 5)
+        self.assertEqual(self.channel.last_error, "Received status code 404")
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_sends_a_single_probe(self, mock_request):
+        mock_request.return_value.status_code = 404
+
+        self.channel.failures = 5
+        self.channel.next_probe = now() - td(minutes=1)
+        self.channel.save()
+
+        self.channel.notify(self.check)
+        self.channel.notify(self.check)
+
+        # The first notification is the probe (HttpTransport tries it three
+        # times), the second is skipped
+        self.assertEqual(mock_request.call_count, 3)
+        skipped = Notification.objects.filter(error__startswith="Skipped")
+        self.assertEqual(skipped.count(), 1)
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.failures, 6)
+        self.assertTrue(self.channel.next_probe > now() + td(minutes=4))
+
+    @patch("hc.api.transports.httppool.request")
+    def test_test_notifications_are_not_skipped(self, mock_request):
+        mock_request.return_value.status_code = 200
+
+        self.channel.failures = 5
+        self.channel.next_probe = now() + td(minutes=1)
+        self.channel.save()
+
+        self.channel.notify(self.check, is_test=True)
+        self.assertTrue(mock_request.called)
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.failures, 0)
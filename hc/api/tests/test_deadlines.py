@@ -0,0 +1,170 @@
+from datetime import timedelta as td
+import time
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
+from hc.api.deadlines import POLL_INTERVAL, RESYNC_INTERVAL, Listener, Scheduler, parse
+from hc.api.models import Check
+from hc.api.shards import shard_of
+from hc.test import BaseTestCase
+
+
+class DeadlinesTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.scheduler = Scheduler(window=2)
+
+    def tearDown(self):
+        self.scheduler.close()
+        super().tearDown()
+
+    def add_check(self, alert_after, status="up"):
+        return Check.objects.create(
+            project=self.project, status=status, alert_after=alert_after
+        )
+
+    def test_reload_works(self):
+        t = now()
+        self.add_check(t + td(minutes=2))
+        c1 = self.add_check(t + td(minutes=1))
+        self.add_check(t + td(minutes=3), status="down")
+        self.add_check(None, status="new")
+
+        self.scheduler.window = 3
+        self.scheduler.reload(time.time())
+        expected = ((t + td(minutes=1)).timestamp(), c1.id)
+        self.assertEqual(self.scheduler.heap[0], expected)
+        self.assertEqual(len(self.scheduler.heap), 2)
+        # It has loaded all deadlines
+        self.assertIsNone(self.scheduler.horizon)
+
+    def test_reload_sets_horizon(self):
+        t = now()
+        for i in range(3):
+            self.add_check(t + td(minutes=i + 1))
+
+        self.scheduler.reload(time.time())
+        self.assertEqual(len(self.scheduler.heap), 2)
+        self.assertEqual(self.scheduler.horizon, (t + td(minutes=2)).timestamp())
+
+    def test_revalidate_reads_current_deadlines(self):
+        t = now()
+        c1 = self.add_check(t + td(minutes=5))
+        c2 = self.add_check(None, status="down")
+        self.scheduler.heap = [(t.timestamp() - 10, c1.id), (t.timestamp() - 5, c2.id)]
+
+        self.scheduler.revalidate(t.timestamp())
+        # The down check is gone, the other check is back with its new deadline
+        expected = [((t + td(minutes=5)).timestamp(), c1.id)]
+        self.assertEqual(self.scheduler.heap, expected)
+
+    def test_revalidate_postpones_checks_that_are_still_due(self):
+        t = now()
+        c1 = self.add_check(t - td(minutes=1))
+        self.scheduler.heap = [(t.timestamp() - 60, c1.id)]
+
+        self.scheduler.revalidate(t.timestamp())
+        self.assertEqual(self.scheduler.heap, [(t.timestamp() + POLL_INTERVAL, c1.id)])
+
+    def test_timeout_works(self):
+        t = time.time()
+        self.assertEqual(self.scheduler.timeout(t), POLL_INTERVAL)
+
+        self.scheduler.heap = [(t + 0.5, 1)]
+        self.assertEqual(self.scheduler.timeout(t), 0.5)
+
+        self.scheduler.heap = [(t - 1, 1)]
+        self.assertEqual(self.scheduler.timeout(t), 0)
+
+    def test_timeout_respects_horizon(self):
+        t = time.time()
+        self.scheduler.listener = object()
+        self.assertEqual(self.scheduler.timeout(t), RESYNC_INTERVAL)
+
+        self.scheduler.horizon = t + 10
+        self.scheduler.heap = [(t + 20, 1)]
+        self.assertEqual(self.scheduler.timeout(t), 10)
+        self.scheduler.listener = None
+
+    def test_add_works(self):
+        deadline = now() + td(minutes=1)
+        self.scheduler.add("123 " + deadline.isoformat())
+        self.scheduler.add("124")
+        self.assertEqual(self.scheduler.heap, [(deadline.timestamp(), 123)])
+
+    def test_add_skips_other_shards(self):
+        deadline = now() + td(minutes=1)
+        self.scheduler.shards = {shard_of(123)}
+        self.scheduler.add("123 " + deadline.isoformat())
+        self.scheduler.add("124 " + deadline.isoformat())
+        self.assertEqual(self.scheduler.heap, [(deadline.timestamp(), 123)])
+
+    def test_parse_works(self):
+        deadline = now()
+        self.assertEqual(parse("5 " + deadline.isoformat()), (deadline.timestamp(), 5))
+        self.assertIsNone(parse("5"))
+
+    def test_interrupt_ends_wait(self):
+        self.scheduler.loaded = time.time()
+        self.scheduler.heap = [(time.time() + 60, 1)]
+
+        self.scheduler.interrupt()
+        start = time.time()
+        self.scheduler.wait()
+        self.assertLess(time.time() - start, 1)
+
+    @skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+    def test_listener_receives_notifications(self):
+        listener = Listener()
+        try:
+            with listener.conn.cursor() as c:
+                c.execute("SELECT pg_notify('hc_deadlines', '1')")
+
+            self.assertEqual(listener.receive(), ["1"])
+        finally:
+            listener.close()
+
+    @patch("hc.api.models.Check.save_ping", autospec=True, return_value=True)
+    def test_ping_wakes_up_sendalerts_on_flip(self, mock_save_ping):
+        check = Check.objects.create(project=self.project)
+        check.ping("1.2.3.4", "http", "get", "", "", "success")
+
+        check, ping, expected, flip, wake = mock_save_ping.call_args[0]
+        self.assertTrue(flip)
+        self.assertTrue(wake)
+
+    @patch("hc.api.models.Check.save_ping", autospec=True, return_value=True)
+    def test_ping_does_not_wake_up_on_later_deadline(self, mock_save_ping):
+        check = Check.objects.create(project=self.project, status="up")
+        check.last_ping = now() - td(minutes=5)
+        check.alert_after = check.going_down_after()
+        check.save()
+
+        check.ping("1.2.3.4", "http", "get", "", "", "success")
+        self.assertFalse(mock_save_ping.call_args[0][4])
+
+    @skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+    def test_ping_notifies_in_the_same_statement(self):
+        check = Check.objects.create(project=self.project, status="up")
+        check.ping("1.2.3.4", "http", "get", "", "", "success")
+
+        with CaptureQueriesContext(connection) as ctx:
+            check.ping("1.2.3.4", "http", "get", "", "", "start")
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("pg_notify", ctx.captured_queries[0]["sql"])
+
+    @skipUnless(connection.vendor == "postgresql", "needs PostgreSQL")
+    @override_settings(PING_BUFFER_ENABLED=True)
+    @patch("hc.api.pingbuffer.add")
+    def test_buffered_ping_notifies_in_the_same_statement(self, mock_add):
+        check = Check.objects.create(project=self.project, last_ping=now())
+
+        with CaptureQueriesContext(connection) as ctx:
+            check.ping("1.2.3.4", "http", "get", "", "", "start")
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("pg_notify", ctx.captured_queries[0]["sql"])
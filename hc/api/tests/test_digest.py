@@ -0,0 +1,165 @@
+from datetime import timedelta as td
+from io import StringIO
+import json
+from unittest.mock import patch
+
+from django.core import mail
+from django.utils.timezone import now
+from hc.api.management.commands.sendalerts import Command, group_flips
+from hc.api.models import Channel, Check, Flip, Notification
+from hc.test import BaseTestCase
+
+
+class DigestTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.slack = Channel.objects.create(
+            project=self.project, kind="slack", value="https://example.org/slack"
+        )
+        self.webhook = Channel.objects.create(
+            project=self.project,
+            kind="webhook",
+            value=json.dumps(
+                {
+                    "method_down": "GET",
+                    "url_down": "http://example.org",
+                    "body_down": "",
+                    "headers_down": {},
+                }
+            ),
+        )
+
+        self.checks = []
+        for name in ("foo", "bar", "baz"):
+            check = Check.objects.create(project=self.project, name=name)
+            check.channel_set.add(self.slack, self.webhook)
+            self.checks.append(check)
+
+    def _flips(self, created=None):
+        for check in self.checks:
+            Flip.objects.create(
+                owner=check,
+                created=created or now(),
+                old_status="up",
+                new_status="down",
+            )
+
+    def _command(self, window):
+        cmd = Command(stdout=StringIO())
+        cmd.digest_window = window
+        return cmd
+
+    def test_group_flips_works(self):
+        self._flips()
+        flips = list(Flip.objects.prefetch_related("owner__channel_set"))
+
+        digests = group_flips(flips)
+        self.assertEqual(len(digests), 1)
+
+        channel, grouped = digests[0]
+        self.assertEqual(channel, self.slack)
+        self.assertEqual(len(grouped), 3)
+
+        # Webhooks don't support digests
+        for flip in flips:
+            self.assertEqual(flip.digested, {self.slack.id})
+
+    def test_group_flips_skips_single_flips(self):
+        self._flips()
+        flips = list(Flip.objects.prefetch_related("owner__channel_set")[:1])
+
+        self.assertEqual(group_flips(flips), [])
+        self.assertEqual(flips[0].digested, set())
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_waits_for_the_window(self, mock_request):
+        self._flips()
+
+        self.assertEqual(self._command(10).process_flips(use_threads=False), 0)
+        self.assertFalse(mock_request.called)
+        self.assertTrue(0 < self._command(10).next_digest() <= 10)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_sends_digest(self, mock_request):
+        mock_request.return_value.status_code = 200
+        self._flips(created=now() - td(seconds=15))
+
+        self.assertEqual(self._command(10).process_flips(use_threads=False), 3)
+
+        urls = [args[1] for args, kwargs in mock_request.call_args_list]
+        # One Slack message, and one webhook call per check
+        self.assertEqual(urls.count("https://example.org/slack"), 1)
+        self.assertEqual(urls.count("http://example.org"), 3)
+
+        for args, kwargs in mock_request.call_args_list:
+            if args[1] == "https://example.org/slack":
+                payload = kwargs["json"]
+
+        self.assertEqual(payload["text"], "3 checks have changed status.")
+        self.assertEqual(len(payload["attachments"]), 3)
+        self.assertIn("is DOWN", payload["attachments"][0]["text"])
+
+        # Each check gets its own notification record
+        q = Notification.objects.filter(channel=self.slack, error="")
+        self.assertEqual(q.count(), 3)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_failed_digest_schedules_retries(self, mock_request):
+        mock_request.return_value.status_code = 500
+
+        checks = []
+        for check in self.checks:
+            check.status = "down"
+            checks.append(check)
+
+        self.slack.notify_digest(checks)
+
+        q = Notification.objects.filter(channel=self.slack)
+        self.assertEqual(q.count(), 3)
+        for n in q:
+            self.assertEqual(n.error, "Received status code 500")
+            self.assertIsNotNone(n.next_attempt)
+
+    def test_email_digest_works(self):
+        channel = Channel.objects.create(
+            project=self.project,
+            kind="email",
+            value="alice@example.org",
+            email_verified=True,
+        )
+
+        checks = []
+        for check in self.checks[:2]:
+            check.status = "down"
+            checks.append(check)
+
+        error = channel.notify_digest(checks)
+        self.assertEqual(error, "")
+
+        self.assertEqual(len(mail.outbox), 1)
+        email = mail.outbox[0]
+        self.assertEqual(email.subject, "2 checks have changed status")
+        self.assertIn("DOWN | foo", email.body)
+        self.assertIn("DOWN | bar", email.body)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_sms_digest_uses_one_sms(self, mock_request):
+        mock_request.return_value.status_code = 200
+
+        channel = Channel.objects.create(
+            project=self.project, kind="sms", value="+1234567890"
+        )
+
+        checks = []
+        for check in self.checks:
+            check.status = "down"
+            checks.append(check)
+
+        channel.notify_digest(checks)
+
+        args, kwargs = mock_request.call_args
+        self.assertIn("3 checks are DOWN", kwargs["data"]["Body"])
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.sms_sent, 1)
@@ -1,7 +1,12 @@
-from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+from unittest.mock import MagicMock, patch
 
+from django.db.models import prefetch_related_objects
 from django.utils.timezone import now
-from hc.api.models import Channel, Check, Flip
+from hc.api.models import Channel, Check, Flip, Notification
 from hc.test import BaseTestCase
 
 
@@ -53,3 +58,158 @@ class FlipModelTestCase(BaseTestCase):
 
         results = list(self.flip.send_alerts())
         self.assertEqual(results, [])
+
+    @patch("hc.api.models.Channel.notify")
+    def test_send_alerts_respects_limits(self, mock_notify):
+        mock_notify.return_value = ""
+        limit = MagicMock()
+
+        results = list(self.flip.send_alerts({"email": limit, "webhook": MagicMock()}))
+        self.assertEqual(len(results), 1)
+
+        # It should hold the email semaphore while sending
+        self.assertTrue(limit.__enter__.called)
+        self.assertTrue(limit.__exit__.called)
+
+    def _add_webhook(self):
+        definition = {
+            "method_down": "GET",
+            "url_down": "http://example",
+            "body_down": "",
+            "headers_down": {},
+            "method_up": "GET",
+            "url_up": "",
+            "body_up": "",
+            "headers_up": {},
+        }
+
+        channel = Channel(project=self.project, kind="webhook")
+        channel.value = json.dumps(definition)
+        channel.save()
+        channel.checks.add(self.check)
+        return channel
+
+    def test_send_alerts_notifies_channels_concurrently(self):
+        self._add_webhook()
+
+        checks = []
+
+        def send(n, check):
+            checks.append(check)
+            time.sleep(0.5)
+            return ""
+
+        start = time.time()
+        with patch.object(Notification, "send", send):
+            results = list(self.flip.send_alerts())
+
+        self.assertEqual(len(results), 2)
+        self.assertLess(time.time() - start, 0.9)
+        # Each channel gets its own copy of the check
+        self.assertIsNot(checks[0], checks[1])
+        self.assertEqual(checks[0].id, self.check.id)
+
+    def test_send_alerts_respects_deadline(self):
+        self._add_webhook()
+
+        def send(n, check):
+            if n.channel.kind == "webhook":
+                time.sleep(0.5)
+            return ""
+
+        with patch.object(Notification, "send", send):
+            results = list(self.flip.send_alerts(deadline=0.1))
+
+        errors = {ch.kind: error for ch, error, send_time in results}
+        self.assertEqual(errors, {"email": "", "webhook": "Timed out"})
+
+    def test_send_alerts_saves_notifications_before_sending(self):
+        self._add_webhook()
+
+        def send(n, check):
+            # The notification is saved, with a lease, before it is sent
+            self.assertTrue(n.id)
+            self.assertTrue(n.next_attempt)
+            return ""
+
+        with patch.object(Notification, "send", send):
+            results = list(self.flip.send_alerts())
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_send_alerts_cancels_queued_sends_on_deadline(self):
+        self._add_webhook()
+
+        def send(n, check):
+            time.sleep(0.5)
+            return ""
+
+        # A single fanout thread: one notification is sent, the other waits
+        fanout = ThreadPoolExecutor(1)
+        with patch("hc.api.models._fanout_executor", fanout):
+            with patch.object(Notification, "send", send):
+                results = list(self.flip.send_alerts(deadline=0.1))
+
+        fanout.shutdown()
+        errors = sorted(error for ch, error, send_time in results)
+        self.assertEqual(errors, ["Timed out", "Timed out waiting to send"])
+
+        # The queued notification is left for sendalerts to retry
+        n = Notification.objects.get(error="Timed out waiting to send")
+        self.assertEqual(n.attempts, 1)
+        self.assertTrue(n.next_attempt)
+
+    def test_send_alerts_waits_for_room_in_the_queue(self):
+        self._add_webhook()
+
+        def send(n, check):
+            time.sleep(0.5)
+            return ""
+
+        # No room for the second notification until the deadline
+        slots = threading.BoundedSemaphore(1)
+        with patch("hc.api.models._fanout_slots", slots):
+            with patch.object(Notification, "send", send):
+                results = list(self.flip.send_alerts(deadline=0.1))
+
+            # The slot is released when the send finishes
+            time.sleep(0.6)
+            self.assertTrue(slots.acquire(blocking=False))
+
+        errors = sorted(error for ch, error, send_time in results)
+        self.assertEqual(errors, ["Timed out", "Timed out waiting to send"])
+
+    def test_send_alerts_share_the_fanout_threads(self):
+        self._add_webhook()
+
+        lock = threading.Lock()
+        running = [0, 0]  # current, max
+
+        def send(n, check):
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.1)
+            with lock:
+                running[0] -= 1
+            return ""
+
+        def send_alerts(flip):
+            return list(flip.send_alerts())
+
+        # The worker threads don't see the test's uncommitted data
+        prefetch_related_objects([self.check], "channel_set")
+
+        # Two flips, two channels each, on a shared executor with two threads
+        fanout = ThreadPoolExecutor(2)
+        with patch("hc.api.models._fanout_executor", fanout):
+            with patch.object(Notification, "send", send):
+                with patch.object(Notification, "save"):
+                    with ThreadPoolExecutor(2) as workers:
+                        flips = [self.flip, self.flip]
+                        results = list(workers.map(send_alerts, flips))
+
+        fanout.shutdown()
+        self.assertEqual([len(r) for r in results], [2, 2])
+        self.assertEqual(running[1], 2)
@@ -0,0 +1,197 @@
+from datetime import timedelta as td
+from io import StringIO
+import json
+from unittest.mock import patch
+
+from django.utils.timezone import now
+from hc.api.management.commands.sendalerts import Command
+from hc.api.models import NOTIFICATION_MAX_ATTEMPTS, Channel, Check, Notification
+from hc.api.transports import TransientError
+from hc.test import BaseTestCase
+from requests.exceptions import ConnectionError
+
+
+class NotificationRetriesTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.check = Check.objects.create(project=self.project, status="down")
+        definition = {
+            "method_down": "GET",
+            "url_down": "http://example.org",
+            "body_down": "",
+            "headers_down": {},
+        }
+
+        self.channel = Channel.objects.create(
+            project=self.project, kind="webhook", value=json.dumps(definition)
+        )
+        self.channel.checks.add(self.check)
+
+    def _retry(self):
+        cmd = Command(stdout=StringIO())
+        return cmd.process_retries(use_threads=False)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_schedules_retry_on_server_error(self, mock_request):
+        mock_request.return_value.status_code = 500
+
+        error = self.channel.notify(self.check)
+        self.assertEqual(error, "Received status code 500")
+
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "Received status code 500")
+        self.assertEqual(n.attempts, 1)
+        # 15 seconds, with jitter
+        delay = n.next_attempt - now()
+        self.assertTrue(td(seconds=7) < delay < td(seconds=16))
+
+    @patch("hc.api.transports.httppool.request", side_effect=ConnectionError)
+    def test_it_schedules_retry_on_connection_error(self, mock_request):
+        self.channel.notify(self.check)
+
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "Connection failed")
+        self.assertIsNotNone(n.next_attempt)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_does_not_retry_client_errors(self, mock_request):
+        mock_request.return_value.status_code = 400
+
+        self.channel.notify(self.check)
+
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "Received status code 400")
+        self.assertIsNone(n.next_attempt)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_clears_next_attempt_on_success(self, mock_request):
+        mock_request.return_value.status_code = 200
+
+        self.channel.notify(self.check)
+
+        n = Notification.objects.get()
+        self.assertEqual(n.error, "")
+        self.assertEqual(n.attempts, 1)
+        self.assertIsNone(n.next_attempt)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_does_not_retry_test_notifications(self, mock_request):
+        mock_request.return_value.status_code = 500
+
+        self.channel.notify(self.check, is_test=True)
+
+        n = Notification.objects.get()
+        self.assertIsNone(n.next_attempt)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_process_retries_sends_due_notifications(self, mock_request):
+        mock_request.return_value.status_code = 200
+
+        self.check.status = "up"
+        self.check.save()
+
+        n = Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            error="Connection failed",
+            attempts=1,
+            next_attempt=now(),
+        )
+
+        self.assertEqual(self._retry(), 1)
+
+        # It should send the historic status. The channel has no URL
+        # for "up" events, so it would fail otherwise.
+        n.refresh_from_db()
+        self.assertEqual(n.error, "")
+        self.assertEqual(n.attempts, 2)
+        self.assertIsNone(n.next_attempt)
+        self.assertEqual(mock_request.call_count, 1)
+
+        self.channel.refresh_from_db()
+        self.assertEqual(self.channel.last_error, "")
+
+        # The check must not be modified
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+
+    @patch("hc.api.transports.httppool.request")
+    def test_process_retries_skips_notifications_not_yet_due(self, mock_request):
+        Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            next_attempt=now() + td(minutes=1),
+        )
+
+        self.assertEqual(self._retry(), 0)
+        self.assertFalse(mock_request.called)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_gives_up_after_max_attempts(self, mock_request):
+        mock_request.return_value.status_code = 503
+
+        n = Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            attempts=NOTIFICATION_MAX_ATTEMPTS - 1,
+            next_attempt=now(),
+        )
+
+        self._retry()
+
+        n.refresh_from_db()
+        self.assertEqual(
+            n.error, "Received status code 503 (gave up after 8 attempts)"
+        )
+        self.assertIsNone(n.next_attempt)
+
+    def test_it_truncates_long_error_when_giving_up(self):
+        n = Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            attempts=NOTIFICATION_MAX_ATTEMPTS - 1,
+        )
+
+        error = n.record(TransientError("x" * 199))
+        self.assertEqual(len(error), 200)
+        self.assertTrue(error.endswith("x (gave up after 8 attempts)"))
+
+        n.refresh_from_db()
+        self.assertEqual(n.error, error)
+
+    @patch("hc.api.transports.httppool.request")
+    def test_it_skips_superseded_notifications(self, mock_request):
+        old = Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            error="Connection failed",
+            next_attempt=now(),
+        )
+        Notification.objects.create(
+            owner=self.check, channel=self.channel, check_status="up"
+        )
+
+        self._retry()
+
+        old.refresh_from_db()
+        self.assertEqual(old.error, "Connection failed")
+        self.assertIsNone(old.next_attempt)
+        self.assertFalse(mock_request.called)
+
+    def test_next_retry_works(self):
+        cmd = Command(stdout=StringIO())
+        self.assertIsNone(cmd.next_retry())
+
+        Notification.objects.create(
+            owner=self.check,
+            channel=self.channel,
+            check_status="down",
+            next_attempt=now() + td(seconds=30),
+        )
+        self.assertTrue(25 < cmd.next_retry() <= 30)
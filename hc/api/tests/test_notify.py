@@ -25,7 +25,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pagerteam(self, mock_post):
         self._setup_data("pagerteam", "123")
 
@@ -33,7 +33,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertFalse(mock_post.called)
         self.assertEqual(Notification.objects.count(), 0)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_hipchat(self, mock_post):
         self._setup_data("hipchat", "123")
 
@@ -41,7 +41,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertFalse(mock_post.called)
         self.assertEqual(Notification.objects.count(), 0)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_discord(self, mock_post):
         v = json.dumps({"webhook": {"url": "123"}})
         self._setup_data("discord", v)
@@ -56,7 +56,7 @@ class NotifyTestCase(BaseTestCase):
         fields = {f["title"]: f["value"] for f in attachment["fields"]}
         self.assertEqual(fields["Last Ping"], "an hour ago")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_discord_rewrites_discordapp_com(self, mock_post):
         v = json.dumps({"webhook": {"url": "https://discordapp.com/foo"}})
         self._setup_data("discord", v)
@@ -72,7 +72,7 @@ class NotifyTestCase(BaseTestCase):
         # rewrite discordapp.com to discord.com:
         self.assertEqual(url, "https://discord.com/foo/slack")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pushbullet(self, mock_post):
         self._setup_data("pushbullet", "fake-token")
         mock_post.return_value.status_code = 200
@@ -84,7 +84,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(kwargs["json"]["type"], "note")
         self.assertEqual(kwargs["headers"]["Access-Token"], "fake-token")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_telegram(self, mock_post):
         v = json.dumps({"id": 123})
         self._setup_data("telegram", v)
@@ -98,7 +98,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(payload["chat_id"], 123)
         self.assertTrue("The check" in payload["text"])
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_telegram_returns_error(self, mock_post):
         self._setup_data("telegram", json.dumps({"id": 123}))
         mock_post.return_value.status_code = 400
@@ -117,7 +117,7 @@ class NotifyTestCase(BaseTestCase):
         n = Notification.objects.first()
         self.assertEqual(n.error, "Rate limit exceeded")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_call(self, mock_post):
         self.profile.call_limit = 1
         self.profile.save()
@@ -138,7 +138,7 @@ class NotifyTestCase(BaseTestCase):
         callback_path = f"/api/v1/notifications/{n.code}/status"
         self.assertTrue(payload["StatusCallback"].endswith(callback_path))
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_call_limit(self, mock_post):
         # At limit already:
         self.profile.last_call_date = now()
@@ -161,7 +161,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(email.to[0], "alice@example.org")
         self.assertEqual(email.subject, "Monthly Phone Call Limit Reached")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_call_limit_reset(self, mock_post):
         # At limit, but also into a new month
         self.profile.calls_sent = 50
@@ -23,7 +23,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_msteams(self, mock_post):
         self._setup_data("http://example.com/webhook")
         mock_post.return_value.status_code = 200
@@ -42,7 +42,21 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(payload["summary"], "“_underscores_ & more” is DOWN.")
         self.assertEqual(payload["title"], "“_underscores_ &amp; more” is DOWN.")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
+    def test_msteams_uses_regular_spaces_in_last_ping(self, mock_post):
+        self._setup_data("http://example.com/webhook")
+        self.check.last_ping = now() - td(hours=3, minutes=1)
+        self.check.save()
+        mock_post.return_value.status_code = 200
+
+        self.channel.notify(self.check)
+
+        args, kwargs = mock_post.call_args
+        facts = kwargs["json"]["sections"][0]["facts"]
+        facts = {f["name"]: f["value"] for f in facts}
+        self.assertEqual(facts["Last Ping:"], "3 hours ago")
+
+    @patch("hc.api.transports.httppool.request")
     def test_msteams_escapes_html_and_markdown_in_desc(self, mock_post):
         self._setup_data("http://example.com/webhook")
         mock_post.return_value.status_code = 200
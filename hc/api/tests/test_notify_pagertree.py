@@ -23,7 +23,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pagertree(self, mock_post):
         self._setup_data("123")
         mock_post.return_value.status_code = 200
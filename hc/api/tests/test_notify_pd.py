@@ -24,7 +24,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pd(self, mock_post):
         self._setup_data("123")
         mock_post.return_value.status_code = 200
@@ -37,7 +37,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(payload["event_type"], "trigger")
         self.assertEqual(payload["service_key"], "123")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pd_complex(self, mock_post):
         self._setup_data(json.dumps({"service_key": "456"}))
         mock_post.return_value.status_code = 200
@@ -23,7 +23,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pushover(self, mock_post):
         self._setup_data("123|0")
         mock_post.return_value.status_code = 200
@@ -35,7 +35,7 @@ class NotifyTestCase(BaseTestCase):
         payload = kwargs["data"]
         self.assertIn("DOWN", payload["title"])
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_pushover_up_priority(self, mock_post):
         self._setup_data("123|0|2", status="up")
         mock_post.return_value.status_code = 200
@@ -51,7 +51,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertIn("expire", payload)
 
     @override_settings(SECRET_KEY="test-secret")
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_obeys_rate_limit(self, mock_post):
         self._setup_data("123|0")
 
@@ -25,7 +25,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_slack(self, mock_post):
         self._setup_data("123")
         mock_post.return_value.status_code = 200
@@ -39,7 +39,21 @@ class NotifyTestCase(BaseTestCase):
         fields = {f["title"]: f["value"] for f in attachment["fields"]}
         self.assertEqual(fields["Last Ping"], "an hour ago")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
+    def test_slack_uses_regular_spaces_in_last_ping(self, mock_post):
+        self._setup_data("123")
+        self.check.last_ping = now() - td(hours=3, minutes=1)
+        self.check.save()
+        mock_post.return_value.status_code = 200
+
+        self.channel.notify(self.check)
+
+        args, kwargs = mock_post.call_args
+        attachment = kwargs["json"]["attachments"][0]
+        fields = {f["title"]: f["value"] for f in attachment["fields"]}
+        self.assertEqual(fields["Last Ping"], "3 hours ago")
+
+    @patch("hc.api.transports.httppool.request")
     def test_slack_with_complex_value(self, mock_post):
         v = json.dumps({"incoming_webhook": {"url": "123"}})
         self._setup_data(v)
@@ -51,7 +65,7 @@ class NotifyTestCase(BaseTestCase):
         args, kwargs = mock_post.call_args
         self.assertEqual(args[1], "123")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_slack_handles_500(self, mock_post):
         self._setup_data("123")
         mock_post.return_value.status_code = 500
@@ -61,7 +75,7 @@ class NotifyTestCase(BaseTestCase):
         n = Notification.objects.get()
         self.assertEqual(n.error, "Received status code 500")
 
-    @patch("hc.api.transports.requests.request", side_effect=Timeout)
+    @patch("hc.api.transports.httppool.request", side_effect=Timeout)
     def test_slack_handles_timeout(self, mock_post):
         self._setup_data("123")
 
@@ -70,7 +84,7 @@ class NotifyTestCase(BaseTestCase):
         n = Notification.objects.get()
         self.assertEqual(n.error, "Connection timed out")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_slack_with_tabs_in_schedule(self, mock_post):
         self._setup_data("123")
         self.check.kind = "cron"
@@ -89,3 +103,19 @@ class NotifyTestCase(BaseTestCase):
 
         n = Notification.objects.get()
         self.assertEqual(n.error, "Slack notifications are not enabled.")
+
+    @patch("hc.api.transports.httppool.request")
+    def test_slack_with_special_characters(self, mock_post):
+        self._setup_data("123")
+        self.check.name = 'Foo "bar" <baz>\n'
+        self.check.tags = "a\\b"
+        self.check.save()
+        mock_post.return_value.status_code = 200
+
+        self.channel.notify(self.check)
+
+        args, kwargs = mock_post.call_args
+        attachment = kwargs["json"]["attachments"][0]
+        self.assertEqual(attachment["text"], "“Foo \"bar\" <baz>\n” is DOWN.")
+        fields = {f["title"]: f["value"] for f in attachment["fields"]}
+        self.assertEqual(fields["Tags"], "`a\\b` ")
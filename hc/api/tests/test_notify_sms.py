@@ -22,7 +22,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_works(self, mock_post):
         self._setup_data("+1234567890")
         self.check.last_ping = now() - td(hours=2)
@@ -44,7 +44,7 @@ class NotifyTestCase(BaseTestCase):
         self.profile.refresh_from_db()
         self.assertEqual(self.profile.sms_sent, 1)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_handles_json_value(self, mock_post):
         value = {"label": "foo", "value": "+1234567890"}
         self._setup_data(json.dumps(value))
@@ -59,7 +59,7 @@ class NotifyTestCase(BaseTestCase):
         payload = kwargs["data"]
         self.assertEqual(payload["To"], "+1234567890")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_enforces_limit(self, mock_post):
         # At limit already:
         self.profile.last_sms_date = now()
@@ -81,7 +81,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(email.to[0], "alice@example.org")
         self.assertEqual(email.subject, "Monthly SMS Limit Reached")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_resets_limit_next_month(self, mock_post):
         # At limit, but also into a new month
         self.profile.sms_sent = 50
@@ -94,7 +94,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.notify(self.check)
         self.assertTrue(mock_post.called)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_does_not_escape_special_characters(self, mock_post):
         self._setup_data("+1234567890")
         self.check.name = "Foo > Bar & Co"
@@ -25,7 +25,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhook(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -45,7 +45,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             timeout=5,
         )
 
-    @patch("hc.api.transports.requests.request", side_effect=Timeout)
+    @patch("hc.api.transports.httppool.request", side_effect=Timeout)
     def test_webhooks_handle_timeouts(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -66,7 +66,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         self.channel.refresh_from_db()
         self.assertEqual(self.channel.last_error, "Connection timed out")
 
-    @patch("hc.api.transports.requests.request", side_effect=ConnectionError)
+    @patch("hc.api.transports.httppool.request", side_effect=ConnectionError)
     def test_webhooks_handle_connection_errors(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -83,7 +83,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         n = Notification.objects.get()
         self.assertEqual(n.error, "Connection failed")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_500(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -103,7 +103,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         n = Notification.objects.get()
         self.assertEqual(n.error, "Received status code 500")
 
-    @patch("hc.api.transports.requests.request", side_effect=Timeout)
+    @patch("hc.api.transports.httppool.request", side_effect=Timeout)
     def test_webhooks_dont_retry_when_sending_test_notifications(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -121,7 +121,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         n = Notification.objects.get()
         self.assertEqual(n.error, "Connection timed out")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_support_variables(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -145,7 +145,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         self.assertEqual(kwargs["headers"], {"User-Agent": "healthchecks.io"})
         self.assertEqual(kwargs["timeout"], 5)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_variable_variables(self, mock_get):
         definition = {
             "method_down": "GET",
@@ -164,7 +164,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         args, kwargs = mock_get.call_args
         self.assertEqual(args[1], "http://host/$TAG1")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_support_post(self, mock_request):
         definition = {
             "method_down": "POST",
@@ -185,7 +185,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         payload = kwargs["data"].decode()
         self.assertTrue(payload.startswith("The Time Is 2"))
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_dollarsign_escaping(self, mock_get):
         # If name or tag contains what looks like a variable reference,
         # that should be left alone:
@@ -208,7 +208,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             "get", url, headers={"User-Agent": "healthchecks.io"}, timeout=5
         )
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_up_events(self, mock_get):
         definition = {
             "method_up": "GET",
@@ -224,7 +224,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             "get", "http://bar", headers={"User-Agent": "healthchecks.io"}, timeout=5
         )
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_noop_up_events(self, mock_get):
         definition = {
             "method_up": "GET",
@@ -239,7 +239,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         self.assertFalse(mock_get.called)
         self.assertEqual(Notification.objects.count(), 0)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_unicode_post_body(self, mock_request):
         definition = {
             "method_down": "POST",
@@ -257,7 +257,7 @@ class NotifyWebhookTestCase(BaseTestCase):
         # unicode should be encoded into utf-8
         self.assertIsInstance(kwargs["data"], bytes)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_post_headers(self, mock_request):
         definition = {
             "method_down": "POST",
@@ -274,7 +274,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             "post", "http://foo.com", data=b"data", headers=headers, timeout=5
         )
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_handle_get_headers(self, mock_request):
         definition = {
             "method_down": "GET",
@@ -291,7 +291,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             "get", "http://foo.com", headers=headers, timeout=5
         )
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_allow_user_agent_override(self, mock_request):
         definition = {
             "method_down": "GET",
@@ -308,7 +308,7 @@ class NotifyWebhookTestCase(BaseTestCase):
             "get", "http://foo.com", headers=headers, timeout=5
         )
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_webhooks_support_variables_in_headers(self, mock_request):
         definition = {
             "method_down": "GET",
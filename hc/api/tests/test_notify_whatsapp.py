@@ -22,7 +22,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_works(self, mock_post):
         definition = {"value": "+1234567890", "up": True, "down": True}
 
@@ -45,7 +45,7 @@ class NotifyTestCase(BaseTestCase):
         self.profile.refresh_from_db()
         self.assertEqual(self.profile.sms_sent, 1)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_obeys_up_down_flags(self, mock_post):
         definition = {"value": "+1234567890", "up": True, "down": False}
 
@@ -57,7 +57,7 @@ class NotifyTestCase(BaseTestCase):
 
         self.assertFalse(mock_post.called)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_enforces_limit(self, mock_post):
         # At limit already:
         self.profile.last_sms_date = now()
@@ -80,7 +80,7 @@ class NotifyTestCase(BaseTestCase):
         self.assertEqual(email.to[0], "alice@example.org")
         self.assertEqual(email.subject, "Monthly WhatsApp Limit Reached")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_does_not_escape_special_characters(self, mock_post):
         definition = {"value": "+1234567890", "up": True, "down": True}
 
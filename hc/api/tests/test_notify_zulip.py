@@ -24,7 +24,7 @@ class NotifyTestCase(BaseTestCase):
         self.channel.save()
         self.channel.checks.add(self.check)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_zulip(self, mock_post):
         definition = {
             "bot_email": "bot@example.org",
@@ -46,7 +46,7 @@ class NotifyTestCase(BaseTestCase):
         payload = kwargs["data"]
         self.assertIn("DOWN", payload["topic"])
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_zulip_returns_error(self, mock_post):
         definition = {
             "bot_email": "bot@example.org",
@@ -63,7 +63,7 @@ class NotifyTestCase(BaseTestCase):
         n = Notification.objects.first()
         self.assertEqual(n.error, 'Received status code 403 with a message: "Nice try"')
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_zulip_uses_site_parameter(self, mock_post):
         definition = {
             "bot_email": "bot@example.org",
@@ -3,7 +3,7 @@ from datetime import timedelta as td
 from django.test import Client
 from django.test.utils import override_settings
 from django.utils.timezone import now
-from hc.api.models import Check, Flip, Ping
+from hc.api.models import Check, Flip, Ping, PingBody
 from hc.test import BaseTestCase
 
 
@@ -204,6 +204,31 @@ class PingTestCase(BaseTestCase):
         self.assertEqual(ping.method, "POST")
         self.assertEqual(ping.body, "hello")
 
+    @override_settings(PING_BODY_LIMIT=5)
+    def test_it_accepts_body_larger_than_upload_limit(self):
+        body = "hello world" * 1000000
+        r = self.client.post(self.url, body, content_type="text/plain")
+        self.assertEqual(r.status_code, 200)
+
+        ping = Ping.objects.latest("id")
+        self.assertEqual(ping.body, "hello")
+
+    @override_settings(PING_BODY_LIMIT=10)
+    def test_it_handles_multibyte_characters(self):
+        body = "žluťoučký kůň"
+        self.client.post(self.url, body, content_type="text/plain")
+
+        ping = Ping.objects.latest("id")
+        self.assertEqual(ping.body, "žluťoučký ")
+
+    @override_settings(PING_BODY_LIMIT=5)
+    def test_it_looks_for_confirmation_link_in_stored_body(self):
+        payload = "Hello, please confirm ..."
+        self.client.post(self.url, data=payload, content_type="text/plain")
+
+        self.check.refresh_from_db()
+        self.assertFalse(self.check.has_confirmation_link)
+
     @override_settings(PING_BODY_LIMIT=None)
     def test_it_allows_unlimited_body(self):
         self.client.post(self.url, "A" * 20000, content_type="text/plain")
@@ -211,6 +236,51 @@ class PingTestCase(BaseTestCase):
         ping = Ping.objects.latest("id")
         self.assertEqual(len(ping.body), 20000)
 
+    @override_settings(PING_BODY_COMPRESSION=True)
+    def test_it_stores_compressed_body(self):
+        self.client.post(self.url, "hello world", content_type="text/plain")
+
+        ping = Ping.objects.latest("id")
+        self.assertIsNone(ping.body)
+        self.assertEqual(ping.get_body(), "hello world")
+
+    @override_settings(PING_BODY_COMPRESSION=True)
+    def test_it_deduplicates_compressed_bodies(self):
+        self.client.post(self.url, "hello world", content_type="text/plain")
+        self.client.post(self.url, "hello world", content_type="text/plain")
+        self.client.post(self.url, "hello", content_type="text/plain")
+
+        self.assertEqual(Ping.objects.count(), 3)
+        self.assertEqual(PingBody.objects.count(), 2)
+
+    @override_settings(PING_BODY_COMPRESSION=True)
+    def test_it_does_not_store_empty_body(self):
+        self.client.get(self.url)
+
+        ping = Ping.objects.latest("id")
+        self.assertIsNone(ping.body_blob)
+        self.assertFalse(PingBody.objects.exists())
+
+    @override_settings(PING_LOG_RING_BUFFER=True)
+    def test_it_trims_ping_log(self):
+        self.profile.ping_log_limit = 2
+        self.profile.save()
+
+        for i in range(4):
+            self.client.get(self.url)
+
+        ns = list(Ping.objects.order_by("n").values_list("n", flat=True))
+        self.assertEqual(ns, [3, 4])
+
+    def test_it_does_not_trim_ping_log_by_default(self):
+        self.profile.ping_log_limit = 2
+        self.profile.save()
+
+        for i in range(4):
+            self.client.get(self.url)
+
+        self.assertEqual(Ping.objects.count(), 4)
+
     def test_it_handles_manual_resume_flag(self):
         self.check.status = "paused"
         self.check.manual_resume = True
@@ -247,3 +317,27 @@ class PingTestCase(BaseTestCase):
         ping = Ping.objects.latest("id")
         self.assertEqual(ping.kind, "fail")
         self.assertEqual(ping.exitstatus, 123)
+
+    def test_it_increments_n_pings(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 2)
+
+        ping = Ping.objects.latest("id")
+        self.assertEqual(ping.n, 2)
+
+    def test_it_does_not_overwrite_unrelated_fields(self):
+        check = Check.objects.get(id=self.check.id)
+
+        # Meanwhile, the check gets renamed:
+        self.check.name = "New Name"
+        self.check.save()
+
+        check.ping("1.2.3.4", "http", "get", "", "", "success")
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.name, "New Name")
+        self.assertEqual(self.check.status, "up")
+        self.assertEqual(check.n_pings, 1)
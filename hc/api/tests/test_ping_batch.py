@@ -0,0 +1,95 @@
+import json
+import uuid
+
+from django.test.utils import override_settings
+from hc.api.models import Check, Flip, Ping
+from hc.test import BaseTestCase
+
+
+class PingBatchTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.check = Check.objects.create(project=self.project)
+        self.code = str(self.check.code)
+
+    def post(self, data):
+        return self.client.post(
+            "/api/v1/pings/", json.dumps(data), content_type="application/json"
+        )
+
+    def test_it_works(self):
+        other = Check.objects.create(project=self.project, status="up")
+
+        r = self.post(
+            [
+                {"code": self.code, "action": "start"},
+                {"code": self.code, "body": "hello world"},
+                {"code": str(other.code), "action": "fail"},
+            ]
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r["Access-Control-Allow-Origin"], "*")
+
+        results = [item["result"] for item in r.json()["results"]]
+        self.assertEqual(results, ["OK", "OK", "OK"])
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        self.assertEqual(self.check.n_pings, 2)
+        self.assertIsNone(self.check.last_start)
+        self.assertIsNotNone(self.check.last_duration)
+
+        kinds = list(self.check.ping_set.order_by("n").values_list("kind", flat=True))
+        self.assertEqual(kinds, ["start", None])
+
+        ping = self.check.ping_set.get(n=2)
+        self.assertEqual(ping.body, "hello world")
+        self.assertEqual(ping.method, "POST")
+
+        other.refresh_from_db()
+        self.assertEqual(other.status, "down")
+
+        flips = Flip.objects.order_by("id")
+        self.assertEqual([f.new_status for f in flips], ["up", "down"])
+
+    def test_it_handles_exit_status(self):
+        r = self.post([{"code": self.code, "exitstatus": 3}])
+        self.assertEqual(r.status_code, 200)
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.kind, "fail")
+        self.assertEqual(ping.exitstatus, 3)
+
+    def test_it_reports_unknown_and_invalid_codes(self):
+        missing = str(uuid.uuid4())
+        r = self.post([{"code": missing}, {"code": "foo"}, {"code": self.code}])
+
+        doc = r.json()
+        self.assertEqual(doc["results"][0], {"code": missing, "result": "not found"})
+        self.assertEqual(doc["results"][1], {"code": "foo", "result": "invalid uuid"})
+        self.assertEqual(doc["results"][2], {"code": self.code, "result": "OK"})
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_validates_json(self):
+        r = self.post([{"code": self.code, "action": "ign"}])
+        self.assertEqual(r.status_code, 400)
+
+        r = self.post({"code": self.code})
+        self.assertEqual(r.status_code, 400)
+
+        self.assertFalse(Ping.objects.exists())
+
+    @override_settings(PING_BODY_LIMIT=5)
+    def test_it_chops_long_body(self):
+        self.post([{"code": self.code, "body": "hello world"}])
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.body, "hello")
+
+    def test_it_rejects_get(self):
+        r = self.client.get("/api/v1/pings/")
+        self.assertEqual(r.status_code, 405)
+
+    def test_it_limits_batch_size(self):
+        r = self.post([{"code": self.code}] * 1001)
+        self.assertEqual(r.status_code, 400)
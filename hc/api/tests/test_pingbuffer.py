@@ -0,0 +1,144 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.test import TransactionTestCase
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from hc.accounts.models import Project
+from hc.api.models import Check, Ping, PingBody
+from hc.api.pingbuffer import PingBuffer, dump
+from hc.test import BaseTestCase
+
+
+class PingBufferTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.check = Check.objects.create(project=self.project)
+
+    def _ping(self, n=1):
+        return Ping(owner=self.check, n=n, created=now(), body="hello")
+
+    def test_it_flushes(self):
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=100)
+        buf.add(self._ping(1))
+        buf.add(self._ping(2))
+        self.assertEqual(Ping.objects.count(), 0)
+        self.assertEqual(buf.depth(), 2)
+
+        self.assertEqual(buf.flush(), 2)
+        self.assertEqual(Ping.objects.count(), 2)
+        self.assertEqual(buf.depth(), 0)
+
+    def test_it_flushes_when_full(self):
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=2)
+        buf.add(self._ping(1))
+        buf.add(self._ping(2))
+
+        self.assertEqual(Ping.objects.count(), 2)
+        self.assertEqual(buf.depth(), 0)
+
+    @override_settings(PING_LOG_RING_BUFFER=True)
+    def test_it_trims_ping_log(self):
+        self.profile.ping_log_limit = 2
+        self.profile.save()
+
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=100)
+        for n in range(1, 5):
+            buf.add(self._ping(n))
+
+        buf.flush()
+        self.assertEqual(list(Ping.objects.values_list("n", flat=True)), [3, 4])
+
+    @patch("hc.api.pingbuffer.Ping.objects.bulk_create")
+    def test_it_keeps_pings_on_error(self, mock_bulk_create):
+        mock_bulk_create.side_effect = DatabaseError
+
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=100)
+        buf.add(self._ping())
+
+        with self.assertRaises(DatabaseError):
+            buf.flush()
+
+        self.assertEqual(buf.depth(), 1)
+
+    def test_it_adopts_orphaned_spool_files(self):
+        with TemporaryDirectory() as spool_dir:
+            # A spool file left behind by a crashed process:
+            with open(os.path.join(spool_dir, "123-abc.spool"), "w") as f:
+                f.write(dump(self._ping(7)) + "\n")
+
+            buf = PingBuffer(10, 100, 100, spool_dir=spool_dir)
+            self.assertEqual(buf.depth(), 1)
+            self.assertFalse(os.path.exists(os.path.join(spool_dir, "123-abc.spool")))
+
+            buf.close()
+            self.assertEqual(os.listdir(spool_dir), [])
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.n, 7)
+        self.assertEqual(ping.body, "hello")
+
+    def test_it_leaves_live_spool_files_alone(self):
+        with TemporaryDirectory() as spool_dir:
+            buf1 = PingBuffer(10, 100, 100, spool_dir=spool_dir)
+            buf1.add(self._ping())
+
+            buf2 = PingBuffer(10, 100, 100, spool_dir=spool_dir)
+            self.assertEqual(buf2.depth(), 0)
+            self.assertEqual(len(os.listdir(spool_dir)), 2)
+
+            buf1.close()
+            buf2.close()
+
+        self.assertEqual(Ping.objects.count(), 1)
+
+    @override_settings(PING_BUFFER_ENABLED=True)
+    @patch("hc.api.pingbuffer.add")
+    def test_ping_view_uses_buffer(self, mock_add):
+        r = self.client.get(f"/ping/{self.check.code}")
+        self.assertEqual(r.status_code, 200)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        self.assertEqual(self.check.n_pings, 1)
+
+        ping = mock_add.call_args.args[0]
+        self.assertEqual(ping.n, 1)
+        self.assertEqual(ping.owner_id, self.check.id)
+        self.assertEqual(Ping.objects.count(), 0)
+
+
+class PingBufferOrphansTestCase(TransactionTestCase):
+    # The foreign key constraints are only checked when a transaction
+    # commits, so this test case does not wrap the tests in a transaction
+
+    def setUp(self):
+        alice = User.objects.create(username="alice")
+        project = Project.objects.create(owner=alice)
+        self.a = Check.objects.create(project=project)
+        self.b = Check.objects.create(project=project)
+
+    def test_it_drops_pings_of_deleted_checks(self):
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=100)
+        buf.add(Ping(owner=self.a, n=1, created=now()))
+        buf.add(Ping(owner=self.b, n=1, created=now()))
+        self.a.delete()
+
+        self.assertEqual(buf.flush(), 1)
+        self.assertEqual(buf.depth(), 0)
+        self.assertEqual(Ping.objects.get().owner_id, self.b.id)
+
+    def test_it_drops_pings_with_deleted_bodies(self):
+        body = PingBody.for_text("hello")
+
+        buf = PingBuffer(batch_size=10, flush_interval=100, capacity=100)
+        buf.add(Ping(owner=self.a, n=1, created=now(), body_blob=body))
+        buf.add(Ping(owner=self.b, n=1, created=now(), body="world"))
+        body.delete()
+
+        self.assertEqual(buf.flush(), 1)
+        self.assertEqual(buf.depth(), 0)
+        self.assertEqual(Ping.objects.get().owner_id, self.b.id)
@@ -0,0 +1,158 @@
+from datetime import timedelta as td
+from unittest.mock import patch
+import uuid
+
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils.timezone import now
+from hc.api import pingcache
+from hc.api.models import Check, Flip, Ping
+from hc.test import BaseTestCase
+
+
+@override_settings(PING_CACHE_SIZE=2, PING_CACHE_TTL=60)
+class PingCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        pingcache._cache.clear()
+
+        self.check = Check.objects.create(project=self.project, status="up")
+        self.url = f"/ping/{self.check.code}"
+
+    def test_it_caches_checks(self):
+        pingcache.get_check(self.check.code)
+
+        with self.assertNumQueries(0):
+            check = pingcache.get_check(self.check.code)
+
+        self.assertEqual(check.id, self.check.id)
+        self.assertEqual(check.status, "up")
+
+    def test_it_caches_unknown_codes(self):
+        code = uuid.uuid4()
+        self.assertIsNone(pingcache.get_check(code))
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(pingcache.get_check(code))
+
+    def test_save_evicts_check(self):
+        pingcache.get_check(self.check.code)
+
+        self.check.methods = "POST"
+        self.check.save()
+
+        check = pingcache.get_check(self.check.code)
+        self.assertEqual(check.methods, "POST")
+
+    def test_it_expires_entries(self):
+        pingcache.get_check(self.check.code)
+        Check.objects.filter(id=self.check.id).update(methods="POST")
+
+        later = now().timestamp() + 61
+        with patch("hc.api.pingcache.time.time", return_value=later):
+            check = pingcache.get_check(self.check.code)
+
+        self.assertEqual(check.methods, "POST")
+
+    def test_it_evicts_least_recently_used(self):
+        other = Check.objects.create(project=self.project)
+        pingcache.get_check(self.check.code)
+        pingcache.get_check(other.code)
+        pingcache.get_check(uuid.uuid4())
+
+        self.assertIsNone(pingcache._cache.get(self.check.code))
+        self.assertIsNotNone(pingcache._cache.get(other.code))
+
+    def test_ping_works(self):
+        r = self.client.get(self.url)
+        self.assertEqual(r.status_code, 200)
+
+        r = self.client.get(self.url + "/fail")
+        self.assertEqual(r.status_code, 200)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "down")
+        self.assertEqual(self.check.n_pings, 2)
+
+        flip = Flip.objects.get()
+        self.assertEqual(flip.old_status, "up")
+        self.assertEqual(flip.new_status, "down")
+
+    def test_ping_loads_nothing_else(self):
+        # UPDATE ... RETURNING with INSERT on PostgreSQL,
+        # UPDATE, SELECT n_pings and INSERT on other databases
+        expected = 1 if connection.vendor == "postgresql" else 3
+        # After the first ping, the deadline only moves later, so the pings
+        # don't need to wake up sendalerts
+        self.client.get(self.url)
+
+        for size in (2, 0):
+            with override_settings(PING_CACHE_SIZE=size):
+                check = pingcache.get_check(self.check.code)
+                with self.assertNumQueries(expected):
+                    check.ping("1.2.3.4", "http", "get", "", "", "success")
+
+    def test_ping_handles_stale_status(self):
+        self.client.get(self.url)
+
+        # The check goes down, but the cache still says "up"
+        Check.objects.filter(id=self.check.id).update(status="down")
+
+        self.client.get(self.url)
+
+        flip = Flip.objects.get()
+        self.assertEqual(flip.old_status, "down")
+        self.assertEqual(flip.new_status, "up")
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+        self.assertEqual(Ping.objects.count(), 2)
+
+    def test_ping_handles_stale_manual_resume(self):
+        self.client.get(self.url)
+
+        # Another process pauses the check with manual resume. The cache
+        # in this process still says "up", without manual resume.
+        Check.objects.filter(id=self.check.id).update(
+            status="paused", manual_resume=True
+        )
+
+        self.client.get(self.url)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "paused")
+        self.assertEqual(Ping.objects.last().kind, "ign")
+        self.assertFalse(Flip.objects.exists())
+
+    def test_ping_handles_stale_timeout(self):
+        self.client.get(self.url)
+
+        # Another process changes the period, the cache still has the old one
+        Check.objects.filter(id=self.check.id).update(timeout=td(days=7))
+
+        self.client.get(self.url)
+
+        self.check.refresh_from_db()
+        expected = self.check.last_ping + td(days=7) + self.check.grace
+        self.assertEqual(self.check.alert_after, expected)
+
+        # The fresh values are back in the cache
+        with self.assertNumQueries(0):
+            check = pingcache.get_check(self.check.code)
+        self.assertEqual(check.timeout, td(days=7))
+
+    def test_ping_handles_stale_methods(self):
+        self.client.get(self.url)
+
+        # Another process allows only POST requests
+        Check.objects.filter(id=self.check.id).update(methods="POST")
+
+        self.client.get(self.url)
+        self.assertEqual(Ping.objects.last().kind, "ign")
+
+    def test_ping_handles_deleted_check(self):
+        self.client.get(self.url)
+        Check.objects.filter(id=self.check.id).delete()
+
+        r = self.client.get(self.url)
+        self.assertEqual(r.status_code, 404)
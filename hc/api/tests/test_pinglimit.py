@@ -0,0 +1,114 @@
+from unittest.mock import patch
+
+from django.test.utils import override_settings
+from hc.api import pinglimit
+from hc.api.models import Check, Ping
+from hc.api.pinglimit import RateLimiter
+from hc.test import BaseTestCase
+
+
+@patch("hc.api.pinglimit.time.time")
+class RateLimiterTestCase(BaseTestCase):
+    def test_it_works(self, mock_time):
+        mock_time.return_value = 1000.0
+        limiter = RateLimiter(2, 60)
+
+        self.assertTrue(limiter.authorize("a"))
+        self.assertTrue(limiter.authorize("a"))
+        self.assertFalse(limiter.authorize("a"))
+        # Other keys have separate buckets
+        self.assertTrue(limiter.authorize("b"))
+
+    def test_it_refills(self, mock_time):
+        mock_time.return_value = 1000.0
+        limiter = RateLimiter(2, 60)
+        limiter.authorize("a")
+        limiter.authorize("a")
+
+        # One token every 30 seconds
+        mock_time.return_value = 1029.0
+        self.assertFalse(limiter.authorize("a"))
+        mock_time.return_value = 1031.0
+        self.assertTrue(limiter.authorize("a"))
+
+    def test_it_counts_suppressed(self, mock_time):
+        mock_time.return_value = 1000.0
+        limiter = RateLimiter(1, 60)
+        limiter.authorize("a")
+        limiter.authorize("a")
+        limiter.authorize("a")
+
+        self.assertEqual(limiter.pop_suppressed("a"), 2)
+        self.assertEqual(limiter.pop_suppressed("a"), 0)
+        self.assertEqual(limiter.pop_suppressed("b"), 0)
+
+    def test_it_purges_full_buckets(self, mock_time):
+        mock_time.return_value = 1000.0
+        limiter = RateLimiter(2, 60)
+        limiter.authorize("a")
+        limiter.authorize("b")
+        limiter.authorize("b")
+        limiter.authorize("b")
+
+        mock_time.return_value = 1100.0
+        limiter.authorize("c")
+
+        # "a" is full again, "b" has unreported suppressed pings
+        self.assertEqual(set(limiter.buckets.keys()), {"b", "c"})
+
+
+@override_settings(PING_RATE_LIMIT=2)
+class PingRateLimitTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        pinglimit._limiter = None
+        self.check = Check.objects.create(project=self.project)
+        self.url = f"/ping/{self.check.code}"
+
+    def tearDown(self):
+        pinglimit._limiter = None
+        super().tearDown()
+
+    def test_it_rate_limits(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+        r = self.client.get(self.url)
+        self.assertEqual(r.status_code, 429)
+        self.assertEqual(r["Access-Control-Allow-Origin"], "*")
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 2)
+
+    @patch("hc.api.pinglimit.time.time")
+    def test_it_records_suppressed_pings(self, mock_time):
+        mock_time.return_value = 1000.0
+        for i in range(5):
+            self.client.get(self.url)
+
+        mock_time.return_value = 1060.0
+        r = self.client.get(self.url)
+        self.assertEqual(r.status_code, 200)
+
+        ping = Ping.objects.latest("id")
+        self.assertEqual(ping.n, 3)
+        self.assertEqual(ping.suppressed, 3)
+
+    def test_it_rate_limits_batch_pings(self):
+        payload = [{"code": str(self.check.code)}] * 3
+        r = self.client.post("/api/v1/pings/", payload, content_type="application/json")
+
+        results = [item["result"] for item in r.json()["results"]]
+        self.assertEqual(results, ["OK", "OK", "rate limited"])
+
+    @override_settings(PING_RATE_LIMIT=0)
+    def test_it_can_be_disabled(self):
+        for i in range(5):
+            r = self.client.get(self.url)
+            self.assertEqual(r.status_code, 200)
+
+    def test_log_shows_suppressed_pings(self):
+        Ping.objects.create(owner=self.check, n=1, suppressed=42)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get(f"/checks/{self.check.code}/log/")
+        self.assertContains(r, "+42 rate limited", status_code=200)
@@ -0,0 +1,275 @@
+import asyncio
+from concurrent.futures import Executor, Future
+import queue
+from threading import Thread
+from unittest.mock import patch
+
+from django.test.utils import override_settings
+
+from hc.api import pinglimit
+from hc.api.management.commands.pingserver import PingServer
+from hc.api.models import Check, Flip, Ping
+from hc.test import BaseTestCase
+
+
+class MainThreadExecutor(Executor):
+    """ Runs the submitted database work in the test's thread.
+
+    This way the database work happens inside the test's transaction.
+
+    """
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.queue.put((future, fn, args, kwargs))
+        return future
+
+    def run_until_done(self, done):
+        while not done.done():
+            try:
+                future, fn, args, kwargs = self.queue.get(timeout=0.01)
+            except queue.Empty:
+                continue
+
+            future.set_result(fn(*args, **kwargs))
+
+
+class PingServerTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.check = Check.objects.create(project=self.project)
+
+        # The requests are handled inside the test's transaction,
+        # don't let them close the connection
+        patcher = patch("hc.api.management.commands.pingserver.close_old_connections")
+        self.close_old_connections = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def send(self, *payloads):
+        """ Send raw requests over a single connection, return the response. """
+
+        executor = MainThreadExecutor()
+
+        async def scenario():
+            server = await PingServer(executor).start("127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                for payload in payloads:
+                    writer.write(payload)
+                response = await asyncio.wait_for(reader.read(), 5)
+                writer.close()
+                return response.decode()
+
+        loop = asyncio.new_event_loop()
+        t = Thread(target=loop.run_forever)
+        t.start()
+        try:
+            done = asyncio.run_coroutine_threadsafe(scenario(), loop)
+            executor.run_until_done(done)
+            return done.result()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            t.join()
+            loop.close()
+
+    def get(self, path, extra=""):
+        return f"GET {path} HTTP/1.0\r\n{extra}\r\n".encode()
+
+    def test_it_works(self):
+        r = self.send(self.get(f"/ping/{self.check.code}"))
+        self.assertTrue(r.startswith("HTTP/1.1 200 OK\r\n"))
+        self.assertIn("Access-Control-Allow-Origin: *\r\n", r)
+        self.assertTrue(r.endswith("\r\n\r\nOK"))
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.method, "GET")
+        self.assertEqual(ping.remote_addr, "127.0.0.1")
+        self.assertEqual(ping.kind, None)
+
+    def test_it_handles_trailing_slash(self):
+        r = self.send(self.get(f"/ping/{self.check.code}/"))
+        self.assertTrue(r.startswith("HTTP/1.1 200 OK\r\n"))
+
+    def test_fail_works(self):
+        self.send(self.get(f"/ping/{self.check.code}/fail"))
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "down")
+        self.assertEqual(Flip.objects.get().new_status, "down")
+
+    def test_start_works(self):
+        self.send(self.get(f"/ping/{self.check.code}/start"))
+
+        self.check.refresh_from_db()
+        self.assertIsNotNone(self.check.last_start)
+        self.assertEqual(Ping.objects.get().kind, "start")
+
+    def test_exit_status_works(self):
+        self.send(self.get(f"/ping/{self.check.code}/7"))
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.kind, "fail")
+        self.assertEqual(ping.exitstatus, 7)
+
+    def test_post_works(self):
+        payload = (
+            f"POST /ping/{self.check.code} HTTP/1.0\r\n"
+            "Content-Length: 11\r\n"
+            "User-Agent: test-agent\r\n"
+            "X-Forwarded-For: 1.2.3.4, 5.6.7.8\r\n"
+            "X-Forwarded-Proto: https\r\n"
+            "\r\n"
+            "hello world"
+        )
+        r = self.send(payload.encode())
+        self.assertTrue(r.startswith("HTTP/1.1 200 OK\r\n"))
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.method, "POST")
+        self.assertEqual(ping.body, "hello world")
+        self.assertEqual(ping.ua, "test-agent")
+        self.assertEqual(ping.remote_addr, "1.2.3.4")
+        self.assertEqual(ping.scheme, "https")
+
+    def test_it_handles_chunked_body(self):
+        payload = (
+            f"POST /ping/{self.check.code} HTTP/1.1\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+        )
+        self.send(payload.encode())
+
+        self.assertEqual(Ping.objects.get().body, "hello world")
+
+    @override_settings(PING_BODY_LIMIT=5)
+    def test_it_reads_bounded_body(self):
+        body = "hello world" * 10000
+        first = (
+            f"POST /ping/{self.check.code} HTTP/1.1\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "\r\n"
+            f"{body}"
+        )
+        second = f"GET /ping/{self.check.code} HTTP/1.1\r\nConnection: close\r\n\r\n"
+        r = self.send(first.encode(), second.encode())
+        self.assertEqual(r.count("HTTP/1.1 200 OK"), 2)
+
+        bodies = list(Ping.objects.order_by("n").values_list("body", flat=True))
+        self.assertEqual(bodies, ["hello", ""])
+
+    @override_settings(PING_BODY_LIMIT=5)
+    def test_it_reads_bounded_chunked_body(self):
+        payload = (
+            f"POST /ping/{self.check.code} HTTP/1.1\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "5\r\nhello\r\n6\r\n world\r\n0\r\n\r\n"
+        )
+        self.send(payload.encode())
+
+        self.assertEqual(Ping.objects.get().body, "hello")
+
+    def test_it_handles_expect_continue(self):
+        payload = (
+            f"POST /ping/{self.check.code} HTTP/1.1\r\n"
+            "Content-Length: 5\r\n"
+            "Expect: 100-continue\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "hello"
+        )
+        r = self.send(payload.encode())
+        self.assertTrue(r.startswith("HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 200 OK"))
+
+    def test_it_keeps_connection_alive(self):
+        first = f"GET /ping/{self.check.code}/start HTTP/1.1\r\n\r\n"
+        second = f"GET /ping/{self.check.code} HTTP/1.1\r\nConnection: close\r\n\r\n"
+        r = self.send(first.encode(), second.encode())
+        self.assertEqual(r.count("HTTP/1.1 200 OK"), 2)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.n_pings, 2)
+
+    def test_head_has_no_body(self):
+        payload = f"HEAD /ping/{self.check.code} HTTP/1.0\r\n\r\n"
+        r = self.send(payload.encode())
+        self.assertTrue(r.startswith("HTTP/1.1 200 OK"))
+        self.assertTrue(r.endswith("\r\n\r\n"))
+
+    def test_it_handles_missing_check(self):
+        r = self.send(self.get("/ping/07c2f548-9850-4b27-af5d-6c9dc157ec02"))
+        self.assertTrue(r.startswith("HTTP/1.1 404 Not Found"))
+
+    @override_settings(PING_RATE_LIMIT=1)
+    def test_it_handles_rate_limit(self):
+        pinglimit._limiter = None
+        first = f"GET /ping/{self.check.code} HTTP/1.1\r\n\r\n"
+        second = f"GET /ping/{self.check.code} HTTP/1.1\r\nConnection: close\r\n\r\n"
+        r = self.send(first.encode(), second.encode())
+        pinglimit._limiter = None
+
+        self.assertIn("HTTP/1.1 429 Too Many Requests", r)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_rejects_other_paths(self):
+        r = self.send(self.get(f"/api/v1/checks/{self.check.code}"))
+        self.assertTrue(r.startswith("HTTP/1.1 404 Not Found"))
+
+        r = self.send(self.get(f"/ping/{self.check.code}/start/"))
+        self.assertTrue(r.startswith("HTTP/1.1 404 Not Found"))
+        self.assertFalse(Ping.objects.exists())
+
+    def test_it_rejects_malformed_request(self):
+        r = self.send(b"HELLO\r\n\r\n")
+        self.assertTrue(r.startswith("HTTP/1.1 400 Bad Request"))
+
+    def test_it_rejects_long_lines(self):
+        r = self.send(self.get("/ping/" + "a" * 10000))
+        self.assertTrue(r.startswith("HTTP/1.1 400 Bad Request"))
+
+    def test_it_requires_post_if_configured(self):
+        self.check.methods = "POST"
+        self.check.save()
+
+        self.send(self.get(f"/ping/{self.check.code}"))
+        self.assertEqual(Ping.objects.get().kind, "ign")
+
+    def test_it_closes_old_connections(self):
+        self.send(self.get(f"/ping/{self.check.code}"))
+        # Before and after the request
+        self.assertEqual(self.close_old_connections.call_count, 2)
+
+    @patch("hc.api.management.commands.pingserver.IDLE_TIMEOUT", 0.1)
+    def test_it_closes_idle_connection(self):
+        first = f"GET /ping/{self.check.code} HTTP/1.1\r\n\r\n"
+        r = self.send(first.encode())
+        self.assertTrue(r.startswith("HTTP/1.1 200 OK"))
+        self.assertEqual(r.count("HTTP/1.1"), 1)
+
+    @patch("hc.api.management.commands.pingserver.HEADER_TIMEOUT", 0.1)
+    def test_it_times_out_slow_headers(self):
+        r = self.send(f"GET /ping/{self.check.code} HTTP/1.1\r\n".encode())
+        self.assertEqual(r, "")
+        self.assertFalse(Ping.objects.exists())
+
+    @patch("hc.api.management.commands.pingserver.BODY_TIMEOUT", 0.1)
+    def test_it_times_out_slow_body(self):
+        payload = (
+            f"POST /ping/{self.check.code} HTTP/1.1\r\n"
+            "Content-Length: 11\r\n"
+            "\r\n"
+            "hello"
+        )
+        r = self.send(payload.encode())
+        self.assertEqual(r, "")
+        self.assertFalse(Ping.objects.exists())
@@ -0,0 +1,122 @@
+import socket
+from unittest.mock import patch
+
+from django.db import DatabaseError
+from hc.api.management.commands.pingudp import Listener, parse
+from hc.api.models import Check, Ping
+from hc.test import BaseTestCase
+
+
+class PingUdpTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.check = Check.objects.create(project=self.project)
+
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(5)
+        self.listener = Listener(self.sock, batch_size=10, capacity=2)
+
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.client.close()
+        self.sock.close()
+        super().tearDown()
+
+    def send(self, *datagrams):
+        for datagram in datagrams:
+            self.client.sendto(datagram, self.sock.getsockname())
+            self.listener.receive()
+
+    def test_it_works(self):
+        self.send(f"{self.check.code}".encode())
+        self.assertEqual(self.listener.process_batch(timeout=0), 1)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "up")
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.scheme, "udp")
+        self.assertEqual(ping.remote_addr, "127.0.0.1")
+        self.assertEqual(ping.kind, None)
+
+    def test_it_handles_start_and_fail(self):
+        code = self.check.code
+        self.send(f"{code} start".encode(), f"{code} fail".encode())
+        self.listener.process_batch(timeout=0)
+
+        self.check.refresh_from_db()
+        self.assertEqual(self.check.status, "down")
+
+        kinds = list(Ping.objects.order_by("n").values_list("kind", flat=True))
+        self.assertEqual(kinds, ["start", "fail"])
+
+    def test_it_handles_exitstatus(self):
+        self.send(f"{self.check.code} 1".encode())
+        self.listener.process_batch(timeout=0)
+
+        ping = Ping.objects.get()
+        self.assertEqual(ping.kind, "fail")
+        self.assertEqual(ping.exitstatus, 1)
+
+    def test_it_handles_multiple_lines(self):
+        self.send(f"{self.check.code}\n\n{self.check.code} start\n".encode())
+        self.listener.process_batch(timeout=0)
+
+        self.assertEqual(Ping.objects.count(), 2)
+        self.assertEqual(self.listener.invalid, 0)
+
+    def test_it_counts_invalid_lines(self):
+        self.send(b"not-a-uuid\n" + f"{self.check.code}".encode(), b"\xff\xfe")
+        self.listener.process_batch(timeout=0)
+
+        self.assertEqual(self.listener.invalid, 2)
+        self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_counts_unknown_checks(self):
+        self.send(b"07c2f548-9850-4b27-af5d-6c9dc157ec02")
+        self.listener.process_batch(timeout=0)
+
+        self.assertEqual(self.listener.not_found, 1)
+        self.assertFalse(Ping.objects.exists())
+
+    def test_it_drops_datagrams_when_queue_is_full(self):
+        code = f"{self.check.code}".encode()
+        self.send(code, code, code)
+
+        self.assertEqual(self.listener.received, 3)
+        self.assertEqual(self.listener.dropped, 1)
+
+        self.listener.process_batch(timeout=0)
+        self.assertEqual(Ping.objects.count(), 2)
+
+    def test_it_respects_batch_size(self):
+        self.listener.batch_size = 1
+        code = f"{self.check.code}".encode()
+        self.send(code, code)
+
+        self.assertEqual(self.listener.process_batch(timeout=0), 1)
+        self.assertEqual(self.listener.process_batch(timeout=0), 1)
+        self.assertEqual(self.listener.process_batch(timeout=0), 0)
+
+    @patch("hc.api.management.commands.pingudp.connection")
+    @patch("hc.api.management.commands.pingudp.process_ping")
+    def test_it_counts_database_errors_as_dropped(self, process_ping, connection):
+        process_ping.side_effect = DatabaseError
+
+        self.send(f"{self.check.code}".encode())
+        self.listener.process_batch(timeout=0)
+
+        self.assertEqual(self.listener.dropped, 1)
+        self.assertTrue(connection.close.called)
+
+    def test_parse_works(self):
+        code = "07c2f548-9850-4b27-af5d-6c9dc157ec02"
+        self.assertEqual(parse(code)[1:], ("success", None))
+        self.assertEqual(parse(code + " start")[1:], ("start", None))
+        self.assertEqual(parse(code + " 0")[1:], ("success", 0))
+
+        for line in ("", "hello", code + " 256", code + " foo", code[:-1] + "x"):
+            with self.assertRaises(ValueError):
+                parse(line)
@@ -1,8 +1,9 @@
 from datetime import timedelta
+from unittest.mock import patch
 
 from django.utils import timezone
 from hc.api.management.commands.prunepings import Command
-from hc.api.models import Check, Ping
+from hc.api.models import Check, Ping, PingBody
 from hc.test import BaseTestCase
 
 
@@ -22,3 +23,45 @@ class PrunePingsTestCase(BaseTestCase):
         Command().handle()
 
         self.assertEqual(Ping.objects.count(), 1)
+
+    def test_it_removes_unused_bodies(self):
+        c = Check.objects.create(project=self.project, n_pings=1)
+        used = PingBody.for_text("used")
+        PingBody.for_text("unused")
+        PingBody.objects.update(last_used=self.year_ago)
+        Ping.objects.create(owner=c, n=1, body_blob=used)
+
+        Command().handle()
+
+        self.assertEqual(PingBody.objects.get().get_text(), "used")
+
+    def test_it_keeps_recently_used_bodies(self):
+        # A ping referencing this body may be about to be saved
+        PingBody.for_text("hello")
+
+        Command().handle()
+
+        self.assertEqual(PingBody.objects.count(), 1)
+
+    def test_reusing_a_body_protects_it(self):
+        PingBody.for_text("hello")
+        PingBody.objects.update(last_used=self.year_ago)
+
+        body = PingBody.for_text("hello")
+        Command().handle()
+
+        self.assertTrue(PingBody.objects.filter(id=body.id).exists())
+
+    def test_reusing_a_pruned_body_stores_it_again(self):
+        PingBody.for_text("hello")
+        PingBody.objects.update(last_used=self.year_ago)
+
+        def prune_first(**kwargs):
+            # prune() deletes the body just before for_text() updates it
+            PingBody.objects.all().delete()
+            return 0
+
+        with patch("django.db.models.query.QuerySet.update", side_effect=prune_first):
+            body = PingBody.for_text("hello")
+
+        self.assertEqual(PingBody.objects.get(id=body.id).get_text(), "hello")
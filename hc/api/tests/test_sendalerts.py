@@ -1,11 +1,18 @@
 from datetime import timedelta as td
 from io import StringIO
+import os
+import signal
+import threading
+from unittest import skipUnless
 from unittest.mock import Mock, patch
 
-from django.core.management import call_command
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models.query import QuerySet
 from django.utils.timezone import now
-from hc.api.management.commands.sendalerts import Command, notify
+from hc.api.management.commands.sendalerts import Command, Pool, notify, parse_limits
 from hc.api.models import Flip, Check
+from hc.api.shards import NUM_SHARDS, shard_of
 from hc.test import BaseTestCase
 
 
@@ -45,8 +52,72 @@ class SendAlertsTestCase(BaseTestCase):
         self.assertEqual(check.status, "down")
         self.assertEqual(check.alert_after, None)
 
-    @patch("hc.api.management.commands.sendalerts.notify_on_thread")
-    def test_it_processes_flip(self, mock_notify):
+    def test_it_handles_checks_in_batches(self):
+        for i in range(3):
+            check = Check(project=self.project, status="up")
+            check.last_ping = now() - td(days=2)
+            check.alert_after = check.last_ping + td(days=1, hours=1)
+            check.save()
+
+        with patch("hc.api.management.commands.sendalerts.GOING_DOWN_BATCH_SIZE", 2):
+            self.assertEqual(Command().handle_going_down(), 2)
+
+        self.assertEqual(Flip.objects.count(), 2)
+        self.assertEqual(Check.objects.filter(status="down").count(), 2)
+
+        self.assertEqual(Command().handle_going_down(), 1)
+        self.assertEqual(Command().handle_going_down(), 0)
+        self.assertEqual(Flip.objects.count(), 3)
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_it_handles_only_its_own_shards(self, mock_notify):
+        check = Check(project=self.project, status="up")
+        check.last_ping = now() - td(days=2)
+        check.alert_after = check.last_ping + td(days=1, hours=1)
+        check.save()
+
+        cmd = Command()
+        cmd.coordinator = Mock()
+        cmd.coordinator.shards = {(shard_of(check.id) + 1) % NUM_SHARDS}
+        self.assertEqual(cmd.handle_going_down(), 0)
+
+        cmd.coordinator.shards = {shard_of(check.id)}
+        self.assertEqual(cmd.handle_going_down(), 1)
+
+        # The flip belongs to the same shard as its check
+        self.assertEqual(cmd.process_flips(use_threads=False), 1)
+
+    @skipUnless(connection.features.has_select_for_update_skip_locked, "no SKIP LOCKED")
+    def test_it_updates_batch_in_constant_number_of_queries(self):
+        for i in range(10):
+            check = Check(project=self.project, status="up")
+            check.last_ping = now() - td(days=2)
+            check.alert_after = check.last_ping + td(days=1, hours=1)
+            check.save()
+
+        # Savepoint, select, update, insert flips, release savepoint
+        with self.assertNumQueries(5):
+            self.assertEqual(Command().handle_going_down(), 10)
+
+        self.assertEqual(Flip.objects.count(), 10)
+
+    @patch("hc.api.models.Check.get_status")
+    def test_it_postpones_check_on_error(self, mock_get_status):
+        mock_get_status.side_effect = ValueError
+
+        check = Check(project=self.project, status="up")
+        check.last_ping = now() - td(days=2)
+        check.alert_after = check.last_ping + td(days=1, hours=1)
+        check.save()
+
+        with self.assertRaises(ValueError):
+            Command().handle_going_down()
+
+        check.refresh_from_db()
+        self.assertEqual(check.status, "up")
+        self.assertGreater(check.alert_after, now())
+
+    def test_it_processes_flip(self):
         check = Check(project=self.project, status="up")
         check.last_ping = now()
         check.alert_after = check.last_ping + td(days=1, hours=1)
@@ -57,20 +128,77 @@ class SendAlertsTestCase(BaseTestCase):
         flip.new_status = "up"
         flip.save()
 
-        result = Command().process_one_flip()
+        cmd = Command()
+        cmd.pool = Mock()
+        cmd.pool.free_slots.return_value = 10
+        result = cmd.process_flips()
 
-        # If it finds work, it should return True
-        self.assertTrue(result)
+        # If it finds work, it should return the number of flips
+        self.assertEqual(result, 1)
 
         # It should set the processed date
         flip.refresh_from_db()
         self.assertTrue(flip.processed)
 
-        # It should call `notify_on_thread`
-        self.assertTrue(mock_notify.called)
+        # It should hand the flip to the worker pool
+        self.assertEqual(cmd.pool.submit.call_args[0][0], flip)
+
+    def test_it_claims_only_as_many_flips_as_pool_can_take(self):
+        check = Check.objects.create(project=self.project, status="up")
+        for i in range(3):
+            Flip.objects.create(
+                owner=check, created=now(), old_status="down", new_status="up"
+            )
 
-    @patch("hc.api.management.commands.sendalerts.notify_on_thread")
-    def test_it_updates_alert_after(self, mock_notify):
+        cmd = Command()
+        cmd.pool = Mock()
+        cmd.pool.free_slots.return_value = 2
+        self.assertEqual(cmd.process_flips(), 2)
+        self.assertEqual(cmd.pool.submit.call_count, 2)
+        self.assertEqual(Flip.objects.filter(processed=None).count(), 1)
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_it_processes_flips_in_batches(self, mock_notify):
+        check = Check.objects.create(project=self.project, status="up")
+        for i in range(3):
+            Flip.objects.create(
+                owner=check, created=now(), old_status="down", new_status="up"
+            )
+
+        cmd = Command()
+        self.assertEqual(cmd.process_flips(use_threads=False, batch_size=2), 2)
+        self.assertEqual(mock_notify.call_count, 2)
+
+        # The flips come with the check and project already loaded
+        flip = mock_notify.call_args[0][0]
+        with self.assertNumQueries(0):
+            flip.owner.project.name
+            list(flip.owner.channel_set.all())
+
+        self.assertEqual(cmd.process_flips(use_threads=False, batch_size=2), 1)
+        self.assertEqual(cmd.process_flips(use_threads=False, batch_size=2), 0)
+        self.assertFalse(Flip.objects.filter(processed=None).exists())
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_it_skips_flips_claimed_by_another_process(self, mock_notify):
+        check = Check.objects.create(project=self.project, status="up")
+        flip = Flip.objects.create(
+            owner=check, created=now(), old_status="down", new_status="up"
+        )
+
+        # Simulate another process claiming the flip just before our UPDATE
+        original_update = QuerySet.update
+
+        def update(qs, **kwargs):
+            original_update(Flip.objects.filter(id=flip.id), processed=now())
+            return original_update(qs, **kwargs)
+
+        with patch.object(QuerySet, "update", update):
+            self.assertEqual(Command().process_flips(use_threads=False), 1)
+
+        self.assertFalse(mock_notify.called)
+
+    def test_it_updates_alert_after(self):
         check = Check(project=self.project, status="up")
         check.last_ping = now() - td(hours=1)
         check.alert_after = check.last_ping
@@ -98,9 +226,102 @@ class SendAlertsTestCase(BaseTestCase):
 
         call_command("sendalerts", loop=False, use_threads=False, stdout=StringIO())
 
-        # It should call `notify` instead of `notify_on_thread`
+        # It should call `notify` directly, instead of using the worker pool
         self.assertTrue(mock_notify.called)
 
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_it_uses_worker_pool(self, mock_notify):
+        check = Check(project=self.project, status="up")
+        check.last_ping = now() - td(days=2)
+        check.alert_after = check.last_ping + td(days=1, hours=1)
+        check.save()
+
+        result = call_command("sendalerts", loop=False, workers=2, stdout=StringIO())
+
+        # call_command waits for the pool to finish
+        self.assertEqual(result, "Sent 1 alert(s)")
+        flip, stdout, limits = mock_notify.call_args[0]
+        self.assertEqual(flip.owner_id, check.id)
+        self.assertEqual(limits, {})
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_it_drains_pool_on_sigterm(self, mock_notify):
+        check = Check.objects.create(project=self.project, status="up")
+        for i in range(3):
+            Flip.objects.create(
+                owner=check, created=now(), old_status="down", new_status="up"
+            )
+
+        def handle_going_down(cmd):
+            # SIGTERM arrives while the command is looking for work
+            os.kill(os.getpid(), signal.SIGTERM)
+            return 0
+
+        prev_handler = signal.getsignal(signal.SIGTERM)
+        with patch.object(Command, "handle_going_down", handle_going_down):
+            result = call_command("sendalerts", stdout=StringIO())
+
+        # It should exit without claiming any flips
+        self.assertEqual(result, "Sent 0 alert(s)")
+        self.assertEqual(Flip.objects.filter(processed=None).count(), 3)
+
+        # It should restore the previous signal handler
+        self.assertEqual(signal.getsignal(signal.SIGTERM), prev_handler)
+
+    def test_pool_waits_for_free_slots(self):
+        pool = Pool(1, Mock())
+        pool.pending = 2
+        self.assertEqual(pool.free_slots(timeout=0), 0)
+        self.assertEqual(pool.queue_depth(), 1)
+
+        pool.pending = 0
+        self.assertEqual(pool.free_slots(timeout=0), 2)
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_pool_survives_exceptions(self, mock_notify):
+        mock_notify.side_effect = ValueError
+        pool = Pool(1, Mock())
+        with patch("hc.api.management.commands.sendalerts.traceback") as tb:
+            pool.submit(Mock())
+            pool.shutdown()
+
+        self.assertTrue(tb.print_exc.called)
+        self.assertEqual(pool.pending, 0)
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_pool_calls_on_done_when_no_longer_full(self, mock_notify):
+        # Hold the first notification until the pool is full
+        release = threading.Event()
+        mock_notify.side_effect = lambda *args: release.wait(5)
+
+        pool = Pool(1, Mock())
+        pool.on_done = Mock()
+        pool.submit(Mock())
+        pool.submit(Mock())
+        self.assertEqual(pool.free_slots(timeout=0), 0)
+
+        release.set()
+        pool.shutdown()
+
+        # Only the first finished call freed a slot in a full pool
+        self.assertEqual(pool.on_done.call_count, 1)
+
+    @patch("hc.api.management.commands.sendalerts.notify")
+    def test_pool_does_not_call_on_done_when_not_full(self, mock_notify):
+        pool = Pool(1, Mock())
+        pool.on_done = Mock()
+        pool.submit(Mock())
+        pool.shutdown()
+
+        self.assertFalse(pool.on_done.called)
+
+    def test_parse_limits_works(self):
+        limits = parse_limits(["email=2", "webhook=5"])
+        self.assertEqual(set(limits.keys()), {"email", "webhook"})
+
+        with self.assertRaises(CommandError):
+            parse_limits(["email"])
+
     def test_it_updates_owners_next_nag_date(self):
         self.profile.nag_period = td(hours=1)
         self.profile.save()
@@ -114,7 +335,7 @@ class SendAlertsTestCase(BaseTestCase):
         flip.new_status = "down"
         flip.save()
 
-        notify(flip.id, Mock())
+        notify(flip, Mock())
 
         self.profile.refresh_from_db()
         self.assertIsNotNone(self.profile.next_nag_date)
@@ -132,7 +353,7 @@ class SendAlertsTestCase(BaseTestCase):
         flip.new_status = "down"
         flip.save()
 
-        notify(flip.id, Mock())
+        notify(flip, Mock())
 
         self.bobs_profile.refresh_from_db()
         self.assertIsNotNone(self.bobs_profile.next_nag_date)
@@ -152,7 +373,7 @@ class SendAlertsTestCase(BaseTestCase):
         flip.new_status = "down"
         flip.save()
 
-        notify(flip.id, Mock())
+        notify(flip, Mock())
 
         self.profile.refresh_from_db()
         self.assertEqual(self.profile.next_nag_date, original_nag_date)
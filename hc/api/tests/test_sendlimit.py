@@ -0,0 +1,105 @@
+from threading import Thread
+import time
+from unittest.mock import Mock, patch
+
+from django.test.utils import override_settings
+from hc.api import sendlimit
+from hc.api.models import Channel, Check
+from hc.api.sendlimit import Throttle
+from hc.api.transports import HttpTransport
+from hc.test import BaseTestCase
+
+
+class ThrottleTestCase(BaseTestCase):
+    def test_it_limits_concurrency(self):
+        throttle = Throttle(1)
+        self.assertTrue(throttle.acquire("a", 0))
+        self.assertFalse(throttle.acquire("a", 0.01))
+        # Other keys are not affected
+        self.assertTrue(throttle.acquire("b", 0))
+
+        throttle.release("a")
+        self.assertTrue(throttle.acquire("a", 0))
+
+    def test_waiting_thread_gets_the_released_slot(self):
+        throttle = Throttle(1)
+        throttle.acquire("a", 0)
+
+        results = []
+        t = Thread(target=lambda: results.append(throttle.acquire("a", 5)))
+        t.start()
+        time.sleep(0.05)
+        throttle.release("a")
+        t.join()
+
+        self.assertEqual(results, [True])
+
+    def test_it_limits_rate(self):
+        throttle = Throttle(10, rate=20)
+        start = time.monotonic()
+        for i in range(3):
+            self.assertTrue(throttle.acquire("a", 5))
+
+        # The second and the third event wait 50ms each
+        self.assertGreater(time.monotonic() - start, 0.09)
+
+    def test_backoff_works(self):
+        throttle = Throttle(1)
+        throttle.backoff("a", 0.1)
+        self.assertFalse(throttle.acquire("a", 0.01))
+        self.assertTrue(throttle.acquire("a", 1))
+
+    def test_slot_raises_throttled(self):
+        throttle = Throttle(1)
+        with throttle.slot("a", 0):
+            with self.assertRaises(sendlimit.Throttled):
+                with throttle.slot("a", 0):
+                    pass
+
+        self.assertEqual(throttle.states, {})
+
+    def test_host_backoff_handles_bad_values(self):
+        with patch("hc.api.sendlimit.Throttle.backoff") as mock_backoff:
+            sendlimit.host_backoff("https://example.org/a", "2")
+            sendlimit.host_backoff("https://example.org/b", None)
+            sendlimit.host_backoff("https://example.org/c", "9999")
+
+        calls = [c[0] for c in mock_backoff.call_args_list]
+        self.assertEqual(
+            calls,
+            [("example.org", 2.0), ("example.org", 1), ("example.org", 60)],
+        )
+
+    @patch("hc.api.transports.httppool.request")
+    def test_transport_backs_off_on_429(self, mock_request):
+        mock_request.return_value.status_code = 429
+        mock_request.return_value.headers = {"Retry-After": "5"}
+
+        with patch("hc.api.transports.sendlimit.host_backoff") as mock_backoff:
+            error = HttpTransport.post("https://example.org", num_tries=1)
+
+        self.assertEqual(error, "Received status code 429")
+        mock_backoff.assert_called_once_with("https://example.org", "5")
+
+    @override_settings(HTTP_HOST_CONCURRENCY=1, HTTP_QUEUE_TIMEOUT=0)
+    @patch("hc.api.transports.httppool.request")
+    def test_transport_gives_up_when_host_is_busy(self, mock_request):
+        with sendlimit.host_slot("https://example.org/other"):
+            error = HttpTransport.post("https://example.org", num_tries=1)
+
+        self.assertIn("too many requests", error)
+        self.assertFalse(mock_request.called)
+
+    @override_settings(HTTP_QUEUE_TIMEOUT=0)
+    def test_channel_notify_gives_up_when_channel_is_busy(self):
+        check = Check.objects.create(project=self.project)
+        channel = Channel.objects.create(project=self.project, kind="webhook")
+        transport = Mock()
+        transport.is_noop.return_value = False
+
+        with sendlimit.channel_slot(channel.code):
+            with patch.object(Channel, "transport", transport):
+                error = channel.notify(check)
+
+        self.assertEqual(error, "Timed out waiting to send")
+        self.assertFalse(transport.notify.called)
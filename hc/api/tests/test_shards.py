@@ -0,0 +1,61 @@
+from datetime import timedelta as td
+
+from django.utils.timezone import now
+from hc.api.models import Check, Lease
+from hc.api.shards import NUM_SHARDS, Coordinator, filter_shards, shard_of
+from hc.test import BaseTestCase
+
+
+class ShardsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.a = Coordinator("a")
+        self.b = Coordinator("b")
+
+    def test_single_worker_takes_all_shards(self):
+        self.assertTrue(self.a.heartbeat())
+        self.assertEqual(self.a.shards, set(range(NUM_SHARDS)))
+
+        # The second heartbeat renews the same leases
+        self.assertFalse(self.a.heartbeat())
+
+    def test_it_rebalances_when_worker_joins(self):
+        self.a.heartbeat()
+
+        # All shards are taken, b has to wait for a to release some
+        self.b.heartbeat()
+        self.assertEqual(self.b.shards, set())
+
+        self.a.heartbeat()
+        self.assertEqual(len(self.a.shards), NUM_SHARDS // 2)
+
+        self.b.heartbeat()
+        self.assertEqual(len(self.b.shards), NUM_SHARDS // 2)
+        self.assertFalse(self.a.shards & self.b.shards)
+
+    def test_it_takes_over_shards_of_dead_worker(self):
+        t = now()
+        self.a.heartbeat(t)
+        self.b.heartbeat(t)
+        self.a.heartbeat(t)
+        self.b.heartbeat(t)
+
+        # b stops sending heartbeats, its leases expire
+        self.a.heartbeat(t + td(seconds=40))
+        self.assertEqual(self.a.shards, set(range(NUM_SHARDS)))
+
+    def test_release_works(self):
+        self.a.heartbeat()
+        self.a.release()
+
+        self.assertEqual(self.a.shards, set())
+        self.assertFalse(Lease.objects.filter(owner="a").exists())
+
+        self.b.heartbeat()
+        self.assertEqual(self.b.shards, set(range(NUM_SHARDS)))
+
+    def test_filter_shards_works(self):
+        checks = [Check.objects.create(project=self.project) for i in range(3)]
+
+        q = filter_shards(Check.objects.all(), "id", {shard_of(checks[1].id)})
+        self.assertEqual(list(q), [checks[1]])
@@ -0,0 +1,24 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+from hc.api import transports
+
+
+class TmplTestCase(TestCase):
+    def setUp(self):
+        transports._templates.clear()
+
+    def tearDown(self):
+        transports._templates.clear()
+
+    @patch("hc.api.transports.get_template", wraps=transports.get_template)
+    def test_it_compiles_each_template_once(self, mock_get_template):
+        transports.tmpl("spike_title.html", check=None)
+        transports.tmpl("spike_title.html", check=None)
+
+        mock_get_template.assert_called_once_with("integrations/spike_title.html")
+
+    def test_it_replaces_nbsp(self):
+        with patch("hc.api.transports.get_template") as mock_get_template:
+            mock_get_template.return_value.render.return_value = " a\xa0b "
+            self.assertEqual(transports.tmpl("foo.html"), "a b")
@@ -1,15 +1,18 @@
 import os
 
 from django.conf import settings
-from django.template.loader import render_to_string
+from django.contrib.humanize.templatetags.humanize import naturaltime
+from django.template.loader import get_template
 from django.utils import timezone
 from django.utils.html import escape
-import json
 import requests
 from urllib.parse import quote, urlencode
 
 from hc.accounts.models import Profile
-from hc.lib import emails
+from hc.api import sendlimit
+from hc.front.templatetags.hc_extras import fix_asterisks
+from hc.lib import emails, httppool
+from hc.lib.date import format_duration
 from hc.lib.string import replace
 
 try:
@@ -26,14 +29,65 @@ except ImportError:
     settings.SIGNAL_CLI_ENABLED = False
 
 
+# Channel kind -> transport class
+REGISTRY = {}
+
+
+def register(*kinds):
+    """ Class decorator, use the decorated transport for the channel kinds.
+
+    Local or third-party transports can use it to add new kinds, or to
+    replace the built-in transports.
+
+    """
+
+    def decorator(cls):
+        for kind in kinds:
+            REGISTRY[kind] = cls
+
+        return cls
+
+    return decorator
+
+
+# Template path -> compiled template
+_templates = {}
+
+
 def tmpl(template_name, **ctx):
     template_path = f"integrations/{template_name}"
+    # Compile each template once per process. Django only caches compiled
+    # templates itself when DEBUG is off.
+    template = _templates.get(template_path)
+    if template is None:
+        template = _templates[template_path] = get_template(template_path)
+
     # \xa0 is non-breaking space. It causes SMS messages to use UCS2 encoding
     # and cost twice the money.
-    return render_to_string(template_path, ctx).strip().replace("\xa0", " ")
+    return template.render(ctx).strip().replace("\xa0", " ")
+
+
+def last_ping_text(check):
+    if check.last_ping:
+        # naturaltime uses non-breaking spaces, replace them like tmpl() does
+        return naturaltime(check.last_ping).replace("\xa0", " ")
+
+    return "Never"
+
+
+class TransientError(str):
+    """ An error message for a failure that may go away on its own.
+
+    Transports return it for timeouts, connection errors, and HTTP 429, 500,
+    502, 503 and 504 responses. Notification.send() schedules a retry for these.
+
+    """
 
 
 class Transport(object):
+    # Set to True in subclasses that implement notify_digest()
+    supports_digest = False
+
     def __init__(self, channel):
         self.channel = channel
 
@@ -58,11 +112,24 @@ class Transport(object):
 
         return False
 
+    def notify_digest(self, checks):
+        """ Send a single notification about several checks.
+
+        Each check has its status and status_url set. Like notify(), this
+        method returns None on success, and error message on error.
+
+        """
+
+        raise NotImplementedError()
+
     def checks(self):
         return self.channel.project.check_set.order_by("created")
 
 
+@register("email")
 class Email(Transport):
+    supports_digest = True
+
     def notify(self, check):
         if not self.channel.email_verified:
             return "Email not verified"
@@ -95,6 +162,20 @@ class Email(Transport):
 
         emails.alert(self.channel.email_value, ctx, headers)
 
+    def notify_digest(self, checks):
+        if not self.channel.email_verified:
+            return "Email not verified"
+
+        unsub_link = self.channel.get_unsub_link()
+        headers = {
+            "X-Status-Url": checks[0].status_url,
+            "List-Unsubscribe": f"<{unsub_link}>",
+            "List-Unsubscribe-Post": "List-Unsubscribe=One-Click",
+        }
+
+        ctx = {"checks": checks, "unsub_link": unsub_link}
+        emails.alert_digest(self.channel.email_value, ctx, headers)
+
     def is_noop(self, check):
         if check.status == "down":
             return not self.channel.email_notify_down
@@ -102,6 +183,7 @@ class Email(Transport):
             return not self.channel.email_notify_up
 
 
+@register("shell")
 class Shell(Transport):
     def prepare(self, template, check):
         """ Replace placeholders with actual values. """
@@ -158,18 +240,34 @@ class HttpTransport(Transport):
             if "User-Agent" not in options["headers"]:
                 options["headers"]["User-Agent"] = "healthchecks.io"
 
-            r = requests.request(method, url, **options)
+            with sendlimit.host_slot(url):
+                r = httppool.request(method, url, **options)
+
+            if r.status_code == 429:
+                # Make the next attempts wait as long as the server asks
+                sendlimit.host_backoff(url, r.headers.get("Retry-After"))
+
             if r.status_code not in (200, 201, 202, 204):
+                # The server may recover from these errors
+                wrap = str
+                if r.status_code in (429, 500, 502, 503, 504):
+                    wrap = TransientError
+
                 if m := cls.get_error(r):
-                    return f'Received status code {r.status_code} with a message: "{m}"'
+                    return wrap(
+                        f'Received status code {r.status_code} with a message: "{m}"'
+                    )
 
-                return f"Received status code {r.status_code}"
+                return wrap(f"Received status code {r.status_code}")
 
         except requests.exceptions.Timeout:
             # Well, we tried
-            return "Connection timed out"
+            return TransientError("Connection timed out")
         except requests.exceptions.ConnectionError:
-            return "Connection failed"
+            return TransientError("Connection failed")
+        except sendlimit.Throttled:
+            msg = "Timed out waiting to send, too many requests to this host"
+            return TransientError(msg)
 
     @classmethod
     def get(cls, url, num_tries=3, **kwargs):
@@ -199,6 +297,7 @@ class HttpTransport(Transport):
         return error
 
 
+@register("webhook")
 class Webhook(HttpTransport):
     def prepare(self, template, check, urlencode=False):
         """ Replace variables with actual values. """
@@ -252,7 +351,87 @@ class Webhook(HttpTransport):
             return self.put(url, num_tries=num_tries, data=body, headers=headers)
 
 
+@register("slack", "mattermost")
 class Slack(HttpTransport):
+    supports_digest = True
+
+    @staticmethod
+    def payload(check):
+        """ Return the message payload for a single check.
+
+        The payload is built directly, not rendered from a template, so
+        the values need no JSON escaping.
+
+        """
+
+        fields = []
+        if check.desc:
+            fields.append({"title": "Description", "value": check.desc})
+
+        if check.project.name:
+            fields.append(
+                {"title": "Project", "value": check.project.name, "short": True}
+            )
+
+        if tags := check.tags_list():
+            value = "".join(f"`{tag}` " for tag in tags)
+            fields.append({"title": "Tags", "value": value, "short": True})
+
+        if check.kind == "simple":
+            value = format_duration(check.timeout)
+            fields.append({"title": "Period", "value": value, "short": True})
+        elif check.kind == "cron":
+            value = fix_asterisks(check.schedule)
+            fields.append({"title": "Schedule", "value": value, "short": True})
+
+        fields.append(
+            {"title": "Last Ping", "value": last_ping_text(check), "short": True}
+        )
+        fields.append(
+            {"title": "Total Pings", "value": str(check.n_pings), "short": True}
+        )
+
+        name, status = check.name_then_code(), check.status.upper()
+        attachment = {
+            "color": "good" if check.status == "up" else "danger",
+            "fallback": f'The check "{name}" is {status}.',
+            "mrkdwn_in": ["fields"],
+            "text": f"“{name}” is {status}.",
+            "fields": fields,
+        }
+
+        return {
+            "username": settings.SITE_NAME,
+            "icon_url": f"{settings.SITE_ROOT}/static/img/logo@2x.png",
+            "attachments": [attachment],
+        }
+
+    @staticmethod
+    def digest_payload(checks):
+        """ Return the message payload for several checks. """
+
+        attachments = []
+        for check in checks[:50]:
+            name, status = check.name_then_code(), check.status.upper()
+            url = check.details_url()
+            attachments.append(
+                {
+                    "color": "good" if check.status == "up" else "danger",
+                    "fallback": f'The check "{name}" is {status}.',
+                    "text": f"<{url}|“{name}”> is {status}.",
+                }
+            )
+
+        if len(checks) > 50:
+            attachments.append({"text": f"And {len(checks) - 50} more."})
+
+        return {
+            "username": settings.SITE_NAME,
+            "icon_url": f"{settings.SITE_ROOT}/static/img/logo@2x.png",
+            "text": f"{len(checks)} checks have changed status.",
+            "attachments": attachments,
+        }
+
     def notify(self, check):
         if self.channel.kind == "slack" and not settings.SLACK_ENABLED:
             return "Slack notifications are not enabled."
@@ -260,16 +439,27 @@ class Slack(HttpTransport):
         if self.channel.kind == "mattermost" and not settings.MATTERMOST_ENABLED:
             return "Mattermost notifications are not enabled."
 
-        text = tmpl("slack_message.json", check=check)
-        payload = json.loads(text)
+        payload = self.payload(check)
+        return self.post(self.channel.slack_webhook_url, json=payload)
+
+    def notify_digest(self, checks):
+        if self.channel.kind == "slack" and not settings.SLACK_ENABLED:
+            return "Slack notifications are not enabled."
+
+        if self.channel.kind == "mattermost" and not settings.MATTERMOST_ENABLED:
+            return "Mattermost notifications are not enabled."
+
+        payload = self.digest_payload(checks)
         return self.post(self.channel.slack_webhook_url, json=payload)
 
 
+@register("hipchat")
 class HipChat(HttpTransport):
     def is_noop(self, check):
         return True
 
 
+@register("opsgenie")
 class Opsgenie(HttpTransport):
     @classmethod
     def get_error(cls, response):
@@ -306,6 +496,7 @@ class Opsgenie(HttpTransport):
         return self.post(url, json=payload, headers=headers)
 
 
+@register("pd")
 class PagerDuty(HttpTransport):
     URL = "https://events.pagerduty.com/generic/2010-04-15/create_event.json"
 
@@ -326,6 +517,7 @@ class PagerDuty(HttpTransport):
         return self.post(self.URL, json=payload)
 
 
+@register("pagertree")
 class PagerTree(HttpTransport):
     def notify(self, check):
         if not settings.PAGERTREE_ENABLED:
@@ -346,11 +538,13 @@ class PagerTree(HttpTransport):
         return self.post(url, json=payload, headers=headers)
 
 
+@register("pagerteam")
 class PagerTeam(HttpTransport):
     def is_noop(self, check):
         return True
 
 
+@register("pushbullet")
 class Pushbullet(HttpTransport):
     def notify(self, check):
         text = tmpl("pushbullet_message.html", check=check)
@@ -364,6 +558,7 @@ class Pushbullet(HttpTransport):
         return self.post(url, json=payload, headers=headers)
 
 
+@register("po")
 class Pushover(HttpTransport):
     URL = "https://api.pushover.net/1/messages.json"
 
@@ -403,6 +598,7 @@ class Pushover(HttpTransport):
         return self.post(self.URL, data=payload)
 
 
+@register("victorops")
 class VictorOps(HttpTransport):
     def notify(self, check):
         if not settings.VICTOROPS_ENABLED:
@@ -421,6 +617,7 @@ class VictorOps(HttpTransport):
         return self.post(self.channel.value, json=payload)
 
 
+@register("matrix")
 class Matrix(HttpTransport):
     def get_url(self):
         s = quote(self.channel.value)
@@ -443,14 +640,15 @@ class Matrix(HttpTransport):
         return self.post(self.get_url(), json=payload)
 
 
+@register("discord")
 class Discord(HttpTransport):
     def notify(self, check):
-        text = tmpl("slack_message.json", check=check)
-        payload = json.loads(text)
+        payload = Slack.payload(check)
         url = f"{self.channel.discord_webhook_url}/slack"
         return self.post(url, json=payload)
 
 
+@register("telegram")
 class Telegram(HttpTransport):
     SM = "https://api.telegram.org/bot%s/sendMessage" % settings.TELEGRAM_TOKEN
 
@@ -479,8 +677,10 @@ class Telegram(HttpTransport):
         return self.send(self.channel.telegram_id, text)
 
 
+@register("sms")
 class Sms(HttpTransport):
     URL = "https://api.twilio.com/2010-04-01/Accounts/%s/Messages.json"
+    supports_digest = True
 
     def is_noop(self, check):
         return check.status != "down"
@@ -504,7 +704,27 @@ class Sms(HttpTransport):
 
         return self.post(url, data=data, auth=auth)
 
+    def notify_digest(self, checks):
+        profile = Profile.objects.for_user(self.channel.project.owner)
+        if not profile.authorize_sms():
+            profile.send_sms_limit_notice("SMS")
+            return "Monthly SMS limit exceeded"
+
+        url = self.URL % settings.TWILIO_ACCOUNT
+        auth = (settings.TWILIO_ACCOUNT, settings.TWILIO_AUTH)
+        text = tmpl("sms_digest.html", checks=checks, site_name=settings.SITE_NAME)
+
+        data = {
+            "From": settings.TWILIO_FROM,
+            "To": self.channel.phone_number,
+            "Body": text,
+            "StatusCallback": checks[0].status_url,
+        }
+
+        return self.post(url, data=data, auth=auth)
+
 
+@register("call")
 class Call(HttpTransport):
     URL = "https://api.twilio.com/2010-04-01/Accounts/%s/Calls.json"
 
@@ -531,6 +751,7 @@ class Call(HttpTransport):
         return self.post(url, data=data, auth=auth)
 
 
+@register("whatsapp")
 class WhatsApp(HttpTransport):
     URL = "https://api.twilio.com/2010-04-01/Accounts/%s/Messages.json"
 
@@ -561,6 +782,7 @@ class WhatsApp(HttpTransport):
         return self.post(url, data=data, auth=auth)
 
 
+@register("trello")
 class Trello(HttpTransport):
     URL = "https://api.trello.com/1/cards"
 
@@ -579,6 +801,7 @@ class Trello(HttpTransport):
         return self.post(self.URL, params=params)
 
 
+@register("apprise")
 class Apprise(HttpTransport):
     def notify(self, check):
 
@@ -605,7 +828,45 @@ class Apprise(HttpTransport):
         )
 
 
+@register("msteams")
 class MsTeams(HttpTransport):
+    @staticmethod
+    def payload(check):
+        """ Return the MessageCard payload, without the check-specific text.
+
+        notify() fills in the summary, title and section text, which each
+        need their own escaping.
+
+        """
+
+        facts = []
+        if tags := check.tags_list():
+            value = "".join(f"`{tag}` " for tag in tags)
+            facts.append({"name": "Tags:", "value": value})
+
+        if check.kind == "simple":
+            facts.append({"name": "Period:", "value": format_duration(check.timeout)})
+        elif check.kind == "cron":
+            facts.append({"name": "Schedule:", "value": check.schedule})
+
+        facts.append({"name": "Last Ping:", "value": last_ping_text(check)})
+        facts.append({"name": "Total Pings:", "value": str(check.n_pings)})
+
+        colors = {"up": "5cb85c", "down": "d9534f"}
+        action = {
+            "@type": "OpenUri",
+            "name": f"View in {settings.SITE_NAME}",
+            "targets": [{"os": "default", "uri": check.details_url()}],
+        }
+
+        return {
+            "@type": "MessageCard",
+            "@context": "https://schema.org/extensions",
+            "themeColor": colors.get(check.status, ""),
+            "sections": [{"facts": facts}],
+            "potentialAction": [action],
+        }
+
     def escape_md(self, s):
         # Escape special HTML characters
         s = escape(s)
@@ -618,8 +879,7 @@ class MsTeams(HttpTransport):
         if not settings.MSTEAMS_ENABLED:
             return "MS Teams notifications are not enabled."
 
-        text = tmpl("msteams_message.json", check=check)
-        payload = json.loads(text)
+        payload = self.payload(check)
 
         # MS Teams escapes HTML special characters in the summary field.
         # It does not interpret summary content as Markdown.
@@ -641,6 +901,7 @@ class MsTeams(HttpTransport):
         return self.post(self.channel.value, json=payload)
 
 
+@register("zulip")
 class Zulip(HttpTransport):
     @classmethod
     def get_error(cls, response):
@@ -665,6 +926,7 @@ class Zulip(HttpTransport):
         return self.post(url, data=data, auth=auth)
 
 
+@register("spike")
 class Spike(HttpTransport):
     def notify(self, check):
         if not settings.SPIKE_ENABLED:
@@ -682,6 +944,7 @@ class Spike(HttpTransport):
         return self.post(url, json=payload, headers=headers)
 
 
+@register("linenotify")
 class LineNotify(HttpTransport):
     URL = "https://notify-api.line.me/api/notify"
 
@@ -695,6 +958,7 @@ class LineNotify(HttpTransport):
         return self.post(self.URL, headers=headers, params=payload)
 
 
+@register("signal")
 class Signal(Transport):
     def is_noop(self, check):
         if check.status == "down":
@@ -1,8 +1,9 @@
 from datetime import timedelta as td
 import time
+import uuid
 
 from django.conf import settings
-from django.db import connection
+from django.db import connection, transaction
 from django.http import (
     HttpResponse,
     HttpResponseForbidden,
@@ -17,21 +18,24 @@ from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 
 from hc.accounts.models import Profile
-from hc.api import schemas
+from hc.api import deadlines, pingcache, pinglimit, schemas
 from hc.api.decorators import authorize, authorize_read, cors, validate_json
 from hc.api.forms import FlipsFiltersForm
 from hc.api.models import MAX_DELTA, Flip, Channel, Check, Notification, Ping
 from hc.lib.badges import check_signature, get_badge_svg
+from hc.lib.string import decode_limited
+
+
+# Ping bodies are read from the request stream in chunks of this size
+BODY_CHUNK_SIZE = 8192
 
 
 class BadChannelException(Exception):
     pass
 
 
-@csrf_exempt
-@never_cache
-def ping(request, code, action="success", exitstatus=None):
-    check = get_object_or_404(Check, code=code)
+def _ping_meta(request):
+    """ Return remote address, scheme, method and User-Agent of a ping. """
 
     headers = request.META
     remote_addr = headers.get("HTTP_X_FORWARDED_FOR", headers["REMOTE_ADDR"])
@@ -39,21 +43,123 @@ def ping(request, code, action="success", exitstatus=None):
     scheme = headers.get("HTTP_X_FORWARDED_PROTO", "http")
     method = headers["REQUEST_METHOD"]
     ua = headers.get("HTTP_USER_AGENT", "")
-    body = request.body.decode()
+    return remote_addr, scheme, method, ua
+
+
+def process_ping(code, remote_addr, scheme, method, ua, body, action, exitstatus):
+    """ Look up the check by code and record the ping.
+
+    Return "OK" if the ping was recorded, "not found" if the check does not
+    exist, and "rate limited" if the check has received too many pings.
+
+    """
+
+    if not pinglimit.authorize(code):
+        return "rate limited"
+
+    check = pingcache.get_check(code)
+    if check is None:
+        return "not found"
 
     if exitstatus is not None and exitstatus > 0:
         action = "fail"
 
-    if check.methods == "POST" and method != "POST":
-        action = "ign"
+    args = (remote_addr, scheme, method, ua, body, action, exitstatus)
+    try:
+        check.ping(*args, suppressed=pinglimit.pop_suppressed(code))
+    except Check.DoesNotExist:
+        # The check has been deleted since we looked it up
+        pingcache.evict(code)
+        return "not found"
+
+    pingcache.store(check)
+    return "OK"
 
-    check.ping(remote_addr, scheme, method, ua, body, action, exitstatus)
 
-    response = HttpResponse("OK")
+@csrf_exempt
+@never_cache
+def ping(request, code, action="success", exitstatus=None):
+    remote_addr, scheme, method, ua = _ping_meta(request)
+    # Read only as much of the body as we are going to store
+    chunks = iter(lambda: request.read(BODY_CHUNK_SIZE), b"")
+    body = decode_limited(chunks, settings.PING_BODY_LIMIT)
+
+    result = process_ping(
+        code, remote_addr, scheme, method, ua, body, action, exitstatus
+    )
+    if result == "not found":
+        return HttpResponseNotFound("not found")
+
+    if result == "rate limited":
+        response = HttpResponse("rate limited", status=429)
+    else:
+        response = HttpResponse("OK")
+
     response["Access-Control-Allow-Origin"] = "*"
     return response
 
 
+@csrf_exempt
+@never_cache
+@cors("POST")
+@validate_json(schemas.pings)
+def ping_batch(request):
+    """ Process a list of pings in a single transaction.
+
+    Each item in the list has the check's code and, optionally, the action
+    ("success", "fail" or "start"), the exit status and the body. Return
+    a result for each item, in the same order.
+
+    """
+
+    remote_addr, scheme, method, ua = _ping_meta(request)
+
+    checks, results = {}, []
+    with transaction.atomic():
+        for item in request.json:
+            try:
+                code = uuid.UUID(item["code"])
+            except ValueError:
+                results.append({"code": item["code"], "result": "invalid uuid"})
+                continue
+
+            if not pinglimit.authorize(code):
+                results.append({"code": item["code"], "result": "rate limited"})
+                continue
+
+            if code not in checks:
+                checks[code] = pingcache.get_check(code)
+
+            check = checks[code]
+            if check is None:
+                results.append({"code": item["code"], "result": "not found"})
+                continue
+
+            action = item.get("action", "success")
+            exitstatus = item.get("exitstatus")
+            if exitstatus is not None and exitstatus > 0:
+                action = "fail"
+
+            body = item.get("body", "")
+            args = (remote_addr, scheme, method, ua, body, action, exitstatus)
+            try:
+                check.ping(*args, suppressed=pinglimit.pop_suppressed(code))
+            except Check.DoesNotExist:
+                # The check has been deleted since we looked it up
+                pingcache.evict(code)
+                checks[code] = None
+                results.append({"code": item["code"], "result": "not found"})
+                continue
+
+            results.append({"code": item["code"], "result": "OK"})
+
+    for check in checks.values():
+        if check:
+            pingcache.store(check)
+
+    return JsonResponse({"results": results})
+
+
 def _lookup(project, spec):
     if unique_fields := spec.get("unique", []):
         existing_checks = Check.objects.filter(project=project)
@@ -152,6 +258,7 @@ def _update(check, spec):
     if need_save:
         check.alert_after = check.going_down_after()
         check.save()
+        deadlines.notify(check)
 
     # This needs to be done after saving the check, because of
     # the M2M relation between checks and channels:
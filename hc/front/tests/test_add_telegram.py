@@ -52,7 +52,7 @@ class AddTelegramTestCase(BaseTestCase):
 
         self.assertFalse(Channel.objects.exists())
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_sends_invite(self, mock_get):
         data = {
             "message": {
@@ -67,7 +67,7 @@ class AddTelegramTestCase(BaseTestCase):
         self.assertEqual(r.status_code, 200)
         self.assertTrue(mock_get.called)
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_bot_handles_bad_message(self, mock_get):
         samples = [
             "",
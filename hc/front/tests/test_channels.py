@@ -1,4 +1,6 @@
+from datetime import timedelta as td
 import json
+from unittest.mock import patch
 
 from hc.api.models import Channel
 from hc.test import BaseTestCase
@@ -109,6 +111,22 @@ class ChannelsTestCase(BaseTestCase):
         r = self.client.get(self.channels_url)
         self.assertContains(r, "broken-channels", status_code=200)
 
+    def test_it_shows_failing_channel(self):
+        Channel.objects.create(kind="sms", project=self.project, failures=5)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get(self.channels_url)
+        self.assertContains(r, "Failing", status_code=200)
+        self.assertContains(r, "The last 5 notifications have failed.")
+
+    @patch("hc.api.models.PROBE_INTERVAL", td(minutes=10))
+    def test_failing_channel_shows_probe_interval(self):
+        Channel.objects.create(kind="sms", project=self.project, failures=5)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get(self.channels_url)
+        self.assertContains(r, "one notification every 10 minutes", status_code=200)
+
     def test_it_hides_actions_from_readonly_users(self):
         self.bobs_membership.rw = False
         self.bobs_membership.save()
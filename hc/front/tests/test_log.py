@@ -1,6 +1,6 @@
 import json
 
-from hc.api.models import Channel, Check, Notification, Ping
+from hc.api.models import Channel, Check, Notification, Ping, PingBody
 from hc.test import BaseTestCase
 
 
@@ -24,6 +24,14 @@ class LogTestCase(BaseTestCase):
         r = self.client.get(self.url)
         self.assertContains(r, "Browser's time zone", status_code=200)
 
+    def test_it_shows_compressed_body(self):
+        body_blob = PingBody.for_text("this is body")
+        Ping.objects.create(owner=self.check, n=2, body_blob=body_blob)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get(self.url)
+        self.assertContains(r, "this is body", status_code=200)
+
     def test_team_access_works(self):
 
         # Logging in as bob, not alice. Bob has team access so this
@@ -1,4 +1,4 @@
-from hc.api.models import Check, Ping
+from hc.api.models import Check, Ping, PingBody
 from hc.test import BaseTestCase
 
 
@@ -15,6 +15,14 @@ class PingDetailsTestCase(BaseTestCase):
         r = self.client.get(self.url)
         self.assertContains(r, "this is body", status_code=200)
 
+    def test_it_shows_compressed_body(self):
+        body_blob = PingBody.for_text("this is body")
+        Ping.objects.create(owner=self.check, body_blob=body_blob)
+
+        self.client.login(username="alice@example.org", password="password")
+        r = self.client.get(self.url)
+        self.assertContains(r, "this is body", status_code=200)
+
     def test_it_requires_logged_in_user(self):
         Ping.objects.create(owner=self.check, body="this is body")
 
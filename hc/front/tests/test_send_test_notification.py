@@ -59,7 +59,7 @@ class SendTestNotificationTestCase(BaseTestCase):
         self.channel.refresh_from_db()
         self.assertEqual(self.channel.last_error, "Email not verified")
 
-    @patch("hc.api.transports.requests.request")
+    @patch("hc.api.transports.httppool.request")
     def test_it_handles_webhooks_with_no_down_url(self, mock_get):
         mock_get.return_value.status_code = 200
 
@@ -27,6 +27,7 @@ from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from hc.accounts.models import Project, Member
+from hc.api import deadlines
 from hc.api.models import (
     DEFAULT_GRACE,
     DEFAULT_TIMEOUT,
@@ -448,6 +449,7 @@ def update_timeout(request, code):
         check.status = "down"
 
     check.save()
+    deadlines.notify(check)
 
     if "/details/" in request.META.get("HTTP_REFERER", ""):
         return redirect("hc-details", code)
@@ -549,7 +551,8 @@ def remove_check(request, code):
 
 
 def _get_events(check, limit):
-    pings = Ping.objects.filter(owner=check).order_by("-id")[:limit]
+    pings = Ping.objects.filter(owner=check).select_related("body_blob")
+    pings = pings.order_by("-id")[:limit]
     pings = list(pings)
 
     prev = None
@@ -4,6 +4,13 @@ from threading import Thread
 from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string as render
+from hc.lib import mailpool
+
+
+def make_message(subject, text, html, to, headers):
+    msg = EmailMultiAlternatives(subject, text, to=(to,), headers=headers)
+    msg.attach_alternative(html, "text/html")
+    return msg
 
 
 class EmailThread(Thread):
@@ -20,11 +27,9 @@ class EmailThread(Thread):
     def run(self):
         for attempt in range(self.MAX_TRIES):
             try:
-                msg = EmailMultiAlternatives(
-                    self.subject, self.text, to=(self.to,), headers=self.headers
+                msg = make_message(
+                    self.subject, self.text, self.html, self.to, self.headers
                 )
-
-                msg.attach_alternative(self.html, "text/html")
                 msg.send()
             except smtplib.SMTPServerDisconnected as e:
                 if attempt + 1 == self.MAX_TRIES:
@@ -48,6 +53,10 @@ def send(name, to, ctx, headers={}):
         # In tests, we send emails synchronously
         # so we can inspect the outgoing messages
         t.run()
+    elif settings.EMAIL_POOL_ENABLED:
+        # Hand the message over to the long-lived sender threads,
+        # they reuse SMTP connections
+        mailpool.send(make_message(subject, text, html, to, headers))
     else:
         # Outside tests, we send emails on thread,
         # so there is no delay for the user.
@@ -66,6 +75,10 @@ def alert(to, ctx, headers={}):
     send("alert", to, ctx, headers)
 
 
+def alert_digest(to, ctx, headers={}):
+    send("alert-digest", to, ctx, headers)
+
+
 def verify_email(to, ctx):
     send("verify-email", to, ctx)
 
@@ -0,0 +1,105 @@
+""" Connection-pooled HTTP requests for the integrations.
+
+request() works like requests.request(), but reuses keep-alive connections:
+all threads share a single HTTPAdapter, which keeps a pool of up to
+HTTP_POOL_MAXSIZE idle connections for each of the HTTP_POOL_HOSTS most
+recently used hosts. Each thread gets its own requests.Session mounted on the
+shared adapter, so threads don't share any session state. The sessions don't
+store cookies, so responses from one integration cannot affect requests sent
+for another.
+
+The number of requests and the number of newly opened connections are
+reported to StatsD (hc.http.requests, hc.http.newConnections) and are
+available from stats(). The difference is the number of reused connections.
+
+Set HTTP_POOL_ENABLED=False to open a new connection for every request.
+
+"""
+
+from http.cookiejar import DefaultCookiePolicy
+import threading
+
+from django.conf import settings
+import requests
+from requests.adapters import HTTPAdapter
+from statsd.defaults.env import statsd
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+_stats = {"requests": 0, "connections": 0}
+_lock = threading.Lock()
+_adapter = None
+_local = threading.local()
+
+
+def _count(key):
+    with _lock:
+        _stats[key] += 1
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    def _new_conn(self):
+        _count("connections")
+        statsd.incr("hc.http.newConnections")
+        return super()._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    def _new_conn(self):
+        _count("connections")
+        statsd.incr("hc.http.newConnections")
+        return super()._new_conn()
+
+
+class PoolingAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+def get_adapter():
+    global _adapter
+
+    with _lock:
+        if _adapter is None:
+            _adapter = PoolingAdapter(
+                pool_connections=settings.HTTP_POOL_HOSTS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            )
+
+    return _adapter
+
+
+def get_session():
+    """ Return this thread's session. """
+
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        # Don't store any cookies
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = get_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+
+    return session
+
+
+def request(method, url, **kwargs):
+    _count("requests")
+    statsd.incr("hc.http.requests")
+
+    if not settings.HTTP_POOL_ENABLED:
+        return requests.request(method, url, **kwargs)
+
+    return get_session().request(method, url, **kwargs)
+
+
+def stats():
+    """ Return the number of requests and newly opened connections. """
+
+    with _lock:
+        return dict(_stats)
@@ -50,6 +50,8 @@ def validate(obj, schema, obj_name="value"):
     elif schema.get("type") == "array":
         if not isinstance(obj, list):
             raise ValidationError(f"{obj_name} is not an array")
+        if "maxItems" in schema and len(obj) > schema["maxItems"]:
+            raise ValidationError(f"{obj_name} has too many items")
 
         for v in obj:
             validate(v, schema["items"], "an item in '%s'" % obj_name)
@@ -0,0 +1,182 @@
+""" A long-lived, bounded sender for outgoing emails.
+
+When settings.EMAIL_POOL_ENABLED is set, hc.lib.emails.send() does not start
+a thread and open an SMTP connection for every message. Instead, it puts the
+message in a per-process queue, and EMAIL_POOL_SIZE sender threads deliver the
+queued messages. Each sender thread keeps its SMTP connection open and sends
+up to EMAIL_POOL_BATCH_SIZE messages over it before reconnecting. Connections
+that have been idle for IDLE_TIMEOUT seconds are closed.
+
+The queue holds at most EMAIL_POOL_CAPACITY messages. When it is full,
+send() blocks until a sender thread takes a message off the queue.
+
+The number of sent messages, newly opened connections and failed messages
+are reported to StatsD (hc.email.sent, hc.email.newConnections,
+hc.email.failures) and are available from stats().
+
+Durability: queued messages are sent on a normal shutdown, and are lost if
+the process crashes.
+
+"""
+
+import atexit
+import queue
+import smtplib
+import threading
+import traceback
+
+from django.conf import settings
+from django.core.mail import get_connection
+from statsd.defaults.env import statsd
+
+IDLE_TIMEOUT = 10
+MAX_TRIES = 3
+
+_stats = {"sent": 0, "connections": 0, "failures": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except (OSError, smtplib.SMTPException):
+        # The connection is unusable either way
+        pass
+
+
+class MailPool(object):
+    def __init__(self, size, capacity, batch_size):
+        self.size = size
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=capacity)
+        self.threads = []
+
+    def start(self):
+        for i in range(self.size):
+            t = threading.Thread(target=self.run, daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def put(self, message):
+        # Backpressure: blocks while the queue is full
+        self.queue.put(message)
+        statsd.gauge("hc.email.depth", self.queue.qsize())
+
+    def wait(self):
+        """ Block until all queued messages have been handled. """
+
+        self.queue.join()
+
+    def deliver(self, connection, message):
+        """ Send the message, open a new connection if needed.
+
+        Return the connection to use for the next message, or None if the
+        connection got closed.
+
+        """
+
+        for attempt in range(MAX_TRIES):
+            try:
+                if connection is None:
+                    connection = get_connection()
+                    connection.open()
+                    _count("connections")
+                    statsd.incr("hc.email.newConnections")
+
+                connection.send_messages([message])
+            except smtplib.SMTPServerDisconnected:
+                # The server may have dropped an idle connection,
+                # reconnect and try again
+                _close(connection)
+                connection = None
+            except Exception:
+                traceback.print_exc()
+                if connection:
+                    _close(connection)
+                    connection = None
+                break
+            else:
+                _count("sent")
+                statsd.incr("hc.email.sent")
+                return connection
+
+        _count("failures")
+        statsd.incr("hc.email.failures")
+        return None
+
+    def run(self):
+        connection, num_sent = None, 0
+        while True:
+            try:
+                timeout = IDLE_TIMEOUT if connection else None
+                message = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                _close(connection)
+                connection = None
+                continue
+
+            if connection and num_sent >= self.batch_size:
+                _close(connection)
+                connection = None
+
+            if message is None:
+                # The pool is closing
+                if connection:
+                    _close(connection)
+                self.queue.task_done()
+                return
+
+            if connection is None:
+                num_sent = 0
+
+            connection = self.deliver(connection, message)
+            num_sent += 1
+            self.queue.task_done()
+
+    def close(self):
+        """ Send the remaining messages and stop the sender threads. """
+
+        for t in self.threads:
+            self.queue.put(None)
+
+        for t in self.threads:
+            t.join()
+
+        self.threads = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = MailPool(
+                size=settings.EMAIL_POOL_SIZE,
+                capacity=settings.EMAIL_POOL_CAPACITY,
+                batch_size=settings.EMAIL_POOL_BATCH_SIZE,
+            )
+            _pool.start()
+            # Send the queued messages on worker shutdown
+            atexit.register(_pool.close)
+
+    return _pool
+
+
+def send(message):
+    get_pool().put(message)
+
+
+def stats():
+    """ Return the number of sent messages, new connections and failures. """
+
+    with _stats_lock:
+        return dict(_stats)
@@ -1,3 +1,6 @@
+import codecs
+
+
 def replace(template, ctx):
     """Replace placeholders with their values and return the result.
 
@@ -36,3 +39,25 @@ def replace(template, ctx):
         result.append(part)
 
     return "".join(result)
+
+
+def decode_limited(chunks, limit):
+    """Decode UTF-8 byte chunks, stop once `limit` characters are decoded.
+
+    `chunks` can be any iterable of bytes, it is consumed lazily.
+    Return the decoded text truncated to `limit` characters. If `limit`
+    is None, decode everything. Raise UnicodeDecodeError if the decoded
+    part is not valid UTF-8.
+
+    """
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    parts, size = [], 0
+    for chunk in chunks:
+        parts.append(decoder.decode(chunk))
+        size += len(parts[-1])
+        if limit is not None and size >= limit:
+            return "".join(parts)[:limit]
+
+    parts.append(decoder.decode(b"", final=True))
+    return "".join(parts)
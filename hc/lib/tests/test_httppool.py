@@ -0,0 +1,64 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from hc.lib import httppool
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.send_header("Set-Cookie", "session=secret")
+        self.end_headers()
+        self.wfile.write(b"OK")
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpPoolTestCase(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        args = {"poll_interval": 0.01}
+        Thread(target=self.server.serve_forever, kwargs=args, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        super().tearDown()
+
+    def test_it_reuses_connections(self):
+        before = httppool.stats()
+        for i in range(5):
+            r = httppool.request("get", self.url, timeout=5)
+            self.assertEqual(r.text, "OK")
+
+        after = httppool.stats()
+        self.assertEqual(after["requests"] - before["requests"], 5)
+        self.assertEqual(after["connections"] - before["connections"], 1)
+
+    def test_it_does_not_store_cookies(self):
+        httppool.request("get", self.url, timeout=5)
+        self.assertEqual(len(httppool.get_session().cookies), 0)
+
+    def test_threads_get_separate_sessions(self):
+        sessions = []
+        t = Thread(target=lambda: sessions.append(httppool.get_session()))
+        t.start()
+        t.join()
+
+        self.assertIsNot(sessions[0], httppool.get_session())
+        self.assertIs(sessions[0].get_adapter(self.url), httppool.get_adapter())
+
+    @override_settings(HTTP_POOL_ENABLED=False)
+    @patch("hc.lib.httppool.requests.request")
+    def test_it_can_be_disabled(self, mock_request):
+        httppool.request("get", self.url, timeout=5)
+        mock_request.assert_called_once_with("get", self.url, timeout=5)
@@ -66,6 +66,10 @@ class JsonSchemaTestCase(TestCase):
         with self.assertRaises(ValidationError):
             validate(["foo", "bar"], {"type": "array", "items": {"type": "number"}})
 
+    def test_it_checks_array_max_items(self):
+        with self.assertRaises(ValidationError):
+            validate(["foo", "bar"], {"type": "array", "maxItems": 1, "items": {}})
+
     def test_it_validates_enum(self):
         validate("foo", {"enum": ["foo", "bar"]})
 
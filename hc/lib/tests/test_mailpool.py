@@ -0,0 +1,127 @@
+import socketserver
+import threading
+from unittest.mock import patch
+
+from django.conf import settings
+from django.core import mail
+from django.test import TestCase
+from django.test.utils import override_settings
+from hc.lib import emails, mailpool
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """ Accept SMTP messages and store them in server.messages. """
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost")
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b"DATA":
+                self.reply("354 go ahead")
+                data = b"".join(iter(self.rfile.readline, b".\r\n"))
+                self.server.messages.append(data)
+                self.reply("250 OK")
+                if self.server.drop:
+                    return
+            elif command == b"QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+
+    def __init__(self, drop=False):
+        super().__init__(("127.0.0.1", 0), SinkHandler)
+        self.drop = drop
+        self.connections = 0
+        self.messages = []
+
+
+class MailPoolTestCase(TestCase):
+    def _message(self, i=0):
+        return emails.make_message("Hi", "text", "<b>html</b>", f"{i}@example.org", {})
+
+    def _sink(self, drop=False):
+        sink = SinkServer(drop=drop)
+        threading.Thread(target=sink.serve_forever, daemon=True).start()
+        self.addCleanup(sink.server_close)
+        self.addCleanup(sink.shutdown)
+        return sink
+
+    def _pool(self, sink, size=1, batch_size=100):
+        pool = mailpool.MailPool(size=size, capacity=100, batch_size=batch_size)
+        smtp = {
+            "EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+            "EMAIL_HOST": "127.0.0.1",
+            "EMAIL_PORT": sink.server_address[1],
+            "EMAIL_USE_TLS": False,
+        }
+
+        with override_settings(**smtp):
+            pool.start()
+            for i in range(5):
+                pool.put(self._message(i))
+            pool.close()
+
+        return pool
+
+    def test_it_reuses_the_connection(self):
+        sink = self._sink()
+        self._pool(sink)
+
+        self.assertEqual(len(sink.messages), 5)
+        self.assertEqual(sink.connections, 1)
+
+    def test_it_reconnects_after_batch_size_messages(self):
+        sink = self._sink()
+        self._pool(sink, batch_size=2)
+
+        self.assertEqual(len(sink.messages), 5)
+        self.assertEqual(sink.connections, 3)
+
+    def test_it_reconnects_when_server_disconnects(self):
+        sink = self._sink(drop=True)
+        self._pool(sink)
+
+        self.assertEqual(len(sink.messages), 5)
+        self.assertEqual(sink.connections, 5)
+
+    @patch("hc.lib.mailpool.traceback")
+    def test_it_survives_connection_errors(self, mock_traceback):
+        sink = self._sink()
+        sink.server_close()
+
+        before = mailpool.stats()["failures"]
+        self._pool(sink)
+
+        self.assertEqual(mailpool.stats()["failures"], before + 5)
+        self.assertEqual(mock_traceback.print_exc.call_count, 5)
+
+    def test_it_applies_backpressure(self):
+        pool = mailpool.MailPool(size=1, capacity=2, batch_size=100)
+        pool.put(self._message())
+        pool.put(self._message())
+        self.assertTrue(pool.queue.full())
+
+        # Once the sender threads start, the queue drains
+        pool.start()
+        pool.wait()
+        self.assertEqual(len(mail.outbox), 2)
+        pool.close()
+
+    @override_settings(EMAIL_POOL_ENABLED=True)
+    @patch("hc.lib.emails.mailpool.send")
+    def test_emails_use_the_pool(self, mock_send):
+        del settings.BLOCKING_EMAILS
+        emails.login("alice@example.org", {"button_url": "http://example.org"})
+
+        message = mock_send.call_args[0][0]
+        self.assertEqual(message.to, ["alice@example.org"])
+        self.assertEqual(message.alternatives[0][1], "text/html")
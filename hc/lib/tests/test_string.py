@@ -1,6 +1,6 @@
 from django.test import TestCase
 
-from hc.lib.string import replace
+from hc.lib.string import decode_limited, replace
 
 
 class StringTestCase(TestCase):
@@ -19,3 +19,32 @@ class StringTestCase(TestCase):
     def test_it_preserves_non_placeholder_dollar_signs(self):
         result = replace("$3.50", {"$A": "text"})
         self.assertEqual(result, "$3.50")
+
+    def test_decode_limited_works(self):
+        result = decode_limited([b"hello ", b"world"], 100)
+        self.assertEqual(result, "hello world")
+
+    def test_decode_limited_truncates(self):
+        result = decode_limited([b"hello ", b"world"], 5)
+        self.assertEqual(result, "hello")
+
+    def test_decode_limited_stops_reading_at_limit(self):
+        def chunks():
+            yield b"hello"
+            raise AssertionError("Should not read past the limit")
+
+        self.assertEqual(decode_limited(chunks(), 3), "hel")
+
+    def test_decode_limited_handles_split_characters(self):
+        data = "žluťoučký".encode()
+        result = decode_limited([data[:1], data[1:4], data[4:]], None)
+        self.assertEqual(result, "žluťoučký")
+
+    def test_decode_limited_ignores_cut_character_past_limit(self):
+        # The limit is reached before the incomplete trailing character
+        result = decode_limited(["abcž".encode()[:-1]], 3)
+        self.assertEqual(result, "abc")
+
+    def test_decode_limited_rejects_invalid_utf8(self):
+        with self.assertRaises(UnicodeDecodeError):
+            decode_limited([b"abc\xc5"], None)
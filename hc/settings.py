@@ -156,6 +156,19 @@ MASTER_BADGE_LABEL = os.getenv("MASTER_BADGE_LABEL", SITE_NAME)
 PING_ENDPOINT = os.getenv("PING_ENDPOINT", f"{SITE_ROOT}/ping/")
 PING_EMAIL_DOMAIN = os.getenv("PING_EMAIL_DOMAIN", "localhost")
 PING_BODY_LIMIT = envint("PING_BODY_LIMIT", "10000")
+PING_BODY_COMPRESSION = envbool("PING_BODY_COMPRESSION", "False")
+PING_LOG_RING_BUFFER = envbool("PING_LOG_RING_BUFFER", "False")
+# Write-behind buffer for ping log entries, see hc/api/pingbuffer.py
+PING_BUFFER_ENABLED = envbool("PING_BUFFER_ENABLED", "False")
+PING_BUFFER_BATCH_SIZE = envint("PING_BUFFER_BATCH_SIZE", "500")
+PING_BUFFER_FLUSH_INTERVAL = envint("PING_BUFFER_FLUSH_INTERVAL", "200")
+PING_BUFFER_CAPACITY = envint("PING_BUFFER_CAPACITY", "5000")
+PING_BUFFER_SPOOL_DIR = os.getenv("PING_BUFFER_SPOOL_DIR")
+# In-process cache of checks for the ping endpoint, see hc/api/pingcache.py
+PING_CACHE_SIZE = envint("PING_CACHE_SIZE", "0")
+PING_CACHE_TTL = envint("PING_CACHE_TTL", "60")
+# Per-check ping rate limit, see hc/api/pinglimit.py
+PING_RATE_LIMIT = envint("PING_RATE_LIMIT", "0")
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
 STATIC_ROOT = os.path.join(BASE_DIR, "static-collected")
@@ -174,6 +187,20 @@ EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 EMAIL_USE_TLS = envbool("EMAIL_USE_TLS", "True")
 EMAIL_USE_VERIFICATION = envbool("EMAIL_USE_VERIFICATION", "True")
+# Long-lived SMTP senders with connection reuse, see hc/lib/mailpool.py
+EMAIL_POOL_ENABLED = envbool("EMAIL_POOL_ENABLED", "True")
+EMAIL_POOL_SIZE = envint("EMAIL_POOL_SIZE", "2")
+EMAIL_POOL_CAPACITY = envint("EMAIL_POOL_CAPACITY", "1000")
+EMAIL_POOL_BATCH_SIZE = envint("EMAIL_POOL_BATCH_SIZE", "100")
+
+# Outgoing HTTP connection pooling for integrations, see hc/lib/httppool.py
+HTTP_POOL_ENABLED = envbool("HTTP_POOL_ENABLED", "True")
+HTTP_POOL_HOSTS = envint("HTTP_POOL_HOSTS", "100")
+HTTP_POOL_MAXSIZE = envint("HTTP_POOL_MAXSIZE", "10")
+# Limits for outgoing requests to a single host, see hc/api/sendlimit.py
+HTTP_HOST_CONCURRENCY = envint("HTTP_HOST_CONCURRENCY", "10")
+HTTP_HOST_RATE = envint("HTTP_HOST_RATE", "0")
+HTTP_QUEUE_TIMEOUT = envint("HTTP_QUEUE_TIMEOUT", "30")
 
 # WebAuthn
 RP_ID = os.getenv("RP_ID")